@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сводные суммы по лицевым счетам, домам и в целом
+
+Индекс (лицевой счет, период) -> квитанция и накопительные итоги обновляются
+при добавлении каждой квитанции, поэтому сводки не требуют повторного прохода
+по всем данным. Повторная квитанция того же счета за тот же период заменяет
+предыдущую: её суммы вычитаются из итогов. Квитанции без лицевого счета или
+периода ничего не заменяют - каждая учитывается отдельно (в группе «Н/Д»).
+"""
+
+import re
+import pandas as pd
+from typing import Dict, Optional, Tuple
+
+from epd_parser import period_key
+
+
+NO_VALUE = 'Н/Д'
+
+# Номер квартиры/помещения в конце адреса - отрезается, чтобы получить дом
+APARTMENT_RE = re.compile(r'[,\s]+(?:кв|квартира|пом|помещение|комн|комната)\b\.?\s*[\w/-]+.*$', re.IGNORECASE)
+
+TOTAL_FIELDS = ('housing', 'utility', 'insurance', 'total', 'bills')
+
+
+def building_of(address: Optional[str]) -> str:
+    """Адрес дома - адрес квитанции без номера квартиры"""
+    if not address:
+        return NO_VALUE
+    return APARTMENT_RE.sub('', address).strip(' ,') or NO_VALUE
+
+
+def bill_totals(epd_data: Dict) -> Dict[str, float]:
+    """Суммы одной квитанции по категориям"""
+    housing = sum(service['итого'] for service in epd_data.get('жилищные_услуги', []))
+    utility = sum(service['итого'] for service in epd_data.get('коммунальные_услуги', []))
+    insurance = epd_data.get('страхование') or 0.0
+    return {
+        'housing': housing,
+        'utility': utility,
+        'insurance': insurance,
+        'total': housing + utility + insurance,
+        'bills': 1,
+    }
+
+
+def _empty_totals() -> Dict[str, float]:
+    return dict.fromkeys(TOTAL_FIELDS, 0)
+
+
+class AccountRollups:
+    """Инкрементальные сводки по лицевым счетам, домам и в целом"""
+
+    def __init__(self):
+        # (лицевой счет, период) -> (квитанция, её суммы, дом)
+        self.index = {}
+        # лицевой счет -> {период: суммы}
+        self.by_account_period = {}
+        self.by_account = {}
+        self.by_building = {}
+        self.overall = _empty_totals()
+
+    def _apply(self, account: str, period: str, building: str, totals: Dict[str, float], sign: int):
+        """Прибавляет (sign=1) или вычитает (sign=-1) суммы квитанции из всех итогов"""
+        targets = (
+            self.by_account_period.setdefault(account, {}).setdefault(period, _empty_totals()),
+            self.by_account.setdefault(account, _empty_totals()),
+            self.by_building.setdefault(building, _empty_totals()),
+            self.overall,
+        )
+        for target in targets:
+            for field in TOTAL_FIELDS:
+                target[field] += sign * totals[field]
+
+    def add(self, epd_data: Dict) -> Optional[Dict]:
+        """
+        Добавляет квитанцию; возвращает замененную квитанцию того же счета и периода, если была.
+        Квитанция без счета или периода только прибавляется к итогам - ключа для замены у нее нет
+        """
+        account = epd_data.get('лицевой_счет') or NO_VALUE
+        period = epd_data.get('период') or NO_VALUE
+        totals = bill_totals(epd_data)
+        building = building_of(epd_data.get('адрес'))
+
+        if account == NO_VALUE or period == NO_VALUE:
+            self._apply(account, period, building, totals, 1)
+            return None
+
+        key = (account, period)
+        replaced = self.index.get(key)
+        if replaced is not None:
+            old_data, old_totals, old_building = replaced
+            self._apply(account, period, old_building, old_totals, -1)
+
+        self.index[key] = (epd_data, totals, building)
+        self._apply(account, period, building, totals, 1)
+
+        return replaced[0] if replaced is not None else None
+
+    def get(self, account: str, period: str) -> Optional[Dict]:
+        """Квитанция счета за период (по индексу, без перебора)"""
+        entry = self.index.get((account, period))
+        return entry[0] if entry is not None else None
+
+    def account_totals(self, account: str) -> Dict[str, float]:
+        """Итоги по лицевому счету"""
+        return dict(self.by_account.get(account, _empty_totals()))
+
+    def building_totals(self, building: str) -> Dict[str, float]:
+        """Итоги по дому"""
+        return dict(self.by_building.get(building, _empty_totals()))
+
+    def period_breakdown(self) -> Dict[Tuple[str, str], Dict[str, float]]:
+        """Итоги по (лицевой счет, период), периоды каждого счета по порядку"""
+        breakdown = {}
+        for account in sorted(self.by_account_period):
+            periods = self.by_account_period[account]
+            for period in sorted(periods, key=lambda p: (period_key(p) or 0, p)):
+                breakdown[(account, period)] = dict(periods[period])
+        return breakdown
+
+    def _dataframe(self, totals: Dict[str, Dict[str, float]], label: str) -> pd.DataFrame:
+        rows = []
+        for key in sorted(totals):
+            sums = totals[key]
+            if not sums['bills']:
+                # Все квитанции группы были заменены квитанциями с другим адресом
+                continue
+            rows.append({
+                label: key,
+                'Квитанций': sums['bills'],
+                'Жилищные услуги': sums['housing'],
+                'Коммунальные услуги': sums['utility'],
+                'Страхование': sums['insurance'],
+                'Итого': sums['total'],
+            })
+        return pd.DataFrame(rows)
+
+    def accounts_dataframe(self) -> pd.DataFrame:
+        """Таблица итогов по лицевым счетам"""
+        return self._dataframe(self.by_account, 'Лицевой счет')
+
+    def buildings_dataframe(self) -> pd.DataFrame:
+        """Таблица итогов по домам"""
+        return self._dataframe(self.by_building, 'Дом')
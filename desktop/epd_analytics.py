@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Аналитика по услугам ЕПД - динамика тарифов и объемов потребления
+
+Все расчеты векторные (pandas/NumPy): изменения тарифа месяц к месяцу и год
+к году, тренд объема и месяцы-выбросы считаются за один проход сразу по всем
+лицевым счетам и услугам.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterable, List, Tuple
+
+from epd_parser import period_key
+from epd_services import ServiceDictionary
+
+
+# Категории услуг: ключ в данных парсера -> подпись в таблицах
+CATEGORY_LABELS = {
+    'жилищные_услуги': 'Жилищные',
+    'коммунальные_услуги': 'Коммунальные',
+}
+
+# Строк на листе Excel (вместе со строкой заголовка)
+EXCEL_MAX_ROWS = 1048576
+
+SERVICE_COLUMNS = [
+    'account', 'period', 'period_key', 'category', 'service_id', 'volume', 'unit', 'tariff', 'total'
+]
+
+
+def services_frame(bills: Iterable[Dict], services: ServiceDictionary = None) -> pd.DataFrame:
+    """
+    Длинная таблица строк начислений по всем квитанциям (одна строка - одна услуга).
+    Услуги представлены id из справочника, название - категориальная колонка service
+    """
+    services = ServiceDictionary() if services is None else services
+    rows = []
+    for epd in bills:
+        period = epd.get('период')
+        key = period_key(period)
+        account = epd.get('лицевой_счет')
+        for category, label in CATEGORY_LABELS.items():
+            for service in epd.get(category, []):
+                rows.append((
+                    account, period, key, label, services.service_id(service['название']),
+                    service['объем'], service['ед_изм'], service['тариф'], service['итого']
+                ))
+
+    frame = pd.DataFrame(rows, columns=SERVICE_COLUMNS)
+    frame['service_id'] = frame['service_id'].astype('int32')
+    frame['service'] = pd.Categorical.from_codes(frame['service_id'], categories=services.names)
+    return frame
+
+
+def _monthly(frame: pd.DataFrame) -> pd.DataFrame:
+    """Сворачивает строки до (счет, услуга, месяц): тариф - средний, объем и сумма - суммарные"""
+    frame = frame.dropna(subset=['period_key'])
+    frame = frame.assign(
+        account=frame['account'].fillna('Н/Д'),
+        month_index=(frame['period_key'] // 100) * 12 + frame['period_key'] % 100 - 1
+    )
+    return (
+        frame.groupby(['account', 'service_id', 'month_index'], sort=True)
+        .agg(service=('service', 'first'), period=('period', 'first'), tariff=('tariff', 'mean'),
+             volume=('volume', 'sum'), total=('total', 'sum'))
+        .reset_index()
+    )
+
+
+def _shifted(monthly: pd.DataFrame, months: int) -> pd.DataFrame:
+    """Значения того же счета и услуги, сдвинутые на months месяцев вперед"""
+    shifted = monthly[['account', 'service_id', 'month_index', 'tariff', 'volume']].copy()
+    shifted['month_index'] += months
+    return shifted
+
+
+def service_trends(frame: pd.DataFrame, z_threshold: float = 3.0) -> pd.DataFrame:
+    """
+    Помесячная динамика по каждой паре (лицевой счет, услуга):
+    изменения тарифа м/м и г/г, изменение объема м/м, z-оценка суммы и признак выброса
+    """
+    if frame.empty:
+        return pd.DataFrame()
+
+    monthly = _monthly(frame)
+
+    # Предыдущий месяц и тот же месяц прошлого года ищем по календарю, а не по позиции,
+    # чтобы пропущенные квитанции не сдвигали сравнение
+    result = monthly.merge(
+        _shifted(monthly, 1), on=['account', 'service_id', 'month_index'], how='left', suffixes=('', '_prev')
+    ).merge(
+        _shifted(monthly, 12), on=['account', 'service_id', 'month_index'], how='left', suffixes=('', '_year')
+    )
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['tariff_mom'] = result['tariff'] / result['tariff_prev'] - 1
+        result['tariff_yoy'] = result['tariff'] / result['tariff_year'] - 1
+        result['volume_mom'] = result['volume'] / result['volume_prev'] - 1
+    result[['tariff_mom', 'tariff_yoy', 'volume_mom']] = (
+        result[['tariff_mom', 'tariff_yoy', 'volume_mom']].replace([np.inf, -np.inf], np.nan)
+    )
+
+    groups = result.groupby(['account', 'service_id'])['total']
+    std = groups.transform('std', ddof=0)
+    result['z_score'] = ((result['total'] - groups.transform('mean')) / std.where(std > 0)).fillna(0.0)
+    result['outlier'] = result['z_score'].abs() >= z_threshold
+
+    return result
+
+
+def consumption_trends(frame: pd.DataFrame) -> pd.DataFrame:
+    """Линейный тренд объема (наклон МНК в единицах в месяц) по каждой паре (счет, услуга)"""
+    if frame.empty:
+        return pd.DataFrame()
+
+    monthly = _monthly(frame)
+    x = monthly['month_index'].astype(float)
+    y = monthly['volume'].astype(float)
+    sums = (
+        monthly.assign(x=x, y=y, xy=x * y, xx=x * x)
+        .groupby(['account', 'service_id'])
+        .agg(service=('service', 'first'), n=('x', 'size'), sx=('x', 'sum'), sy=('y', 'sum'), sxy=('xy', 'sum'), sxx=('xx', 'sum'),
+             mean_volume=('y', 'mean'))
+        .reset_index()
+    )
+    denominator = sums['n'] * sums['sxx'] - sums['sx'] ** 2
+    numerator = sums['n'] * sums['sxy'] - sums['sx'] * sums['sy']
+    sums['slope'] = (numerator / denominator.where(denominator != 0)).fillna(0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sums['slope_pct'] = (sums['slope'] / sums['mean_volume']).replace([np.inf, -np.inf], np.nan)
+    return sums[['account', 'service', 'n', 'mean_volume', 'slope', 'slope_pct']]
+
+
+def trends_sheet(frame: pd.DataFrame, z_threshold: float = 3.0) -> pd.DataFrame:
+    """Лист «Аналитика» для Excel с русскими заголовками"""
+    trends = service_trends(frame, z_threshold)
+    if trends.empty:
+        return trends
+
+    return pd.DataFrame({
+        'Лицевой счет': trends['account'],
+        'Услуга': trends['service'].astype(str),
+        'Период': trends['period'],
+        'Тариф': trends['tariff'],
+        'Тариф м/м, %': trends['tariff_mom'] * 100,
+        'Тариф г/г, %': trends['tariff_yoy'] * 100,
+        'Объем': trends['volume'],
+        'Объем м/м, %': trends['volume_mom'] * 100,
+        'Сумма': trends['total'],
+        'Z-оценка суммы': trends['z_score'],
+        'Выброс': np.where(trends['outlier'], 'да', ''),
+    })
+
+
+def sheet_parts(frame: pd.DataFrame, sheet_name: str,
+                max_rows: int = EXCEL_MAX_ROWS) -> List[Tuple[str, pd.DataFrame]]:
+    """
+    Длинная таблица по листам Excel: (имя листа, строки). Лист вмещает заголовок
+    и max_rows - 1 строк; продолжение идет на листы «Имя 2», «Имя 3» и т.д.
+    """
+    size = max_rows - 1
+    return [(sheet_name if start == 0 else f"{sheet_name} {start // size + 1}", frame.iloc[start:start + size])
+            for start in range(0, max(len(frame), 1), size)]
+
+
+def consumption_sheet(frame: pd.DataFrame) -> pd.DataFrame:
+    """Лист «Тренды потребления» для Excel с русскими заголовками"""
+    trends = consumption_trends(frame)
+    if trends.empty:
+        return trends
+
+    return pd.DataFrame({
+        'Лицевой счет': trends['account'],
+        'Услуга': trends['service'].astype(str),
+        'Месяцев': trends['n'],
+        'Средний объем': trends['mean_volume'],
+        'Тренд объема в месяц': trends['slope'],
+        'Тренд объема в месяц, %': trends['slope_pct'] * 100,
+    })
+
+
+def statistics_frame(summary: pd.DataFrame) -> pd.DataFrame:
+    """Лист «Статистика»: сумма, среднее, минимум и максимум всех числовых колонок одной агрегацией"""
+    numeric = summary.select_dtypes(include=['float64', 'int64'])
+    if numeric.empty:
+        return pd.DataFrame()
+
+    stats = numeric.agg(['sum', 'mean', 'min', 'max']).T
+    return pd.DataFrame({
+        'Категория': stats.index,
+        'Сумма за все периоды': stats['sum'].to_numpy(),
+        'Среднее за период': stats['mean'].to_numpy(),
+        'Минимум': stats['min'].to_numpy(),
+        'Максимум': stats['max'].to_numpy(),
+    })
+
+
+def _period_pivot(frame: pd.DataFrame, index: str, values: str) -> pd.DataFrame:
+    """Сводная таблица: строки - index, колонки - периоды по порядку, плюс колонка «Всего»"""
+    frame = frame.dropna(subset=['period_key'])
+    pivot = frame.groupby([index, 'period_key'], sort=True, observed=True)[values].sum().unstack('period_key')
+
+    labels = frame.drop_duplicates('period_key').set_index('period_key')['period']
+    pivot.columns = pd.Index(labels.reindex(pivot.columns).to_numpy())
+    pivot['Всего'] = pivot.sum(axis=1)
+    return pivot
+
+
+def service_pivot(frame: pd.DataFrame, values: str = 'total') -> pd.DataFrame:
+    """Период × услуга: сумма (values='total') или объем (values='volume'), периоды по порядку"""
+    if frame.empty:
+        return pd.DataFrame()
+
+    frame = frame.dropna(subset=['period_key'])
+    pivot = frame.groupby(['period_key', 'service'], sort=True, observed=True)[values].sum().unstack('service')
+    pivot.columns = pivot.columns.astype(str).rename(None)
+
+    labels = frame.drop_duplicates('period_key').set_index('period_key')['period']
+    pivot.insert(0, 'Период', labels.reindex(pivot.index).to_numpy())
+    if values == 'total':
+        pivot['Итого'] = pivot.drop(columns='Период').sum(axis=1)
+    return pivot.reset_index(drop=True)
+
+
+def account_pivot(summary: pd.DataFrame) -> pd.DataFrame:
+    """Лицевой счет × период: итог квитанций (со страхованием), периоды по порядку"""
+    if summary.empty or 'ИТОГО' not in summary.columns:
+        return pd.DataFrame()
+
+    frame = pd.DataFrame({
+        'account': summary['Лицевой счет'].fillna('Н/Д'),
+        'period': summary['Период'],
+        'period_key': summary['Период'].map(period_key),
+        'total': summary['ИТОГО'],
+    })
+    pivot = _period_pivot(frame, 'account', 'total')
+    pivot.index.name = 'Лицевой счет'
+    return pivot.reset_index()
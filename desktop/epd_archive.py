@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Чтение ЕПД прямо из ZIP-архивов и почтовых ящиков, без распаковки на диск
+
+Файл внутри архива адресуется обычным путем «архив.zip/папка/ЕПД.pdf», поэтому
+журнал, дубликаты, каталог и процессы-исполнители работают с ним так же, как
+с файлом на диске. Содержимое читается из архива в память только при разборе.
+Так же адресуются PDF-вложения писем (см. epd_mail).
+
+Архиваторы Windows в русской локали пишут имена файлов в кодировке DOS (cp866)
+без флага UTF-8, а zipfile читает такие имена как cp437 - «ЕПД» превращается
+в «ÑÅÅ». Имена без флага UTF-8 перекодируются в ARCHIVE_ENCODING.
+"""
+
+import fnmatch
+import io
+import os
+import zipfile
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+
+PDF_PATTERN = 'ЕПД*.pdf'
+
+# Кодировка имен в архивах без флага UTF-8
+ARCHIVE_ENCODING = 'cp866'
+
+# Флаг общего назначения ZIP: имя записано в UTF-8
+_UTF8_FLAG = 0x800
+
+
+def split_member(path: Union[str, Path]) -> Optional[Tuple[Path, str]]:
+    """
+    (контейнер, путь внутри него), если путь указывает внутрь ZIP-архива
+    или почтового ящика (ближайшая часть пути - файл, а не папка), иначе None
+    """
+    path = Path(path)
+    if path.exists():
+        return None
+    for parent in path.parents:
+        if parent.is_file():
+            return parent, path.relative_to(parent).as_posix()
+    return None
+
+
+def member_names(archive: zipfile.ZipFile, encoding: str = ARCHIVE_ENCODING) -> Dict[str, zipfile.ZipInfo]:
+    """Имя файла архива -> запись; имена без флага UTF-8 перекодируются из cp437 в encoding"""
+    members = {}
+    for info in archive.infolist():
+        name = info.filename
+        if not info.flag_bits & _UTF8_FLAG:
+            try:
+                name = name.encode('cp437').decode(encoding)
+            except UnicodeError:
+                pass
+        members[name] = info
+    return members
+
+
+@lru_cache(maxsize=8)
+def _archive(archive_path: str, size: int, mtime_ns: int,
+             pid: int) -> Tuple[zipfile.ZipFile, Dict[str, zipfile.ZipInfo]]:
+    """
+    Открытый архив и его оглавление; читаются один раз на процесс (ключ - размер и время изменения).
+    pid в ключе: процесс-исполнитель, созданный через fork, получает копию кэша родителя, но
+    открытый файл у них общий вместе с позицией чтения - каждый процесс открывает архив заново
+    """
+    archive = zipfile.ZipFile(archive_path)
+    return archive, member_names(archive)
+
+
+def open_source(path: Union[str, Path]) -> BinaryIO:
+    """Открывает PDF на диске, в ZIP-архиве или во вложении письма для двоичного чтения"""
+    member = split_member(path)
+    if member is None:
+        return open(path, 'rb')
+
+    archive_path, name = member
+    if archive_path.suffix.lower() != '.zip':
+        from epd_mail import read_attachment
+
+        return io.BytesIO(read_attachment(archive_path, name))
+
+    stat = os.stat(archive_path)
+    archive, members = _archive(str(archive_path), stat.st_size, stat.st_mtime_ns, os.getpid())
+    if name not in members:
+        raise FileNotFoundError(f"Нет файла {name} в архиве {archive_path}")
+    data = archive.read(members[name])
+    # PyPDF2 читает PDF с конца и перемещается по нему: из сжатого потока архива это медленно
+    return io.BytesIO(data)
+
+
+def find_pdf_files(folder: Union[str, Path], pattern: str = PDF_PATTERN) -> List[Path]:
+    """PDF файлы папки и ZIP-архивов в ней (с вложенными папками архива), отсортированные по пути"""
+    folder = Path(folder)
+    pdf_files = list(folder.glob(pattern))
+    for archive_path in folder.glob('*.zip'):
+        try:
+            with zipfile.ZipFile(archive_path) as archive:
+                names = list(member_names(archive))
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"Ошибка при чтении архива {archive_path.name}: {e}")
+            continue
+        pdf_files.extend(archive_path / name for name in names
+                         if not name.endswith('/') and fnmatch.fnmatch(name.rsplit('/', 1)[-1], pattern))
+    return sorted(pdf_files)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Разбор пачек ЕПД - один PDF с квитанциями многих лицевых счетов подряд
+
+Управляющие компании присылают один файл на сотни квитанций. Пачка делится на
+диапазоны страниц по шапкам квитанций (новый «Лицевой счет:» или новый период),
+и каждый диапазон разбирается как отдельный документ. Извлечение текста страниц
+и разбор диапазонов выполняются в параллельных процессах. Шаблон каждой
+квитанции определяется по ее первой странице (epd_templates.TemplateDispatcher),
+и квитанцию разбирает парсер этого шаблона.
+
+С корпусом текста (epd_corpus) текст уже встречавшихся файлов берется из
+корпуса без декодирования PDF, а текст новых файлов туда сохраняется.
+В позиционном режиме (колонки по координатам) нужны координаты фрагментов,
+которых в корпусе нет, поэтому PDF декодируется всегда.
+"""
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+
+from epd_archive import open_source
+from epd_dedup import file_hash
+from epd_parser import EPDParser, extract_page
+from epd_templates import LayoutTemplate, TemplateDispatcher, fingerprint_page, text_fingerprint
+
+
+ACCOUNT_RE = re.compile(r'Лицевой счет:\s*(\d+[\s-]*\d+)')
+PERIOD_RE = re.compile(r'ЗА\s+(\w+\s+\d{4})')
+
+# Пачки меньше этого числа страниц разбираются в текущем процессе:
+# запуск процессов и передача текста дороже самого разбора
+MIN_PARALLEL_PAGES = 8
+
+# Число кусков страниц на один процесс при извлечении текста (для выравнивания нагрузки)
+CHUNKS_PER_WORKER = 4
+
+
+class ParseError(Exception):
+    """Файл не разобран - выдается вместо списка квитанций в результатах iter_parse"""
+
+    def __init__(self, reason: str, details: str = '', quarantined: bool = False):
+        super().__init__(f"{reason}: {details}" if details else reason)
+        self.reason = reason
+        self.details = details
+        # Файл снят с разбора по лимиту или из-за сбоя процесса (а не ошибка в самом файле)
+        self.quarantined = quarantined
+
+
+def bill_ranges(pages: List[str]) -> List[Tuple[int, int]]:
+    """
+    Диапазоны страниц [начало, конец) отдельных квитанций.
+    Новая квитанция начинается со страницы, в шапке которой другой лицевой счет
+    или другой период; страницы без шапки относятся к текущей квитанции
+    """
+    ranges = []
+    current = None
+    for page_no, text in enumerate(pages):
+        account = ACCOUNT_RE.search(text)
+        if account is None:
+            continue
+
+        period = PERIOD_RE.search(text)
+        key = (account.group(1).strip(), period.group(1) if period else None)
+        if key != current:
+            if ranges:
+                ranges[-1] = (ranges[-1][0], page_no)
+            # Страницы до первой шапки (титульный лист пачки) относим к первой квитанции
+            ranges.append((page_no if ranges else 0, len(pages)))
+            current = key
+
+    return ranges or [(0, len(pages))]
+
+
+def _read_pages(pdf_reader: PyPDF2.PdfReader, start: int, stop: int,
+                positional: bool) -> Tuple[List[str], Optional[List[Tuple]], List[Dict]]:
+    """
+    Текст, фрагменты с координатами (только в позиционном режиме) и отпечатки
+    страниц [start, stop) для распознавания шаблона (без текста - он уже в первом списке)
+    """
+    fragments = [] if positional else None
+    texts = []
+    prints = []
+    for page_no in range(start, stop):
+        page = pdf_reader.pages[page_no]
+        texts.append(extract_page(page, page_no, fragments))
+        prints.append(fingerprint_page(page, ''))
+    return texts, fragments, prints
+
+
+def _extract_pages(pdf_path: str, start: int, stop: int,
+                   positional: bool = False) -> Tuple[List[str], Optional[List[Tuple]], List[Dict]]:
+    """Страницы [start, stop) - выполняется в процессе-исполнителе"""
+    with open_source(pdf_path) as file:
+        return _read_pages(PyPDF2.PdfReader(file), start, stop, positional)
+
+
+def _parse_bill(parser: EPDParser, text: str, fragments: Optional[List[Tuple]] = None,
+                size: Optional[Tuple[int, int]] = None, layouts: Optional[Dict] = None) -> Optional[Dict]:
+    """Разбор текста одной квитанции - выполняется в процессе-исполнителе"""
+    return parser.parse_text(text, fragments, size, layouts)
+
+
+class BundleParser:
+    """Разбор PDF, содержащего одну или много квитанций; процессы создаются при первой большой пачке"""
+
+    def __init__(self, workers: Optional[int] = None, parser_class: type = EPDParser,
+                 min_parallel_pages: int = MIN_PARALLEL_PAGES, corpus_path: Union[str, Path, None] = None,
+                 positional: bool = False, templates: Optional[List[LayoutTemplate]] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.parser_class = parser_class
+        self.positional = positional
+        # Парсеры шаблонов не хранят результатов: один экземпляр на шаблон разбирает все его
+        # квитанции и передается исполнителям; нераспознанные квитанции разбирает parser_class.
+        # templates - шаблоны вместо стандартных ([] - всё разбирает parser_class)
+        self.dispatcher = TemplateDispatcher(templates, positional=positional, fallback_class=parser_class)
+        self.min_parallel_pages = min_parallel_pages
+        self.corpus_path = corpus_path
+        # Раскладки колонок позиционного режима, выученные на предыдущих квитанциях этого разбора,
+        # отдельно для каждого шаблона (None - нераспознанные)
+        self.column_layouts = {}
+        self._executor = None
+        self._corpus = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _extract(self, pdf_path: str, pages_count: int) -> Tuple[List[str], Optional[List[Tuple]], List[Dict]]:
+        """Страницы всего файла, куски страниц извлекаются параллельно"""
+        chunk = max(pages_count // (self.workers * CHUNKS_PER_WORKER), 1)
+        starts = range(0, pages_count, chunk)
+        futures = [self._pool().submit(_extract_pages, pdf_path, start, min(start + chunk, pages_count),
+                                       self.positional)
+                   for start in starts]
+
+        pages = []
+        fragments = [] if self.positional else None
+        prints = []
+        for future in futures:
+            chunk_pages, chunk_fragments, chunk_prints = future.result()
+            pages.extend(chunk_pages)
+            prints.extend(chunk_prints)
+            if fragments is not None:
+                fragments.extend(chunk_fragments)
+        return pages, fragments, prints
+
+    def _corpus_pages(self, pdf_path: str) -> Tuple[Optional[str], Optional[List[str]]]:
+        """Хеш файла и текст его страниц из корпуса (None, если корпуса нет или файла в нем нет)"""
+        if self.corpus_path is None:
+            return None, None
+        if self._corpus is None:
+            from epd_corpus import TextCorpus
+
+            self._corpus = TextCorpus(self.corpus_path)
+        digest = file_hash(pdf_path)
+        return digest, self._corpus.get(digest)
+
+    def parse_pdf(self, pdf_path: str) -> List[Dict]:
+        """Список квитанций файла в порядке страниц (пустой, если файл не удалось прочитать)"""
+        print(f"Обработка файла: {pdf_path}")
+
+        digest, pages = self._corpus_pages(pdf_path)
+        in_corpus = pages is not None
+        fragments = None
+        prints = None
+        if not in_corpus or self.positional:
+            try:
+                with open_source(pdf_path) as file:
+                    pdf_reader = PyPDF2.PdfReader(file)
+                    pages_count = len(pdf_reader.pages)
+                    parallel = self.workers > 1 and pages_count >= self.min_parallel_pages
+                    if not parallel:
+                        pages, fragments, prints = _read_pages(pdf_reader, 0, pages_count, self.positional)
+                if parallel:
+                    pages, fragments, prints = self._extract(str(pdf_path), pages_count)
+            except Exception as e:
+                print(f"Ошибка при чтении PDF: {e}")
+                return []
+            if digest is not None and not in_corpus:
+                self._corpus.put(digest, pages, str(pdf_path))
+        else:
+            parallel = self.workers > 1 and len(pages) >= self.min_parallel_pages
+
+        return self.parse_pages(pages, fragments, prints, parallel)
+
+    def parse_pages(self, pages: List[str], fragments: Optional[List[Tuple]] = None,
+                    prints: Optional[List[Dict]] = None, parallel: bool = False) -> List[Dict]:
+        """
+        Квитанции из текста страниц. Без отпечатков страниц (текст из корпуса)
+        шаблон распознается только по тексту первой страницы квитанции
+        """
+        ranges = bill_ranges(pages)
+        texts = [''.join(pages[start:stop]) for start, stop in ranges]
+        if fragments is None:
+            bill_fragments = [None] * len(ranges)
+        else:
+            # Фрагменты по страницам, затем по квитанциям (номер страницы - первый элемент фрагмента)
+            by_page = [[] for _ in pages]
+            for fragment in fragments:
+                by_page[fragment[0]].append(fragment)
+            bill_fragments = [[fragment for page in by_page[start:stop] for fragment in page]
+                              for start, stop in ranges]
+        bill_sizes = [prints[start]['page_size'] if prints else None for start, _ in ranges]
+
+        parsers = []
+        layouts = []
+        for start, _ in ranges:
+            if prints:
+                fingerprint = dict(prints[start], text=pages[start])
+            else:
+                fingerprint = text_fingerprint(pages[start])
+            template = self.dispatcher.classify(fingerprint)
+            parsers.append(self.dispatcher.parser_for(template))
+            layouts.append(self.column_layouts.setdefault(template.name if template else None, {}))
+
+        if parallel and len(texts) > 1:
+            chunksize = max(len(texts) // (self.workers * CHUNKS_PER_WORKER), 1)
+            # Исполнители получают копию выученных раскладок; новые раскладки учатся в каждом заново
+            bills = self._pool().map(_parse_bill, parsers, texts, bill_fragments, bill_sizes, layouts,
+                                     chunksize=chunksize)
+        else:
+            bills = [_parse_bill(parsers[i], text, bill_fragments[i], bill_sizes[i], layouts[i])
+                     for i, text in enumerate(texts)]
+        return [bill for bill in bills if bill]
+
+    def iter_parse(self, pdf_paths: Iterable[Union[str, Path]], ordered: bool = True,
+                   buffer_size: Optional[int] = None) -> Iterator[Tuple[str, Union[List[Dict], ParseError], Dict]]:
+        """
+        (путь, квитанции или ParseError, время) по мере разбора. Файлы разбираются
+        по одному в этом процессе, поэтому порядок готовности совпадает с исходным;
+        ordered и buffer_size - для совместимости с SupervisedParser.iter_parse
+        """
+        began = time.monotonic()
+        for pdf_path in pdf_paths:
+            started = time.monotonic()
+            try:
+                result = self.parse_pdf(str(pdf_path)) or ParseError('ошибка разбора', 'квитанции не найдены')
+            except Exception as e:
+                result = ParseError('ошибка разбора', f"{type(e).__name__}: {e}")
+            if isinstance(result, ParseError):
+                print(f"✗ Ошибка при обработке {Path(pdf_path).name}: {result.details}\n")
+            yield str(pdf_path), result, {'wait': started - began, 'parse': time.monotonic() - started}
+
+    def close(self):
+        """Останавливает процессы-исполнители и закрывает корпус"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._corpus is not None:
+            self._corpus.close()
+            self._corpus = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
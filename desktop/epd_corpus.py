@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Корпус извлеченного текста ЕПД - повторный разбор без декодирования PDF
+
+Извлечение текста PyPDF2 - самый медленный шаг обработки. Корпус - файл SQLite
+рядом с архивом, в котором для каждого PDF хранится сжатый zlib текст страниц
+под ключом (хеш содержимого, версия извлечения). Файл, уже попавший в корпус,
+повторно не декодируется, а после изменения правил разбора весь архив
+разбирается заново прямо из корпуса (`--reparse`), без чтения PDF.
+"""
+
+import json
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+
+
+CORPUS_NAME = '.epd_corpus.db'
+
+# Версия извлечения: текст другой версии PyPDF2 или другого кода извлечения
+# может отличаться, поэтому в корпусе он хранится отдельно.
+# Суффикс увеличивается при изменении EPDParser.extract_pages
+EXTRACTOR_VERSION = f'PyPDF2-{PyPDF2.__version__}/1'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages_text (
+    hash TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    source TEXT,
+    pages BLOB NOT NULL,
+    PRIMARY KEY (hash, extractor)
+);
+'''
+
+
+class TextCorpus:
+    """Текст страниц PDF по хешу содержимого; несколько процессов могут писать одновременно"""
+
+    def __init__(self, db_path: Union[str, Path], extractor: str = EXTRACTOR_VERSION):
+        self.db_path = str(db_path)
+        self.extractor = extractor
+        # Исполнители пишут в корпус параллельно - ждем освобождения блокировки
+        self.connection = sqlite3.connect(self.db_path, timeout=60)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Закрывает соединение с корпусом"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM pages_text WHERE extractor = ?', (self.extractor,)
+        ).fetchone()[0]
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        """Текст страниц файла или None, если файла нет в корпусе"""
+        row = self.connection.execute(
+            'SELECT pages FROM pages_text WHERE hash = ? AND extractor = ?', (digest, self.extractor)
+        ).fetchone()
+        return _unpack(row[0]) if row else None
+
+    def put(self, digest: str, pages: List[str], source: Optional[str] = None):
+        """Сохраняет текст страниц файла"""
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO pages_text(hash, extractor, source, pages) VALUES (?, ?, ?, ?)',
+                (digest, self.extractor, source, _pack(pages))
+            )
+
+    def entries(self) -> Iterator[Tuple[str, str, List[str]]]:
+        """(хеш, исходный файл, страницы) всех файлов корпуса текущей версии, по имени файла"""
+        rows = self.connection.execute(
+            'SELECT hash, source, pages FROM pages_text WHERE extractor = ? ORDER BY source, hash',
+            (self.extractor,)
+        )
+        for digest, source, pages in rows:
+            yield digest, source, _unpack(pages)
+
+
+def _pack(pages: List[str]) -> bytes:
+    return zlib.compress(json.dumps(pages, ensure_ascii=False).encode('utf-8'))
+
+
+def _unpack(data: bytes) -> List[str]:
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+
+def reparse(corpus: TextCorpus, parser_class: type = None) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Разбирает весь корпус текущими правилами: (исходный файл, квитанции) по каждому файлу.
+    Пачки делятся на квитанции и распознаются по шаблонам так же, как при разборе PDF
+    """
+    from epd_bundle import BundleParser
+
+    if parser_class is None:
+        from epd_parser import EPDParser as parser_class
+
+    with BundleParser(workers=1, parser_class=parser_class) as parser:
+        for _, source, pages in corpus.entries():
+            yield source, parser.parse_pages(pages)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск дубликатов ЕПД при загрузке
+
+Одну и ту же квитанцию часто сохраняют несколько раз под разными именами.
+Побайтовые копии отсекаются по хешу файла ещё до парсинга, а перерисованные
+копии (другой PDF, те же данные) - по ключу (лицевой счет, период, итог).
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from epd_archive import open_source, split_member
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Хеши, уже посчитанные по содержимому в памяти (вложения писем):
+# путь -> (размер и время изменения контейнера, хеш)
+_known_hashes: Dict[str, Tuple[Optional[Tuple[int, int]], str]] = {}
+
+
+def content_hash(data: Union[bytes, bytearray, memoryview]) -> str:
+    """Хеш содержимого PDF, уже загруженного в память"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _container_signature(path: Union[str, Path]) -> Optional[Tuple[int, int]]:
+    """Размер и время изменения файла, в котором лежит источник (ящик, письмо или сам файл)"""
+    member = split_member(path)
+    try:
+        stat = os.stat(member[0] if member else path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def remember_hash(path: Union[str, Path], digest: str):
+    """Запоминает хеш источника, посчитанный при его чтении, чтобы file_hash не читал его заново"""
+    _known_hashes[str(path)] = (_container_signature(path), digest)
+
+
+def file_hash(pdf_path: Union[str, Path]) -> str:
+    """
+    Хеш содержимого файла (читается блоками, без загрузки целиком). Запомненный хеш
+    используется один раз и только если контейнер с тех пор не менялся: тот же путь
+    в перезаписанном ящике указывает на другое вложение
+    """
+    known = _known_hashes.pop(str(pdf_path), None)
+    if known is not None and known[0] == _container_signature(pdf_path):
+        return known[1]
+    digest = hashlib.blake2b(digest_size=16)
+    with open_source(pdf_path) as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def bill_key(epd_data: Dict) -> Optional[Tuple[str, str, float]]:
+    """Ключ квитанции (лицевой счет, период, итог) или None, если данных не хватает"""
+    account = epd_data.get('лицевой_счет')
+    period = epd_data.get('период')
+    if not account or not period:
+        return None
+
+    total = epd_data.get('суммы_по_категориям', {}).get('ИТОГО')
+    if total is None:
+        total = epd_data.get('итого_к_оплате_без_страхования') or 0.0
+
+    account = ''.join(ch for ch in account if ch.isdigit())
+    period = ' '.join(period.lower().split())
+    return account, period, round(total, 2)
+
+
+class DuplicateDetector:
+    """Отслеживает уже загруженные квитанции в рамках одной загрузки"""
+
+    def __init__(self):
+        self._hashes = {}
+        self._keys = {}
+
+    def check_hash(self, digest: str, source: str) -> Optional[str]:
+        """Возвращает источник оригинала, если такой хеш уже встречался; иначе запоминает его"""
+        original = self._hashes.get(digest)
+        if original is None:
+            self._hashes[digest] = source
+        return original
+
+    def check_bill(self, epd_data: Dict, source: str) -> Optional[str]:
+        """Проверка разобранной квитанции по ключу (лицевой счет, период, итог)"""
+        key = bill_key(epd_data)
+        if key is None:
+            return None
+
+        original = self._keys.get(key)
+        if original is None:
+            self._keys[key] = source
+        return original
+
+    def clear(self):
+        """Сбрасывает все запомненные квитанции"""
+        self._hashes.clear()
+        self._keys.clear()
@@ -7,31 +7,62 @@
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
+import queue
 import re
+import threading
 import PyPDF2
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 import json
 
+from epd_accounts import AccountRollups
+from epd_bundle import BundleParser, ParseError
+from epd_dedup import DuplicateDetector, file_hash
+from epd_lexer import parse_service_lines
+from epd_parser import period_key
+from epd_search import ServiceIndex
+from epd_watchdog import DEFAULT_TIME_LIMIT, SupervisedParser
+from epd_workspace import SNAPSHOT_EXTENSION, load_snapshot, save_snapshot, stale_files
+
+
+# Как часто окно забирает результаты рабочего потока разбора (мс)
+PARSE_POLL_MS = 100
+
+# Шаблоны ЕПД для разбора в интерфейсе: нет - все квитанции разбирает EPDParser интерфейса
+GUI_TEMPLATES = []
+
+
+def empty_result() -> Dict:
+    """Новый пустой результат разбора одного ЕПД"""
+    return {
+        'период': None,
+        'лицевой_счет': None,
+        'адрес': None,
+        'фио': None,
+        'итого_к_оплате': None,
+        'итого_к_оплате_без_страхования': None,
+        'жилищные_услуги': [],
+        'коммунальные_услуги': [],
+        'страхование': None,
+        'суммы_по_категориям': {}
+    }
+
 
 class EPDParser:
-    """Класс для парсинга данных из ЕПД"""
-
-    def __init__(self):
-        self.data = {
-            'период': None,
-            'лицевой_счет': None,
-            'адрес': None,
-            'фио': None,
-            'итого_к_оплате': None,
-            'итого_к_оплате_без_страхования': None,
-            'жилищные_услуги': [],
-            'коммунальные_услуги': [],
-            'страхование': None,
-            'суммы_по_категориям': {}
-        }
+    """Класс для парсинга данных из ЕПД (без состояния: каждый разбор возвращает новый словарь)"""
+
+    PERIOD_RE = re.compile(r'ЗА\s+(\w+\s+\d{4})', re.IGNORECASE)
+    ACCOUNT_RE = re.compile(r'Лицевой счет:\s*(\d+[\s-]*\d+)', re.IGNORECASE)
+    FIO_RE = re.compile(r'ФИО:\s*([А-ЯЁ\s]+)')
+    ADDRESS_RE = re.compile(r'Адрес:\s*(.+?)(?:\d+\s*руб|ИТОГО)', re.DOTALL | re.IGNORECASE)
+    TOTAL_NO_INSURANCE_RE = re.compile(
+        r'(\d[\s\d]*руб\.\s*\d+\s*коп\.)[\s\S]{0,100}?ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ.*?БЕЗ', re.IGNORECASE)
+    TOTAL_WITH_INSURANCE_RE = re.compile(
+        r'(\d[\s\d]*руб\.\s*\d+\s*коп\.)[\s\S]{0,100}?ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ.*?С\s+УЧЕТОМ', re.IGNORECASE)
+    TOTAL_ALT_RE = re.compile(r'Итого к оплате.*?без.*?(\d+[,\.]\d{2})', re.IGNORECASE)
+    AMOUNT_JUNK_RE = re.compile(r'[^\d,.\s]')
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Извлекает текст из PDF файла"""
@@ -48,7 +79,7 @@ class EPDParser:
     def parse_amount(self, text: str) -> float:
         """Преобразует строку с суммой в число (поддержка чисел с пробелами как разделителями тысяч)"""
         # Убираем все кроме цифр, запятой, точки и пробелов
-        clean_text = re.sub(r'[^\d,.\s]', '', text)
+        clean_text = self.AMOUNT_JUNK_RE.sub('', text)
         # Убираем пробелы (используются как разделители тысяч, например "1 927,72")
         clean_text = clean_text.replace(' ', '')
         # Заменяем запятую на точку
@@ -58,170 +89,84 @@ class EPDParser:
         except ValueError:
             return 0.0
 
-    def parse_header_info(self, text: str):
-        """Извлекает основную информацию из шапки документа"""
-        period_match = re.search(r'ЗА\s+(\w+\s+\d{4})', text, re.IGNORECASE)
+    def parse_header_info(self, text: str, data: Dict):
+        """Извлекает основную информацию из шапки документа в data"""
+        period_match = self.PERIOD_RE.search(text)
         if period_match:
-            self.data['период'] = period_match.group(1)
+            data['период'] = period_match.group(1)
 
-        account_match = re.search(r'Лицевой счет:\s*(\d+[\s-]*\d+)', text, re.IGNORECASE)
+        account_match = self.ACCOUNT_RE.search(text)
         if account_match:
-            self.data['лицевой_счет'] = account_match.group(1).strip()
+            data['лицевой_счет'] = account_match.group(1).strip()
 
-        fio_match = re.search(r'ФИО:\s*([А-ЯЁ\s]+)', text)
+        fio_match = self.FIO_RE.search(text)
         if fio_match:
-            self.data['фио'] = fio_match.group(1).strip()
+            data['фио'] = fio_match.group(1).strip()
 
-        address_match = re.search(r'Адрес:\s*(.+?)(?:\d+\s*руб|ИТОГО)', text, re.DOTALL | re.IGNORECASE)
+        address_match = self.ADDRESS_RE.search(text)
         if address_match:
             addr = address_match.group(1).strip()
             addr = ' '.join(addr.split())
-            # Убираем лишние символы
-            addr = re.sub(r'\s+', ' ', addr)
-            self.data['адрес'] = addr
+            data['адрес'] = addr
 
         # Ищем итоговые суммы - улучшенные паттерны
         # Ищем строку с "6 201 руб. 04 коп." и "ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ СЧЕТА БЕЗ"
-        total_no_ins_match = re.search(r'(\d[\s\d]*руб\.\s*\d+\s*коп\.)[\s\S]{0,100}?ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ.*?БЕЗ', text, re.IGNORECASE)
+        total_no_ins_match = self.TOTAL_NO_INSURANCE_RE.search(text)
         if total_no_ins_match:
-            self.data['итого_к_оплате_без_страхования'] = self.parse_amount(total_no_ins_match.group(1))
+            data['итого_к_оплате_без_страхования'] = self.parse_amount(total_no_ins_match.group(1))
 
-        total_with_ins_match = re.search(r'(\d[\s\d]*руб\.\s*\d+\s*коп\.)[\s\S]{0,100}?ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ.*?С\s+УЧЕТОМ', text, re.IGNORECASE)
+        total_with_ins_match = self.TOTAL_WITH_INSURANCE_RE.search(text)
         if total_with_ins_match:
-            self.data['итого_к_оплате'] = self.parse_amount(total_with_ins_match.group(1))
+            data['итого_к_оплате'] = self.parse_amount(total_with_ins_match.group(1))
 
         # Альтернативный способ - ищем строки "Итого к оплате"
-        if not self.data['итого_к_оплате_без_страхования']:
-            alt_match = re.search(r'Итого к оплате.*?без.*?(\d+[,\.]\d{2})', text, re.IGNORECASE)
+        if not data['итого_к_оплате_без_страхования']:
+            alt_match = self.TOTAL_ALT_RE.search(text)
             if alt_match:
-                self.data['итого_к_оплате_без_страхования'] = self.parse_amount(alt_match.group(1))
-
-    def parse_services(self, text: str):
-        """Парсит услуги из таблицы расчетов"""
-        # Улучшенный парсинг - ищем строки с конкретными паттернами
-        # Паттерн для строк таблицы: Название Объем Ед.изм Тариф ... Итого
+                data['итого_к_оплате_без_страхования'] = self.parse_amount(alt_match.group(1))
 
-        current_section = None
-
-        # Разбиваем текст на строки
-        lines = text.split('\n')
-
-        for i, line in enumerate(lines):
-            line_stripped = line.strip()
-
-            # Определяем секции
-            if 'Начисления за жилищные услуги' in line:
-                current_section = 'жилищные_услуги'
-                continue
-            elif 'Начисления за коммунальные услуги' in line:
-                current_section = 'коммунальные_услуги'
-                continue
-            elif 'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ' in line:
-                # Ищем все числа в строке
-                numbers = re.findall(r'\d+[,\.]\d{2}', line)
-                if numbers:
-                    # Последнее число - итоговая сумма
-                    self.data['страхование'] = self.parse_amount(numbers[-1])
-                current_section = None
-                continue
-            elif 'Всего за' in line or 'Итого к оплате' in line.lower():
-                current_section = None
-                continue
+    def parse_services(self, text: str, data: Dict):
+        """Парсит услуги из таблицы расчетов в data (один проход лексера по строкам)"""
+        services, insurance = parse_service_lines(text)
+        for category, items in services.items():
+            data[category].extend(items)
+        if insurance is not None:
+            data['страхование'] = insurance
 
-            if not current_section:
-                continue
-
-            # Пропускаем пустые строки и заголовки
-            if not line_stripped or any(keyword in line_stripped.lower() for keyword in
-                                       ['виды услуг', 'объем услуг', 'начислено по тарифу']):
-                continue
-
-            # Ищем строки с услугами - должны содержать название и цифры
-            # Используем более гибкий паттерн
-            if re.search(r'[А-ЯЁ]', line) and re.search(r'\d+[,\.]\d{2}', line):
-                try:
-                    # Извлекаем все числа из строки
-                    numbers = re.findall(r'\d+[,\.]\d+', line)
-                    if not numbers:
-                        continue
-
-                    # Последнее число - итоговая сумма
-                    total = self.parse_amount(numbers[-1])
-                    if total <= 0:
-                        continue
-
-                    # Извлекаем название услуги (все до первого числа)
-                    name_match = re.match(r'^([А-ЯЁа-яё\s\(\)/]+?)(?:\s+\d)', line_stripped)
-                    if not name_match:
-                        # Пробуем альтернативный вариант
-                        name_match = re.match(r'^([А-ЯЁа-яё\s\(\)/]+)', line_stripped)
-
-                    if name_match:
-                        service_name = name_match.group(1).strip()
-                    else:
-                        # Берем первые слова как название
-                        words = line_stripped.split()
-                        service_name = ' '.join([w for w in words if not re.search(r'\d', w)])[:50]
-
-                    # Пытаемся извлечь объем, единицы измерения и тариф
-                    volume = 0.0
-                    unit = ''
-                    tariff = 0.0
-
-                    # Ищем единицы измерения
-                    unit_match = re.search(r'(кв\.м\.|куб\.\s*м\.|к[вВ]т[\./]?ч|Гкал)', line_stripped)
-                    if unit_match:
-                        unit = unit_match.group(1)
-
-                    # Если есть несколько чисел, пытаемся определить объем и тариф
-                    if len(numbers) >= 3:
-                        volume = self.parse_amount(numbers[0])
-                        tariff = self.parse_amount(numbers[1])
-                    elif len(numbers) >= 2:
-                        volume = self.parse_amount(numbers[0])
-
-                    service_data = {
-                        'название': service_name,
-                        'объем': volume,
-                        'ед_изм': unit,
-                        'тариф': tariff,
-                        'итого': total
-                    }
-
-                    self.data[current_section].append(service_data)
-
-                except Exception as e:
-                    print(f"Ошибка парсинга строки: {line_stripped[:50]}... - {e}")
-                    continue
-
-    def calculate_totals(self):
+    def calculate_totals(self, data: Dict):
         """Вычисляет итоговые суммы по категориям"""
-        housing_total = sum(item['итого'] for item in self.data['жилищные_услуги'])
-        self.data['суммы_по_категориям']['Жилищные услуги'] = housing_total
+        housing_total = sum(item['итого'] for item in data['жилищные_услуги'])
+        data['суммы_по_категориям']['Жилищные услуги'] = housing_total
 
-        utility_total = sum(item['итого'] for item in self.data['коммунальные_услуги'])
-        self.data['суммы_по_категориям']['Коммунальные услуги'] = utility_total
+        utility_total = sum(item['итого'] for item in data['коммунальные_услуги'])
+        data['суммы_по_категориям']['Коммунальные услуги'] = utility_total
 
-        if self.data['страхование']:
-            self.data['суммы_по_категориям']['Добровольное страхование'] = self.data['страхование']
+        if data['страхование']:
+            data['суммы_по_категориям']['Добровольное страхование'] = data['страхование']
 
         total = housing_total + utility_total
-        if self.data['страхование']:
-            total += self.data['страхование']
+        if data['страхование']:
+            total += data['страхование']
+
+        data['суммы_по_категориям']['ИТОГО'] = total
 
-        self.data['суммы_по_категориям']['ИТОГО'] = total
+    def parse_text(self, text: str, fragments: List[Tuple] = None, page_size: Tuple = None,
+                   layouts: Dict = None) -> Dict:
+        """Разбирает уже извлеченный текст (вызывается диспетчером шаблонов); координаты не используются"""
+        data = empty_result()
+        self.parse_header_info(text, data)
+        self.parse_services(text, data)
+        self.calculate_totals(data)
+
+        return data
 
     def parse_pdf(self, pdf_path: str) -> Dict:
-        """Основной метод парсинга PDF файла"""
+        """Основной метод парсинга PDF файла; возвращает новый словарь результата"""
         text = self.extract_text_from_pdf(pdf_path)
         if not text:
             raise Exception("Не удалось извлечь текст из PDF")
 
-        self.parse_header_info(text)
-        self.parse_services(text)
-        self.calculate_totals()
-
-        return self.data
+        return self.parse_text(text)
 
 
 class EPDGuiApp:
@@ -232,10 +177,26 @@ class EPDGuiApp:
         self.root.title("ЕПД Парсер - Анализ платежных документов")
         self.root.geometry("1200x800")
 
-        self.parser = EPDParser()
+        # Пачки делятся на квитанции, каждую разбирает парсер интерфейса (с лексером таблицы начислений):
+        # шаблоны консольной версии интерфейсу не подходят, ЕПД интерфейса совпадают с ними по маркерам
+        self.parser = BundleParser(workers=1, parser_class=EPDParser, templates=GUI_TEMPLATES)
         self.loaded_files = []
         self.parsed_data = []
+        self.rollups = AccountRollups()
         self.include_insurance = tk.BooleanVar(value=False)  # По умолчанию страхование не включено
+        # Разбор под надзором с лимитом времени на файл - только если пользователь включил его
+        self.use_time_limit = tk.BooleanVar(value=False)
+        self.time_limit = tk.StringVar(value=f"{DEFAULT_TIME_LIMIT:g}")
+        # Хеши содержимого файлов (для снимка рабочего пространства); перепроверка сеанса что-то изменила
+        self.file_hashes = {}
+        self.revalidation_changed = False
+        # Отложенное применение фильтра таблицы услуг (пока пользователь печатает)
+        self.filter_job = None
+        self.filtered = False
+        # Результаты разбора (или перепроверки сеанса) из рабочего потока и счетчики текущего запуска
+        self.parse_results = None
+        self.parse_counts = None
+        self.parse_duplicates = None
 
         self.setup_ui()
 
@@ -245,10 +206,25 @@ class EPDGuiApp:
         top_frame = ttk.Frame(self.root, padding="10")
         top_frame.pack(fill=tk.X)
 
-        ttk.Button(top_frame, text="📂 Загрузить PDF файлы", command=self.load_files).pack(side=tk.LEFT, padx=5)
-        ttk.Button(top_frame, text="🔄 Обработать все", command=self.process_files).pack(side=tk.LEFT, padx=5)
-        ttk.Button(top_frame, text="💾 Сохранить в Excel", command=self.save_to_excel).pack(side=tk.LEFT, padx=5)
-        ttk.Button(top_frame, text="❌ Очистить", command=self.clear_all).pack(side=tk.LEFT, padx=5)
+        # Кнопки, меняющие загруженные данные, отключаются на время разбора
+        self.action_buttons = []
+        for text, command in (("📂 Загрузить PDF файлы", self.load_files),
+                              ("🔄 Обработать все", self.process_files),
+                              ("💾 Сохранить в Excel", self.save_to_excel),
+                              ("📤 Сохранить сеанс", self.save_workspace),
+                              ("📥 Открыть сеанс", self.open_workspace),
+                              ("❌ Очистить", self.clear_all)):
+            button = ttk.Button(top_frame, text=text, command=command)
+            button.pack(side=tk.LEFT, padx=5)
+            self.action_buttons.append(button)
+
+        # Лимит времени на файл: зависший файл уходит в карантин, остальные продолжают разбираться
+        time_limit_check = ttk.Checkbutton(top_frame, text="⏱ Лимит на файл, с:", variable=self.use_time_limit)
+        time_limit_check.pack(side=tk.LEFT, padx=(15, 2))
+        time_limit_box = ttk.Spinbox(top_frame, from_=10, to=3600, increment=10, width=6,
+                                     textvariable=self.time_limit)
+        time_limit_box.pack(side=tk.LEFT)
+        self.action_buttons += [time_limit_check, time_limit_box]
 
         # Основной контейнер с разделением
         main_paned = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
@@ -321,6 +297,38 @@ class EPDGuiApp:
         )
         insurance_check.pack(side=tk.LEFT, padx=5)
 
+        # Панель фильтров: название, период, категория, сумма
+        filter_frame = ttk.Frame(parent)
+        filter_frame.pack(fill=tk.X, padx=5)
+
+        self.filter_name = tk.StringVar()
+        self.filter_period_from = tk.StringVar()
+        self.filter_period_to = tk.StringVar()
+        self.filter_category = tk.StringVar(value='Все')
+        self.filter_amount_min = tk.StringVar()
+        self.filter_amount_max = tk.StringVar()
+
+        ttk.Label(filter_frame, text="🔍 Услуга:").pack(side=tk.LEFT)
+        ttk.Entry(filter_frame, textvariable=self.filter_name, width=20).pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="Период с").pack(side=tk.LEFT, padx=(8, 0))
+        self.period_from_box = ttk.Combobox(filter_frame, textvariable=self.filter_period_from, width=14)
+        self.period_from_box.pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="по").pack(side=tk.LEFT)
+        self.period_to_box = ttk.Combobox(filter_frame, textvariable=self.filter_period_to, width=14)
+        self.period_to_box.pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="Категория").pack(side=tk.LEFT, padx=(8, 0))
+        ttk.Combobox(filter_frame, textvariable=self.filter_category, state='readonly', width=13,
+                     values=('Все', 'Жилищные', 'Коммунальные')).pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="Сумма от").pack(side=tk.LEFT, padx=(8, 0))
+        ttk.Entry(filter_frame, textvariable=self.filter_amount_min, width=8).pack(side=tk.LEFT, padx=2)
+        ttk.Label(filter_frame, text="до").pack(side=tk.LEFT)
+        ttk.Entry(filter_frame, textvariable=self.filter_amount_max, width=8).pack(side=tk.LEFT, padx=2)
+        ttk.Button(filter_frame, text="✗ Сбросить", command=self.reset_filter).pack(side=tk.LEFT, padx=5)
+
+        for variable in (self.filter_name, self.filter_period_from, self.filter_period_to,
+                         self.filter_category, self.filter_amount_min, self.filter_amount_max):
+            variable.trace_add('write', self.schedule_filter)
+
         # Фрейм с таблицей услуг
         tree_frame = ttk.Frame(parent)
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -366,6 +374,7 @@ class EPDGuiApp:
         # Сохраняем ссылку на дерево
         self.services_tree = tree
         self.services_checkboxes = {}
+        self.service_index = ServiceIndex()
 
     def setup_summary_tab(self):
         """Настройка вкладки с итогами"""
@@ -392,94 +401,223 @@ class EPDGuiApp:
             self.status_label.config(text=f"Загружено файлов: {len(self.loaded_files)}")
 
     def process_files(self):
-        """Обработка всех загруженных файлов"""
+        """Обработка всех загруженных файлов: разбор в рабочем потоке, таблица пополняется по мере готовности"""
         if not self.loaded_files:
             messagebox.showwarning("Предупреждение", "Сначала загрузите PDF файлы!")
             return
 
-        self.parsed_data = []
-        success_count = 0
-        error_count = 0
-
-        for file_path in self.loaded_files:
+        time_limit = None
+        if self.use_time_limit.get():
             try:
-                self.status_label.config(text=f"Обработка: {Path(file_path).name}...")
-                self.root.update()
-
-                parser = EPDParser()
-                data = parser.parse_pdf(file_path)
-                data['file_path'] = file_path
+                time_limit = float(self.time_limit.get().replace(',', '.'))
+            except ValueError:
+                time_limit = 0
+            if time_limit <= 0:
+                messagebox.showwarning("Предупреждение", "Укажите лимит времени на файл в секундах!")
+                return
 
-                # Отладочная информация
-                print(f"\n=== Обработан файл: {Path(file_path).name} ===")
-                print(f"Период: {data.get('период')}")
-                print(f"Лицевой счет: {data.get('лицевой_счет')}")
-                print(f"Жилищных услуг: {len(data.get('жилищные_услуги', []))}")
-                print(f"Коммунальных услуг: {len(data.get('коммунальные_услуги', []))}")
-                print(f"Итого без страхования: {data.get('итого_к_оплате_без_страхования')}")
+        self.parsed_data = []
+        self.rollups = AccountRollups()
+        self.parse_counts = {'success': 0, 'error': 0, 'duplicate': 0, 'quarantine': 0}
+        self.parse_duplicates = DuplicateDetector()
 
-                self.parsed_data.append(data)
-                success_count += 1
+        self.clear_services_table()
 
-            except Exception as e:
-                error_count += 1
+        # Побайтовые копии отсекаем до парсинга, перерисованные - по ключу квитанции
+        to_parse = []
+        for file_path in self.loaded_files:
+            try:
+                digest = file_hash(file_path)
+            except OSError as e:
+                self.parse_counts['error'] += 1
                 print(f"Ошибка при обработке {file_path}: {e}")
-                import traceback
-                traceback.print_exc()
+                continue
+            self.file_hashes[file_path] = digest
+            original = self.parse_duplicates.check_hash(digest, file_path)
+            if original:
+                self.parse_counts['duplicate'] += 1
+                print(f"Пропущен дубликат {Path(file_path).name} (совпадает с {Path(original).name})")
+                continue
+            to_parse.append(file_path)
+
+        # Окно не блокируется: файлы разбирает рабочий поток, а главный поток забирает
+        # готовые результаты по таймеру
+        for button in self.action_buttons:
+            button.state(['disabled'])
+        self.parse_results = queue.Queue()
+        threading.Thread(target=self.parse_worker, args=(to_parse, self.parse_results, time_limit),
+                         daemon=True).start()
+        self.root.after(PARSE_POLL_MS, self.poll_parse_results)
+
+    def parse_worker(self, file_paths: List[str], results: queue.Queue, time_limit: Optional[float] = None):
+        """
+        Рабочий поток: результаты разбора в порядке файлов, в конце - None.
+        С лимитом времени файлы разбирают процессы-исполнители под надзором (epd_watchdog)
+        """
+        try:
+            if time_limit:
+                # Исполнители запускаются через spawn: копировать fork-ом процесс с Tk и потоками небезопасно
+                supervisor = SupervisedParser(time_limit=time_limit, parser_class=EPDParser,
+                                              templates=GUI_TEMPLATES, start_method='spawn')
+                parsed_files = supervisor.iter_parse(file_paths, ordered=True)
+            else:
+                parsed_files = self.parser.iter_parse(file_paths)
+            for item in parsed_files:
+                results.put(item)
+        except Exception as e:
+            results.put((None, e, {}))
+        results.put(None)
 
-        self.status_label.config(text=f"Обработано: {success_count} успешно, {error_count} с ошибками")
+    def poll_parse_results(self):
+        """Добавляет в таблицу документы, разобранные с прошлого опроса (главный поток)"""
+        added = False
+        while True:
+            try:
+                item = self.parse_results.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                if added:
+                    self.apply_filter()
+                self.finish_processing()
+                return
+            added = self.add_parsed_file(*item) or added
+
+        # Новые строки показываются с учетом фильтра, установленного во время разбора
+        if added:
+            self.apply_filter()
+        self.root.after(PARSE_POLL_MS, self.poll_parse_results)
+
+    def add_parsed_file(self, file_path: str, parsed: Union[List[Dict], Exception], timings: Dict) -> bool:
+        """Добавляет квитанции одного файла; True, если в таблице появились строки"""
+        counts = self.parse_counts
+        if isinstance(parsed, Exception):
+            quarantined = isinstance(parsed, ParseError) and parsed.quarantined
+            counts['quarantine' if quarantined else 'error'] += 1
+            details = parsed.details if isinstance(parsed, ParseError) else parsed
+            print(f"Ошибка при обработке {file_path}: {details}")
+            return False
+
+        added = False
+        for data in parsed:
+            data['file_path'] = file_path
+            original = self.parse_duplicates.check_bill(data, file_path)
+            if original:
+                counts['duplicate'] += 1
+                print(f"Пропущен дубликат {Path(file_path).name} (та же квитанция, что {Path(original).name})")
+                continue
 
-        # Обновляем отображение
+            # Отладочная информация
+            print(f"\n=== Обработан файл: {Path(file_path).name} за {timings['parse']:.2f} с ===")
+            print(f"Период: {data.get('период')}")
+            print(f"Лицевой счет: {data.get('лицевой_счет')}")
+            print(f"Жилищных услуг: {len(data.get('жилищные_услуги', []))}")
+            print(f"Коммунальных услуг: {len(data.get('коммунальные_услуги', []))}")
+            print(f"Итого без страхования: {data.get('итого_к_оплате_без_страхования')}")
+
+            # Повторная квитанция того же счета за тот же период заменяет предыдущую
+            replaced = self.rollups.add(data)
+            if replaced is not None:
+                self.remove_document(replaced)
+            self.parsed_data.append(data)
+            self.display_document(data)
+            counts['success'] += 1
+            added = True
+
+        self.status_label.config(text=f"Обработано документов: {counts['success']}, "
+                                      f"последний файл: {Path(file_path).name}")
+        return added
+
+    def finish_processing(self):
+        """Итоги запуска после разбора последнего файла"""
+        counts = self.parse_counts
+        self.parse_results = None
+        for button in self.action_buttons:
+            button.state(['!disabled'])
+
+        self.update_filter_choices()
+        status = (f"Обработано: {counts['success']} успешно, {counts['error']} с ошибками, "
+                  f"{counts['duplicate']} дубликатов пропущено")
+        if counts['quarantine']:
+            status += f", {counts['quarantine']} снято по лимиту времени"
+        self.status_label.config(text=status)
+
+        # Обновляем итоги
         if self.parsed_data:
-            self.display_all_data()
+            self.update_summary()
+            self.display_file_info(self.parsed_data[0])
 
             # Выводим детальную информацию
             total_services = sum(len(d.get('жилищные_услуги', [])) + len(d.get('коммунальные_услуги', []))
                                for d in self.parsed_data)
+            quarantine = f"Снято по лимиту времени: {counts['quarantine']}\n" if counts['quarantine'] else ""
             messagebox.showinfo("Успех",
-                              f"Обработано документов: {success_count}\n"
+                              f"Обработано документов: {counts['success']}\n"
+                              f"Пропущено дубликатов: {counts['duplicate']}\n"
+                              f"{quarantine}"
                               f"Найдено услуг: {total_services}\n\n"
                               f"Проверьте консоль для подробной информации.")
 
-    def display_all_data(self):
-        """Отображение всех данных в таблицах"""
-        # Очищаем таблицу
-        for item in self.services_tree.get_children():
-            self.services_tree.delete(item)
+    def clear_services_table(self):
+        """Очистка таблицы услуг (вместе со строками, скрытыми фильтром) и ее индекса"""
+        items = set(self.services_tree.get_children()) | set(self.services_checkboxes)
+        if items:
+            self.services_tree.delete(*items)
 
         self.services_checkboxes = {}
+        self.service_index = ServiceIndex()
+        self.filtered = False
 
-        # Заполняем таблицу данными из всех документов
-        for data in self.parsed_data:
-            period = data.get('период', 'Н/Д')
+    def display_document(self, data: Dict):
+        """Добавление услуг одного документа в таблицу"""
+        period = data.get('период', 'Н/Д')
 
-            # Жилищные услуги
-            for service in data.get('жилищные_услуги', []):
+        for category, key, label in (('housing', 'жилищные_услуги', 'Жилищные'),
+                                     ('utility', 'коммунальные_услуги', 'Коммунальные')):
+            for service in data.get(key, []):
                 item_id = self.services_tree.insert('', 'end', values=(
                     '☑',  # По умолчанию выбрано
                     period,
-                    'Жилищные',
+                    label,
                     service['название'],
                     f"{service['объем']:.2f}",
                     service['ед_изм'],
                     f"{service['тариф']:.2f}",
                     f"{service['итого']:.2f}"
                 ))
-                self.services_checkboxes[item_id] = {'checked': True, 'data': service, 'category': 'housing'}
+                self.services_checkboxes[item_id] = {'checked': True, 'data': service, 'category': category,
+                                                     'file_path': data.get('file_path'), 'document': data}
+                self.service_index.add(item_id, service['название'], period, label, service['итого'])
+
+    def remove_document(self, data: Dict):
+        """Убирает документ (замененный повторной квитанцией) из данных и таблицы услуг"""
+        self.parsed_data = [document for document in self.parsed_data if document is not data]
+        items = [item_id for item_id, item in self.services_checkboxes.items() if item['document'] is data]
+        if items:
+            self.services_tree.delete(*items)
+        for item_id in items:
+            del self.services_checkboxes[item_id]
+            self.service_index.remove(item_id)
+
+    def rebuild_rollups(self):
+        """Итоги по счетам заново по parsed_data; замененные повторными квитанции отбрасываются"""
+        self.rollups = AccountRollups()
+        replaced = set()
+        for data in self.parsed_data:
+            old = self.rollups.add(data)
+            if old is not None:
+                replaced.add(id(old))
+        self.parsed_data = [data for data in self.parsed_data if id(data) not in replaced]
 
-            # Коммунальные услуги
-            for service in data.get('коммунальные_услуги', []):
-                item_id = self.services_tree.insert('', 'end', values=(
-                    '☑',  # По умолчанию выбрано
-                    period,
-                    'Коммунальные',
-                    service['название'],
-                    f"{service['объем']:.2f}",
-                    service['ед_изм'],
-                    f"{service['тариф']:.2f}",
-                    f"{service['итого']:.2f}"
-                ))
-                self.services_checkboxes[item_id] = {'checked': True, 'data': service, 'category': 'utility'}
+    def display_all_data(self):
+        """Отображение всех данных в таблицах"""
+        self.clear_services_table()
+
+        # Заполняем таблицу данными из всех документов
+        for data in self.parsed_data:
+            self.display_document(data)
+        self.update_filter_choices()
+        self.apply_filter()
 
         # Обновляем итоги
         self.update_summary()
@@ -488,6 +626,63 @@ class EPDGuiApp:
         if self.parsed_data:
             self.display_file_info(self.parsed_data[0])
 
+    def update_filter_choices(self):
+        """Периоды загруженных документов - варианты для полей «Период с/по»"""
+        periods = sorted({data.get('период') for data in self.parsed_data if period_key(data.get('период'))},
+                         key=period_key)
+        self.period_from_box.config(values=periods)
+        self.period_to_box.config(values=periods)
+
+    def schedule_filter(self, *args):
+        """Применяет фильтр после короткой паузы ввода, а не на каждую букву"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(150, self.apply_filter)
+
+    def filter_criteria(self) -> Dict:
+        """Параметры ServiceIndex.search из панели фильтров (пустые поля не фильтруют)"""
+        criteria = {}
+        if self.filter_name.get().strip():
+            criteria['name'] = self.filter_name.get()
+        if period_key(self.filter_period_from.get().strip()):
+            criteria['period_from'] = self.filter_period_from.get().strip()
+        if period_key(self.filter_period_to.get().strip()):
+            criteria['period_to'] = self.filter_period_to.get().strip()
+        if self.filter_category.get() != 'Все':
+            criteria['categories'] = [self.filter_category.get()]
+        for key, variable in (('amount_min', self.filter_amount_min), ('amount_max', self.filter_amount_max)):
+            try:
+                criteria[key] = float(variable.get().replace(',', '.').replace(' ', ''))
+            except ValueError:
+                pass
+        return criteria
+
+    def apply_filter(self):
+        """Показывает в таблице только строки, прошедшие фильтр; галочки скрытых строк сохраняются"""
+        self.filter_job = None
+        criteria = self.filter_criteria()
+        if not criteria and not self.filtered:
+            return
+
+        visible = self.service_index.search(**criteria)
+        tree = self.services_tree
+        attached = tree.get_children()
+        if attached:
+            tree.detach(*attached)
+        for item in visible:
+            tree.move(item, '', 'end')
+        self.filtered = bool(criteria)
+
+        if criteria:
+            self.status_label.config(text=f"Показано строк: {len(visible)} из {len(self.service_index)}")
+
+    def reset_filter(self):
+        """Сброс всех фильтров"""
+        for variable in (self.filter_name, self.filter_period_from, self.filter_period_to,
+                         self.filter_amount_min, self.filter_amount_max):
+            variable.set('')
+        self.filter_category.set('Все')
+
     def toggle_checkbox(self, event, tree):
         """Переключение чекбокса при клике"""
         region = tree.identify("region", event.x, event.y)
@@ -504,10 +699,10 @@ class EPDGuiApp:
                     self.update_summary()
 
     def select_all_services(self, select):
-        """Выбрать/снять все услуги"""
+        """Выбрать/снять все услуги (при фильтре - только показанные)"""
         symbol = '☑' if select else '☐'
 
-        for item in self.services_checkboxes:
+        for item in self.services_tree.get_children():
             self.services_checkboxes[item]['checked'] = select
             values = list(self.services_tree.item(item, 'values'))
             values[0] = symbol
@@ -515,16 +710,156 @@ class EPDGuiApp:
 
         self.update_summary()
 
+    def unchecked_services(self) -> List[Tuple[str, str, str]]:
+        """Снятые галочки как (файл, категория, название услуги)"""
+        return [(item['file_path'], item['category'], item['data']['название'])
+                for item in self.services_checkboxes.values() if not item['checked']]
+
+    def apply_unchecked(self, unchecked):
+        """Снимает галочки у услуг из списка (файл, категория, название)"""
+        keys = {tuple(key) for key in unchecked}
+        for item_id, item in self.services_checkboxes.items():
+            if (item['file_path'], item['category'], item['data']['название']) in keys:
+                item['checked'] = False
+                values = list(self.services_tree.item(item_id, 'values'))
+                values[0] = '☐'
+                self.services_tree.item(item_id, values=values)
+        self.update_summary()
+
+    def save_workspace(self):
+        """Сохранение сеанса: файлы, результаты разбора и выбор услуг"""
+        if not self.loaded_files:
+            messagebox.showwarning("Предупреждение", "Нет данных для сохранения!")
+            return
+
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=SNAPSHOT_EXTENSION,
+            filetypes=[("Сеанс ЕПД", f"*{SNAPSHOT_EXTENSION}"), ("All files", "*.*")],
+            initialfile=f"EPD_Сеанс_{datetime.now().strftime('%Y%m%d_%H%M%S')}{SNAPSHOT_EXTENSION}"
+        )
+        if not file_path:
+            return
+
+        try:
+            files = []
+            for path in self.loaded_files:
+                # Файлы, загруженные, но еще не обработанные, хешируем при сохранении
+                if path not in self.file_hashes and Path(path).exists():
+                    self.file_hashes[path] = file_hash(path)
+                files.append({'path': path, 'hash': self.file_hashes.get(path)})
+
+            save_snapshot(file_path, files, self.parsed_data, self.unchecked_services(),
+                          self.include_insurance.get())
+            self.status_label.config(text=f"Сеанс сохранен в: {Path(file_path).name}")
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить сеанс:\n{str(e)}")
+
+    def open_workspace(self):
+        """Открытие сеанса без повторного разбора PDF; изменившиеся файлы перепроверяются в фоне"""
+        file_path = filedialog.askopenfilename(
+            title="Выберите файл сеанса",
+            filetypes=[("Сеанс ЕПД", f"*{SNAPSHOT_EXTENSION}"), ("All files", "*.*")]
+        )
+        if not file_path:
+            return
+
+        try:
+            snapshot = load_snapshot(file_path)
+        except Exception as e:
+            messagebox.showerror("Ошибка", f"Не удалось открыть сеанс:\n{str(e)}")
+            return
+
+        self.loaded_files = [entry['path'] for entry in snapshot['files']]
+        self.file_hashes = {entry['path']: entry['hash'] for entry in snapshot['files'] if entry['hash']}
+        self.parsed_data = snapshot['parsed_data']
+        self.rebuild_rollups()
+        self.include_insurance.set(snapshot['include_insurance'])
+
+        self.files_listbox.delete(0, tk.END)
+        for path in self.loaded_files:
+            self.files_listbox.insert(tk.END, Path(path).name)
+
+        self.display_all_data()
+        self.apply_unchecked(snapshot['unchecked'])
+
+        # Сверка по размеру и времени изменения не читает файлы; хеши изменившихся считает рабочий поток
+        stale = stale_files(snapshot['files'])
+        self.status_label.config(text=f"Открыт сеанс: {Path(file_path).name}, документов: {len(self.parsed_data)}, "
+                                      f"на перепроверку: {len(stale)}")
+        if stale:
+            self.start_revalidation(stale)
+
+    def start_revalidation(self, file_paths: List[str]):
+        """Перепроверка изменившихся файлов сеанса в рабочем потоке - окно не блокируется"""
+        for button in self.action_buttons:
+            button.state(['disabled'])
+        self.revalidation_changed = False
+        self.parse_results = queue.Queue()
+        known = {path: self.file_hashes.get(path) for path in file_paths}
+        threading.Thread(target=self.revalidate_worker, args=(known, self.parse_results), daemon=True).start()
+        self.root.after(PARSE_POLL_MS, self.poll_revalidation)
+
+    def revalidate_worker(self, known: Dict[str, Optional[str]], results: queue.Queue):
+        """Рабочий поток: (путь, хеш, квитанции) файлов, содержимое которых изменилось; в конце - None"""
+        for path, digest in known.items():
+            try:
+                if not Path(path).exists():
+                    print(f"Файл сеанса не найден: {path} (данные сохранены из снимка)")
+                    continue
+                new_digest = file_hash(path)
+                if new_digest != digest:
+                    # Содержимое изменилось - разбираем файл заново (пачка дает несколько квитанций)
+                    bills = self.parser.parse_pdf(path)
+                    if not bills:
+                        raise Exception("квитанции не найдены")
+                    results.put((path, new_digest, bills))
+            except Exception as e:
+                print(f"Ошибка при перепроверке {path}: {e}")
+        results.put(None)
+
+    def poll_revalidation(self):
+        """Заменяет квитанции файлов, разобранных заново с прошлого опроса (главный поток)"""
+        while True:
+            try:
+                item = self.parse_results.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.finish_revalidation()
+                return
+            path, digest, bills = item
+            for data in bills:
+                data['file_path'] = path
+            self.parsed_data = [d for d in self.parsed_data if d.get('file_path') != path] + bills
+            self.file_hashes[path] = digest
+            self.revalidation_changed = True
+            print(f"Файл изменился и разобран заново: {Path(path).name}")
+        self.root.after(PARSE_POLL_MS, self.poll_revalidation)
+
+    def finish_revalidation(self):
+        """Пересобирает таблицу один раз после перепроверки, сохранив снятые галочки"""
+        self.parse_results = None
+        for button in self.action_buttons:
+            button.state(['!disabled'])
+        if self.revalidation_changed:
+            unchecked = self.unchecked_services()
+            self.rebuild_rollups()
+            self.display_all_data()
+            self.apply_unchecked(unchecked)
+            self.status_label.config(text="Перепроверка сеанса завершена, изменившиеся файлы разобраны заново")
+
     def on_file_select(self, event):
         """Обработка выбора файла из списка"""
         selection = self.files_listbox.curselection()
         if not selection:
             return
 
-        index = selection[0]
-        if index < len(self.parsed_data):
-            data = self.parsed_data[index]
-            self.display_file_info(data)
+        # Дубликаты и файлы с ошибками не попадают в parsed_data, поэтому ищем по пути
+        file_path = self.loaded_files[selection[0]]
+        for data in self.parsed_data:
+            if data.get('file_path') == file_path:
+                self.display_file_info(data)
+                break
 
     def display_file_info(self, data):
         """Отображение информации о выбранном файле"""
@@ -616,32 +951,24 @@ class EPDGuiApp:
 
 """
 
-        # Детализация по периодам
-        periods_summary = {}
-        for data in self.parsed_data:
-            period = data.get('период', 'Н/Д')
-            if period not in periods_summary:
-                periods_summary[period] = {'housing': 0.0, 'utility': 0.0, 'insurance': 0.0}
-
-            # Жилищные
-            for service in data.get('жилищные_услуги', []):
-                periods_summary[period]['housing'] += service['итого']
-
-            # Коммунальные
-            for service in data.get('коммунальные_услуги', []):
-                periods_summary[period]['utility'] += service['итого']
-
-            # Страхование
-            if data.get('страхование'):
-                periods_summary[period]['insurance'] += data['страхование']
-
-        for period, sums in periods_summary.items():
-            total = sums['housing'] + sums['utility'] + sums['insurance']
-            summary += f"\n   📅 {period}:\n"
+        # Детализация по счетам и периодам - из инкрементальных итогов, без пересчета
+        for (account, period), sums in self.rollups.period_breakdown().items():
+            summary += f"\n   📅 {period} (счет {account}):\n"
             summary += f"      Жилищные: {sums['housing']:.2f} руб.\n"
             summary += f"      Коммунальные: {sums['utility']:.2f} руб.\n"
             summary += f"      Страхование: {sums['insurance']:.2f} руб.\n"
-            summary += f"      ➜ Итого: {total:.2f} руб.\n"
+            summary += f"      ➜ Итого: {sums['total']:.2f} руб.\n"
+
+        if len(self.rollups.by_account) > 1:
+            summary += "\n\n🏠 ИТОГИ ПО ЛИЦЕВЫМ СЧЕТАМ:\n"
+            for account, sums in sorted(self.rollups.by_account.items()):
+                summary += f"\n   {account}: {sums['total']:.2f} руб. ({sums['bills']} квит.)"
+
+        if len(self.rollups.by_building) > 1:
+            summary += "\n\n🏢 ИТОГИ ПО ДОМАМ:\n"
+            for building, sums in sorted(self.rollups.by_building.items()):
+                if sums['bills']:
+                    summary += f"\n   {building}: {sums['total']:.2f} руб. ({sums['bills']} квит.)"
 
         self.summary_text.delete('1.0', tk.END)
         self.summary_text.insert('1.0', summary)
@@ -711,15 +1038,14 @@ class EPDGuiApp:
         if messagebox.askyesno("Подтверждение", "Очистить все загруженные данные?"):
             self.loaded_files = []
             self.parsed_data = []
+            self.rollups = AccountRollups()
             self.files_listbox.delete(0, tk.END)
             self.info_text.delete('1.0', tk.END)
             self.summary_text.delete('1.0', tk.END)
 
-            for item in self.services_tree.get_children():
-                self.services_tree.delete(item)
-
-            self.services_checkboxes = {}
+            self.clear_services_table()
             self.include_insurance.set(False)
+            self.file_hashes = {}
 
             self.status_label.config(text="Данные очищены. Готов к работе.")
 
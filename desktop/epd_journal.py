@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Журнал пакетной обработки ЕПД для продолжения после сбоя
+
+Журнал - файл JSON Lines, в который после каждого обработанного файла
+дописывается строка: путь, хеш содержимого, статус и результат разбора
+(список квитанций файла).
+При запуске с --resume файлы, уже записанные в журнал с тем же хешем, не
+разбираются повторно - их результаты берутся из журнала, поэтому итоговые
+файлы совпадают с результатом непрерывного запуска байт в байт.
+Файлы, разбор которых закончился ошибкой или карантином, при продолжении
+разбираются заново: сбой мог быть временным (нехватка памяти, снятый процесс).
+
+В памяти держатся только путь, хеш, статус и смещение строки в журнале;
+результат файла читается с диска, когда он нужен при продолжении, поэтому
+журнал не мешает потоковому режиму работать с постоянной памятью.
+"""
+
+import json
+import os
+import re
+import shutil
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+
+JOURNAL_VERSION = 2
+JOURNAL_NAME = '.epd_journal.jsonl'
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+# Статусы, с которыми файл при продолжении разбирается заново
+RETRY_STATUSES = ('error', 'quarantine')
+
+_CORE_DATES_RE = re.compile(rb'(<dcterms:(?:created|modified)[^>]*>)[^<]*')
+
+
+class BatchJournal:
+    """Журнал завершенных файлов (только дописывание)"""
+
+    def __init__(self, path: Union[str, Path], resume: bool = False):
+        self.path = Path(path)
+        self.entries = {}
+        self.header = None
+
+        if resume and self.path.exists():
+            self._load()
+        if self.header is None:
+            self.entries = {}
+            self.header = {'journal': JOURNAL_VERSION, 'started': datetime.now().strftime(TIMESTAMP_FORMAT)}
+            with open(self.path, 'wb') as file:
+                file.write(_encode(self.header))
+
+        self.file = open(self.path, 'ab')
+        if self.file.tell() and not _ends_with_newline(self.path):
+            # Недописанная строка сбоя - следующая запись начинается с новой строки
+            self.file.write(b'\n')
+
+    def _load(self):
+        """Читает журнал без результатов; недописанная последняя строка (сбой во время записи) пропускается"""
+        with open(self.path, 'rb') as file:
+            offset = 0
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = {}
+                if 'journal' in record:
+                    if record['journal'] != JOURNAL_VERSION:
+                        # Журнал другой версии программы - начинаем заново
+                        return
+                    self.header = record
+                elif 'path' in record:
+                    self.entries[record['path']] = {'path': record['path'], 'hash': record['hash'],
+                                                    'status': record['status'], 'offset': offset}
+                offset += len(line)
+
+    @property
+    def started(self) -> str:
+        """Время начала пакета - общее для исходного запуска и всех продолжений"""
+        return self.header['started']
+
+    @property
+    def started_at(self) -> datetime:
+        return datetime.strptime(self.started, TIMESTAMP_FORMAT)
+
+    def completed(self, pdf_path: Union[str, Path], digest: str) -> Optional[Dict]:
+        """
+        Запись журнала о файле (путь, хеш, статус), если он уже обработан и с тех пор не менялся.
+        Файл с ошибкой или в карантине не считается обработанным - его разбирают заново
+        """
+        entry = self.entries.get(str(pdf_path))
+        if entry is not None and entry['hash'] == digest and entry['status'] not in RETRY_STATUSES:
+            return entry
+        return None
+
+    def result(self, entry: Dict) -> Optional[List[Dict]]:
+        """Квитанции файла из записи журнала - читаются с диска по смещению строки"""
+        with open(self.path, 'rb') as file:
+            file.seek(entry['offset'])
+            return json.loads(file.readline())['result']
+
+    def record(self, pdf_path: Union[str, Path], digest: str, status: str, result: List[Dict] = None):
+        """Дописывает запись и сбрасывает её на диск до перехода к следующему файлу"""
+        offset = self.file.tell()
+        self.file.write(_encode({'path': str(pdf_path), 'hash': digest, 'status': status, 'result': result}))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.entries[str(pdf_path)] = {'path': str(pdf_path), 'hash': digest, 'status': status, 'offset': offset}
+
+    def close(self):
+        self.file.close()
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with open(path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
+
+
+def _encode(record: Dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def make_reproducible(xlsx_path: Union[str, Path], when: datetime):
+    """
+    Фиксирует в книге Excel все отметки времени (даты элементов архива и свойства
+    created/modified), чтобы одинаковые данные давали одинаковый файл
+    """
+    xlsx_path = Path(xlsx_path)
+    stamp = when.strftime('%Y-%m-%dT%H:%M:%SZ').encode()
+    temp_path = xlsx_path.with_name(xlsx_path.name + '.tmp')
+
+    with zipfile.ZipFile(xlsx_path) as source, zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            fixed = zipfile.ZipInfo(info.filename, date_time=when.timetuple()[:6])
+            fixed.compress_type = zipfile.ZIP_DEFLATED
+            fixed.external_attr = info.external_attr
+
+            if info.filename == 'docProps/core.xml':
+                data = _CORE_DATES_RE.sub(lambda match: match.group(1) + stamp, source.read(info))
+                target.writestr(fixed, data)
+                continue
+
+            with source.open(info) as member, target.open(fixed, 'w') as output:
+                shutil.copyfileobj(member, output)
+
+    os.replace(temp_path, xlsx_path)
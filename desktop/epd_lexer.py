@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Лексер строк таблицы начислений ЕПД
+
+Вместо набора проверок подстрок и 6-9 регулярных выражений на каждую строку
+строка классифицируется одним автоматом по всем ключевым словам разделов, а
+строки внутри раздела один раз разбиваются на типизированные токены (слово,
+число со значением, единица измерения). Разбор строки услуги работает уже с
+токенами, без повторного поиска по тексту.
+
+Запуск как скрипта - сравнение с прежним построчным разбором:
+    python epd_lexer.py [файл.pdf]
+"""
+
+import re
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Токены строки
+WORD = 'word'          # слово или несколько слов подряд через пробел
+AMOUNT = 'amount'      # число с двумя и более знаками после запятой (суммы, тарифы)
+NUMBER = 'number'      # дробное число с одним знаком после запятой
+INTEGER = 'integer'
+UNIT = 'unit'
+OTHER = 'other'        # любые другие символы (точки, дефисы, латиница)
+
+# Токен - кортеж (вид, текст, значение); значение есть только у чисел
+Token = Tuple[str, str, Optional[float]]
+
+# Ключевые слова -> класс строки, с теми же правилами регистра, что и в прежнем разборе:
+# разделы, страхование и «Всего за» - в написании ЕПД, заголовки таблицы - без учета регистра.
+# Прежняя проверка конца раздела 'Итого к оплате' in line.lower() не срабатывала никогда
+# (в образце заглавная буква), поэтому «Итого к оплате» раздел не завершает
+SECTION_KEYWORDS = {
+    'Начисления за жилищные услуги': 'жилищные_услуги',
+    'Начисления за коммунальные услуги': 'коммунальные_услуги',
+    'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ': 'страхование',
+    'Всего за': 'конец',
+    'виды услуг': 'заголовок',
+    'объем услуг': 'заголовок',
+    'начислено по тарифу': 'заголовок',
+}
+
+# Ключевые слова, которые ищутся без учета регистра
+IGNORE_CASE_KEYWORDS = ('виды услуг', 'объем услуг', 'начислено по тарифу')
+
+# Если в строке несколько ключевых слов, побеждает класс, стоящий раньше
+LINE_KINDS = ('жилищные_услуги', 'коммунальные_услуги', 'страхование', 'конец', 'заголовок')
+
+UNIT_PATTERN = r'кв\.м\.|куб\.\s*м\.|к[вВ]т[\./]?ч|Гкал'
+
+# Слово продолжается через пробел, только если дальше не единица измерения:
+# иначе «ПЛОЩАДЬ кв.м.» дало бы слово «ПЛОЩАДЬ кв» и единица бы потерялась
+TOKEN_RE = re.compile(
+    r'(?P<unit>' + UNIT_PATTERN + r')'
+    r'|(?P<amount>\d+[,.]\d{2,})'
+    r'|(?P<number>\d+[,.]\d)'
+    r'|(?P<integer>\d+)'
+    r'|(?P<word>[А-ЯЁа-яё()/]+(?:[ \t]+(?!' + UNIT_PATTERN + r')[А-ЯЁа-яё()/]+)*)'
+    r'|(?P<other>[^\sА-ЯЁа-яё()/\d]+)'
+)
+
+# Заглавные буквы: проверка пересечением множеств вместо re.search(r'[А-ЯЁ]', ...)
+_UPPERCASE_LETTERS = frozenset('АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ')
+
+_NUMERIC = frozenset((AMOUNT, NUMBER, INTEGER))
+
+
+def _trie(keywords: Iterable[str]) -> Dict:
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return trie
+
+
+def _trie_pattern(trie: Dict) -> str:
+    """Регулярное выражение из префиксного дерева: общие префиксы ключевых слов проверяются один раз"""
+    end = '' in trie
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(trie.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 and not end else '(?:' + '|'.join(branches) + ')'
+    return pattern + '?' if end else pattern
+
+
+class KeywordAutomaton:
+    """
+    Автомат поиска сразу всех ключевых слов (в духе Ахо-Корасик): слова собираются
+    в префиксное дерево, которое компилируется в одно регулярное выражение, так что
+    строка просматривается за один проход на уровне C. Слова из ignore_case (в нижнем
+    регистре) находятся в любом регистре
+    """
+
+    def __init__(self, keywords: Dict[str, str], priority: Iterable[str], ignore_case: Iterable[str] = ()):
+        self.keywords = dict(keywords)
+        self._rank = {kind: rank for rank, kind in enumerate(priority)}
+
+        folded = set(ignore_case)
+        branches = []
+        exact = [keyword for keyword in self.keywords if keyword not in folded]
+        if exact:
+            branches.append(_trie_pattern(_trie(exact)))
+        if folded:
+            branches.append('(?i:' + _trie_pattern(_trie(folded)) + ')')
+        self.pattern = re.compile('|'.join(branches))
+
+    def _kind(self, match: str) -> str:
+        kind = self.keywords.get(match)
+        return kind if kind is not None else self.keywords[match.lower()]
+
+    def classify(self, line: str) -> Optional[str]:
+        """Класс строки по найденным ключевым словам (None - ключевых слов нет)"""
+        found = self.pattern.findall(line)
+        if not found:
+            return None
+        if len(found) == 1:
+            return self._kind(found[0])
+        return min((self._kind(match) for match in found), key=self._rank.__getitem__)
+
+
+SECTIONS = KeywordAutomaton(SECTION_KEYWORDS, LINE_KINDS, IGNORE_CASE_KEYWORDS)
+
+
+def tokenize(line: str) -> List[Token]:
+    """Разбивает строку на токены; числа сразу получают значение"""
+    tokens = []
+    for match in TOKEN_RE.finditer(line):
+        kind = match.lastgroup
+        text = match.group()
+        tokens.append((kind, text, float(text.replace(',', '.')) if kind in _NUMERIC else None))
+    return tokens
+
+
+def parse_service_row(tokens: List[Token]) -> Optional[Dict]:
+    """Строка услуги из токенов за один проход: название, объем, ед. изм., тариф и итог (последнее число)"""
+    numbers = []
+    words = []
+    unit = ''
+    has_amount = False
+    has_uppercase = False
+
+    for kind, text, value in tokens:
+        if kind == WORD:
+            words.append(text)
+            if not has_uppercase and not _UPPERCASE_LETTERS.isdisjoint(text):
+                has_uppercase = True
+        elif kind == AMOUNT:
+            has_amount = True
+            numbers.append(value)
+        elif kind == NUMBER:
+            numbers.append(value)
+        elif kind == UNIT:
+            # Заглавная буква в единице («кВтч», «Гкал») тоже считается, как в прежнем разборе
+            if not has_uppercase and not _UPPERCASE_LETTERS.isdisjoint(text):
+                has_uppercase = True
+            if not unit:
+                unit = text
+
+    if not has_amount or not has_uppercase or numbers[-1] <= 0:
+        return None
+
+    # Название - слова в начале строки до первого числа или другого символа
+    service_name = tokens[0][1] if tokens[0][0] == WORD else ' '.join(words)[:50]
+
+    return {
+        'название': service_name,
+        'объем': numbers[0] if len(numbers) >= 2 else 0.0,
+        'ед_изм': unit,
+        'тариф': numbers[1] if len(numbers) >= 3 else 0.0,
+        'итого': numbers[-1]
+    }
+
+
+def parse_service_lines(text: str) -> Tuple[Dict[str, List[Dict]], Optional[float]]:
+    """Услуги по разделам и сумма добровольного страхования за один проход по строкам"""
+    services = {'жилищные_услуги': [], 'коммунальные_услуги': []}
+    insurance = None
+    current_section = None
+
+    for line in text.split('\n'):
+        kind = SECTIONS.classify(line)
+        if kind in services:
+            current_section = kind
+            continue
+        elif kind == 'страхование':
+            amounts = [value for kind, _, value in tokenize(line) if kind == AMOUNT]
+            if amounts:
+                insurance = amounts[-1]
+            current_section = None
+            continue
+        elif kind == 'конец':
+            current_section = None
+            continue
+
+        if not current_section or kind == 'заголовок':
+            continue
+
+        service = parse_service_row(tokenize(line))
+        if service:
+            services[current_section].append(service)
+
+    return services, insurance
+
+
+def _regex_parse_amount(text: str) -> float:
+    clean_text = re.sub(r'[^\d,.\s]', '', text).replace(' ', '').replace(',', '.')
+    try:
+        return float(clean_text)
+    except ValueError:
+        return 0.0
+
+
+def _regex_parse_service_lines(text: str) -> Tuple[Dict[str, List[Dict]], Optional[float]]:
+    """
+    Прежний построчный разбор подстроками и регулярными выражениями - эталон для benchmark.
+    Единственное расхождение с лексером: если единица измерения идет сразу за названием
+    («ПЛОЩАДЬ кв.м. ...»), прежний разбор включал ее начало в название («ПЛОЩАДЬ кв»)
+    """
+    services = {'жилищные_услуги': [], 'коммунальные_услуги': []}
+    insurance = None
+    current_section = None
+
+    for line in text.split('\n'):
+        line_stripped = line.strip()
+
+        if 'Начисления за жилищные услуги' in line:
+            current_section = 'жилищные_услуги'
+            continue
+        elif 'Начисления за коммунальные услуги' in line:
+            current_section = 'коммунальные_услуги'
+            continue
+        elif 'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ' in line:
+            numbers = re.findall(r'\d+[,\.]\d{2}', line)
+            if numbers:
+                insurance = _regex_parse_amount(numbers[-1])
+            current_section = None
+            continue
+        elif 'Всего за' in line or 'Итого к оплате' in line.lower():
+            current_section = None
+            continue
+
+        if not current_section:
+            continue
+        if not line_stripped or any(keyword in line_stripped.lower() for keyword in
+                                   ['виды услуг', 'объем услуг', 'начислено по тарифу']):
+            continue
+
+        if re.search(r'[А-ЯЁ]', line) and re.search(r'\d+[,\.]\d{2}', line):
+            numbers = re.findall(r'\d+[,\.]\d+', line)
+            if not numbers:
+                continue
+            total = _regex_parse_amount(numbers[-1])
+            if total <= 0:
+                continue
+
+            name_match = re.match(r'^([А-ЯЁа-яё\s\(\)/]+?)(?:\s+\d)', line_stripped)
+            if not name_match:
+                name_match = re.match(r'^([А-ЯЁа-яё\s\(\)/]+)', line_stripped)
+            if name_match:
+                service_name = name_match.group(1).strip()
+            else:
+                words = line_stripped.split()
+                service_name = ' '.join([w for w in words if not re.search(r'\d', w)])[:50]
+
+            unit_match = re.search(r'(кв\.м\.|куб\.\s*м\.|к[вВ]т[\./]?ч|Гкал)', line_stripped)
+            unit = unit_match.group(1) if unit_match else ''
+            volume = _regex_parse_amount(numbers[0]) if len(numbers) >= 2 else 0.0
+            tariff = _regex_parse_amount(numbers[1]) if len(numbers) >= 3 else 0.0
+
+            services[current_section].append({
+                'название': service_name,
+                'объем': volume,
+                'ед_изм': unit,
+                'тариф': tariff,
+                'итого': total
+            })
+
+    return services, insurance
+
+
+class _RegexCounter:
+    """Подсчет вызовов регулярных выражений: подменяет функции модуля re и скомпилированные шаблоны"""
+
+    FUNCTIONS = ('search', 'match', 'findall', 'finditer', 'sub')
+
+    def __init__(self):
+        self.calls = 0
+        self._saved = []
+
+    def _counted(self, function):
+        def wrapper(*args, **kwargs):
+            self.calls += 1
+            return function(*args, **kwargs)
+        return wrapper
+
+    def __enter__(self):
+        module = sys.modules[__name__]
+        for name in self.FUNCTIONS:
+            self._saved.append((re, name, getattr(re, name)))
+            setattr(re, name, self._counted(getattr(re, name)))
+
+        counter = self
+
+        class CountedPattern:
+            def __init__(self, pattern):
+                self._pattern = pattern
+
+            def __getattr__(self, name):
+                return counter._counted(getattr(self._pattern, name))
+
+        self._saved.append((module, 'TOKEN_RE', TOKEN_RE))
+        module.TOKEN_RE = CountedPattern(TOKEN_RE)
+        self._saved.append((SECTIONS, 'pattern', SECTIONS.pattern))
+        SECTIONS.pattern = CountedPattern(SECTIONS.pattern)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for owner, name, value in reversed(self._saved):
+            setattr(owner, name, value)
+        self._saved.clear()
+
+
+def benchmark(text: str, repeat: int = 20):
+    """Сравнивает прежний разбор и лексер: одинаковый результат, вызовы регулярных выражений, время на строку"""
+    lines = text.count('\n') + 1
+    results = {}
+    for label, function in (('регулярные выражения', _regex_parse_service_lines), ('лексер', parse_service_lines)):
+        with _RegexCounter() as counter:
+            result = function(text)
+
+        # Лучшее из нескольких повторов - меньше шума от других процессов
+        elapsed = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function(text)
+            elapsed = min(elapsed, time.perf_counter() - started)
+
+        results[label] = result
+        print(f"{label:>22}: вызовов regex {counter.calls:>7}, "
+              f"{elapsed / lines * 1e6:.2f} мкс на строку ({lines} строк)")
+
+    same = results['регулярные выражения'] == results['лексер']
+    print(f"Результаты совпадают: {'да' if same else 'нет'}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from epd_parser import EPDParser
+
+        sample = EPDParser().extract_text_from_pdf(sys.argv[1])
+    else:
+        sample = '\n'.join([
+            'ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА Январь 2024',
+            'Лицевой счет: 5000000001',
+            'Виды услуг Объем услуг Ед.изм. Тариф Начислено по тарифу Итого',
+            'Начисления за жилищные услуги',
+            'СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ 54,30 кв.м. 32,15 1 745,75 1 745,75',
+            'ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ 54,30 кв.м. 15,50 841,65 841,65',
+            'Начисления за коммунальные услуги',
+            'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ 5,00 куб.м. 45,20 226,00 226,00',
+            'ГОРЯЧЕЕ ВОДОСНАБЖЕНИЕ 3,20 куб.м. 210,15 672,48 672,48',
+            'ЭЛЕКТРОЭНЕРГИЯ 150,00 кВтч 6,17 925,50 925,50',
+            'Всего за январь 2024: 4411,38',
+            'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ 54,30 кв.м. 1,50 81,45 81,45',
+        ] * 200)
+    benchmark(sample)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF-вложения писем как источник ЕПД: почтовый ящик mbox или папка с .eml
+
+Ящик читается потоком, по одному письму, поэтому память не зависит от его
+размера. Вложение адресуется путем «ящик.mbox/смещение письма/номер/имя.pdf»
+или «письмо.eml/номер/имя.pdf» и дальше обрабатывается как обычный файл:
+при разборе письмо читается заново по смещению, вложение декодируется в
+памяти. Одинаковые вложения (по хешу содержимого) берутся один раз; хеш
+считается при первом просмотре ящика и запоминается (epd_dedup.remember_hash),
+так что до разбора вложение повторно не декодируется.
+
+Строки «From » внутри писем mbox экранированы («>From », в формате mboxrd -
+«>>From » и т.д.); при чтении письма один «>» снимается.
+"""
+
+import email
+import email.policy
+import re
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from epd_dedup import content_hash, remember_hash
+
+
+ESCAPED_FROM_RE = re.compile(rb'^>+From ')
+
+
+def _is_separator(line: bytes, previous: Optional[bytes]) -> bool:
+    """Строка «From » в начале файла или после пустой строки начинает новое письмо"""
+    return line.startswith(b'From ') and (previous is None or not previous.strip())
+
+
+def _read_messages(file: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    """(смещение, письмо) из mbox, начиная с текущей позиции файла"""
+    offset = file.tell()
+    start = None
+    lines = []
+    previous = None
+    for line in file:
+        if _is_separator(line, previous):
+            if start is not None:
+                yield start, b''.join(lines)
+            start = offset
+            lines = []
+        elif start is not None:
+            lines.append(line[1:] if ESCAPED_FROM_RE.match(line) else line)
+        offset += len(line)
+        previous = line
+    if start is not None:
+        yield start, b''.join(lines)
+
+
+def iter_mbox(mbox_path: Union[str, Path]) -> Iterator[Tuple[int, bytes]]:
+    """(смещение, письмо) по порядку; в памяти только одно письмо"""
+    with open(mbox_path, 'rb') as file:
+        yield from _read_messages(file)
+
+
+def read_mbox_message(mbox_path: Union[str, Path], offset: int) -> bytes:
+    """Письмо mbox по смещению"""
+    with open(mbox_path, 'rb') as file:
+        file.seek(offset)
+        for _, message in _read_messages(file):
+            return message
+    raise ValueError(f"Нет письма со смещением {offset} в {mbox_path}")
+
+
+def _pdf_parts(message: bytes) -> Iterator[Tuple[int, str, email.message.Message]]:
+    """(номер части, имя, часть) PDF-вложений письма; содержимое еще не декодировано"""
+    parsed = email.message_from_bytes(message, policy=email.policy.default)
+    for number, part in enumerate(parsed.walk()):
+        if part.is_multipart():
+            continue
+        filename = part.get_filename() or ''
+        if part.get_content_type() != 'application/pdf' and not filename.lower().endswith('.pdf'):
+            continue
+        yield number, filename.replace('/', '_').replace('\\', '_') or f'вложение_{number}.pdf', part
+
+
+def pdf_attachments(message: bytes) -> Iterator[Tuple[int, str, bytes]]:
+    """(номер части, имя, содержимое) PDF-вложений письма"""
+    for number, name, part in _pdf_parts(message):
+        data = part.get_payload(decode=True)
+        if data:
+            yield number, name, data
+
+
+def _messages(source: Path) -> Iterator[Tuple[Path, bytes]]:
+    """(путь письма, письмо): письма mbox адресуются смещением, файлы .eml - своим путем"""
+    if source.is_dir():
+        for eml_path in sorted(source.rglob('*.eml')):
+            yield eml_path, eml_path.read_bytes()
+    else:
+        for offset, message in iter_mbox(source):
+            yield source / str(offset), message
+
+
+def find_mail_attachments(source: Union[str, Path]) -> List[Path]:
+    """Пути PDF-вложений ящика mbox или папки с .eml; повторы одного вложения отбрасываются"""
+    seen = set()
+    attachments = []
+    for message_path, message in _messages(Path(source)):
+        try:
+            for number, name, data in pdf_attachments(message):
+                digest = content_hash(data)
+                if digest not in seen:
+                    seen.add(digest)
+                    path = message_path / str(number) / name
+                    remember_hash(path, digest)
+                    attachments.append(path)
+        except Exception as e:
+            print(f"Ошибка при чтении письма {message_path}: {e}")
+    return attachments
+
+
+def read_attachment(container: Path, inner: str) -> bytes:
+    """Содержимое вложения по пути внутри ящика («смещение/номер/имя») или письма («номер/имя»)"""
+    parts = inner.split('/')
+    if container.suffix.lower() == '.eml':
+        message = container.read_bytes()
+    else:
+        message = read_mbox_message(container, int(parts.pop(0)))
+
+    # Декодируется только нужное вложение
+    number = int(parts[0])
+    for part_number, _, part in _pdf_parts(message):
+        if part_number == number:
+            data = part.get_payload(decode=True)
+            if data:
+                return data
+            break
+    raise FileNotFoundError(f"Нет вложения {inner} в {container}")
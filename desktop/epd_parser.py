@@ -5,48 +5,205 @@
 Автор: Создано для обработки ЖКХ квитанций
 """
 
+import argparse
+import io
 import re
+from bisect import bisect_right
 import PyPDF2
 import pandas as pd
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+from epd_archive import find_pdf_files, open_source
+from epd_dedup import DuplicateDetector, file_hash
+from epd_journal import JOURNAL_NAME, BatchJournal, make_reproducible
+
+
+# Поля шапки, которых достаточно для каталога квитанций (режим «только шапка»)
+HEADER_FIELDS = ('период', 'лицевой_счет', 'адрес', 'итого_к_оплате')
+
+# Заголовки колонок таблицы начислений -> поля услуги (сравнение по началу подписи)
+COLUMN_HEADERS = [
+    ('виды услуг', 'название'),
+    ('объем', 'объем'),
+    ('ед.изм', 'ед_изм'),
+    ('тариф', 'тариф'),
+    ('итого', 'итого'),
+]
+
+# Сокращения месяцев -> номер месяца (для сортировки периодов «Январь 2024»)
+MONTH_PREFIXES = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5, 'июн': 6,
+    'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12,
+}
+
+# Допуск по координатам (в пунктах) при группировке строк и привязке к колонкам
+ROW_TOLERANCE = 2.0
+COLUMN_TOLERANCE = 2.0
+
+
+class _BufferStream(io.RawIOBase):
+    """Файловый объект только для чтения поверх буфера (без копирования данных)"""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self._view[self._pos:self._pos + len(target)]
+        size = len(chunk)
+        target[:size] = chunk
+        self._pos += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Недопустимое значение whence: {whence}")
+        self._pos = max(self._pos, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def as_binary_stream(data: Union[bytes, bytearray, memoryview, BinaryIO]) -> BinaryIO:
+    """Оборачивает bytes/memoryview в поток для PdfReader без лишних копий"""
+    if isinstance(data, bytes):
+        # BytesIO над bytes разделяет буфер с исходным объектом до первой записи
+        return io.BytesIO(data)
+    if isinstance(data, (bytearray, memoryview)):
+        return _BufferStream(data)
+    if hasattr(data, 'seekable') and not data.seekable():
+        # PdfReader читает xref с конца файла, поэтому несикабельный поток дочитываем в память
+        return io.BytesIO(data.read())
+    return data
+
+
+def period_key(period: Optional[str]) -> Optional[int]:
+    """Превращает период «Январь 2024» в число 202401 (None, если не распознан)"""
+    if not period:
+        return None
+    parts = period.split()
+    if len(parts) != 2 or not parts[1].isdigit():
+        return None
+    month = MONTH_PREFIXES.get(parts[0][:3].lower())
+    if month is None:
+        return None
+    return int(parts[1]) * 100 + month
+
+
+def page_size(page) -> Tuple[int, int]:
+    """Размер страницы в пунктах (округлённый) - используется как признак шаблона"""
+    return round(float(page.mediabox.width)), round(float(page.mediabox.height))
+
+
+def extract_page(page, page_no: int, fragments: List[Tuple] = None) -> str:
+    """Текст страницы; если передан список fragments - собирает в него (страница, x, y, текст)"""
+    if fragments is None:
+        return page.extract_text()
+
+    def visitor(fragment, cm, tm, font_dict, font_size):
+        fragment = fragment.strip()
+        if fragment:
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            fragments.append((page_no, x, y, fragment))
+
+    return page.extract_text(visitor_text=visitor)
+
+
+def empty_result() -> Dict:
+    """Новый пустой результат разбора одного ЕПД"""
+    return {
+        'период': None,
+        'лицевой_счет': None,
+        'адрес': None,
+        'фио': None,
+        'итого_к_оплате': None,
+        'итого_к_оплате_без_страхования': None,
+        'жилищные_услуги': [],
+        'коммунальные_услуги': [],
+        'страхование': None,
+        'суммы_по_категориям': {}
+    }
 
 
 class EPDParser:
-    """Класс для парсинга данных из ЕПД"""
-
-    def __init__(self):
-        self.data = {
-            'период': None,
-            'лицевой_счет': None,
-            'адрес': None,
-            'фио': None,
-            'итого_к_оплате': None,
-            'итого_к_оплате_без_страхования': None,
-            'жилищные_услуги': [],
-            'коммунальные_услуги': [],
-            'страхование': None,
-            'суммы_по_категориям': {}
-        }
+    """
+    Класс для парсинга данных из ЕПД.
+    Парсер хранит только настройки и скомпилированные шаблоны: каждый разбор
+    возвращает новый словарь, поэтому один экземпляр можно использовать
+    из нескольких потоков и передавать в процессы-исполнители
+    """
+
+    PERIOD_RE = re.compile(r'ЗА\s+(\w+\s+\d{4})')
+    ACCOUNT_RE = re.compile(r'Лицевой счет:\s*(\d+[\s-]*\d+)')
+    FIO_RE = re.compile(r'ФИО:\s*([А-ЯЁ\s]+)')
+    ADDRESS_RE = re.compile(r'Адрес:\s*(.+?)(?:\n|ИТОГО)', re.DOTALL)
+    TOTAL_RE = re.compile(r'ИТОГО К ОПЛАТЕ.*?(\d+\s*руб\.\s*\d+\s*коп\.)')
+    HOUSING_SECTION_RE = re.compile(r'Начисления за жилищные услуги(.*?)Начисления за коммунальные услуги', re.DOTALL)
+    UTILITY_SECTION_RE = re.compile(r'Начисления за коммунальные услуги(.*?)Всего за', re.DOTALL)
+    INSURANCE_RE = re.compile(r'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ.*?(\d+[,\.]\d{2}).*?(\d+[,\.]\d{2})\s*$', re.MULTILINE)
+    # Строка услуги: название, объем, ед.изм, тариф, начислено, ..., итого
+    SERVICE_RE = re.compile(
+        r'^([А-ЯЁ\s/\(\)]+?)\s+(\d+[,.]?\d*)\s+([а-яё\.]+)\s+(\d+[,.]?\d*)\s+.*?(\d+[,\.]\d{2})\s*$'
+    )
+    AMOUNT_JUNK_RE = re.compile(r'[^\d,.]')
+
+    def __init__(self, positional: bool = False):
+        # Позиционный режим: колонки таблицы определяются по координатам текста
+        self.positional = positional
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Извлекает текст из PDF файла"""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ''
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
-                return text
+            with open_source(pdf_path) as file:
+                return self.extract_text_from_stream(file)
+        except OSError as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return ""
+
+    def extract_pages(self, pdf_reader: PyPDF2.PdfReader, fragments: List[Tuple] = None) -> List[str]:
+        """Извлекает текст по страницам; если передан список fragments - собирает в него (страница, x, y, текст)"""
+        return [extract_page(page, page_no, fragments) for page_no, page in enumerate(pdf_reader.pages)]
+
+    def extract_text_from_stream(self, stream: BinaryIO) -> str:
+        """Извлекает текст из PDF, открытого как двоичный поток"""
+        try:
+            pdf_reader = PyPDF2.PdfReader(stream)
+            return ''.join(self.extract_pages(pdf_reader))
         except Exception as e:
             print(f"Ошибка при чтении PDF: {e}")
             return ""
 
+    def extract_fragments_from_stream(self, stream: BinaryIO) -> Tuple[str, List[Tuple], Optional[Tuple]]:
+        """Извлекает текст и фрагменты с координатами (страница, x, y, текст)"""
+        fragments = []
+        try:
+            pdf_reader = PyPDF2.PdfReader(stream)
+            text = ''.join(self.extract_pages(pdf_reader, fragments))
+            return text, fragments, page_size(pdf_reader.pages[0])
+        except Exception as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return "", [], None
+
     def parse_amount(self, text: str) -> float:
         """Преобразует строку с суммой в число"""
         # Убираем все кроме цифр, запятой и точки
-        clean_text = re.sub(r'[^\d,.]', '', text)
+        clean_text = self.AMOUNT_JUNK_RE.sub('', text)
         # Заменяем запятую на точку
         clean_text = clean_text.replace(',', '.')
         try:
@@ -54,65 +211,54 @@ class EPDParser:
         except ValueError:
             return 0.0
 
-    def parse_header_info(self, text: str):
-        """Извлекает основную информацию из шапки документа"""
+    def parse_header_info(self, text: str, data: Dict):
+        """Извлекает основную информацию из шапки документа в data"""
         # Период
-        period_match = re.search(r'ЗА\s+(\w+\s+\d{4})', text)
+        period_match = self.PERIOD_RE.search(text)
         if period_match:
-            self.data['период'] = period_match.group(1)
+            data['период'] = period_match.group(1)
 
         # Лицевой счет
-        account_match = re.search(r'Лицевой счет:\s*(\d+[\s-]*\d+)', text)
+        account_match = self.ACCOUNT_RE.search(text)
         if account_match:
-            self.data['лицевой_счет'] = account_match.group(1).strip()
+            data['лицевой_счет'] = account_match.group(1).strip()
 
         # ФИО
-        fio_match = re.search(r'ФИО:\s*([А-ЯЁ\s]+)', text)
+        fio_match = self.FIO_RE.search(text)
         if fio_match:
-            self.data['фио'] = fio_match.group(1).strip()
+            data['фио'] = fio_match.group(1).strip()
 
         # Адрес
-        address_match = re.search(r'Адрес:\s*(.+?)(?:\n|ИТОГО)', text, re.DOTALL)
+        address_match = self.ADDRESS_RE.search(text)
         if address_match:
             addr = address_match.group(1).strip()
             # Очищаем от лишних переносов
             addr = ' '.join(addr.split())
-            self.data['адрес'] = addr
+            data['адрес'] = addr
 
         # Итого к оплате
-        total_match = re.search(r'ИТОГО К ОПЛАТЕ.*?(\d+\s*руб\.\s*\d+\s*коп\.)', text)
+        total_match = self.TOTAL_RE.search(text)
         if total_match:
-            self.data['итого_к_оплате'] = total_match.group(1)
+            data['итого_к_оплате'] = total_match.group(1)
 
-    def parse_services(self, text: str):
-        """Парсит услуги из таблицы расчетов"""
+    def parse_services(self, text: str, data: Dict):
+        """Парсит услуги из таблицы расчетов в data"""
         # Ищем секцию начислений за жилищные услуги
-        housing_section = re.search(
-            r'Начисления за жилищные услуги(.*?)Начисления за коммунальные услуги',
-            text, re.DOTALL
-        )
-
+        housing_section = self.HOUSING_SECTION_RE.search(text)
         if housing_section:
-            self._parse_service_section(housing_section.group(1), 'жилищные_услуги')
+            self._parse_service_section(housing_section.group(1), 'жилищные_услуги', data)
 
         # Ищем секцию начислений за коммунальные услуги
-        utility_section = re.search(
-            r'Начисления за коммунальные услуги(.*?)Всего за',
-            text, re.DOTALL
-        )
-
+        utility_section = self.UTILITY_SECTION_RE.search(text)
         if utility_section:
-            self._parse_service_section(utility_section.group(1), 'коммунальные_услуги')
+            self._parse_service_section(utility_section.group(1), 'коммунальные_услуги', data)
 
         # Добровольное страхование
-        insurance_match = re.search(
-            r'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ.*?(\d+[,\.]\d{2}).*?(\d+[,\.]\d{2})\s*$',
-            text, re.MULTILINE
-        )
+        insurance_match = self.INSURANCE_RE.search(text)
         if insurance_match:
-            self.data['страхование'] = self.parse_amount(insurance_match.group(2))
+            data['страхование'] = self.parse_amount(insurance_match.group(2))
 
-    def _parse_service_section(self, section_text: str, category: str):
+    def _parse_service_section(self, section_text: str, category: str, data: Dict):
         """Парсит секцию услуг"""
         # Разбиваем на строки
         lines = section_text.strip().split('\n')
@@ -123,11 +269,7 @@ class EPDParser:
                 continue
 
             # Ищем строки с услугами (содержат название и итоговую сумму)
-            # Паттерн: название услуги, объем, ед.изм, тариф, начислено, ..., итого
-            service_match = re.search(
-                r'^([А-ЯЁ\s/\(\)]+?)\s+(\d+[,.]?\d*)\s+([а-яё\.]+)\s+(\d+[,.]?\d*)\s+.*?(\d+[,\.]\d{2})\s*$',
-                line
-            )
+            service_match = self.SERVICE_RE.search(line)
 
             if service_match:
                 service_name = service_match.group(1).strip()
@@ -144,61 +286,278 @@ class EPDParser:
                     'итого': total
                 }
 
-                self.data[category].append(service_data)
+                data[category].append(service_data)
+
+    def _group_rows(self, fragments: List[Tuple]) -> List[List[Tuple[float, str]]]:
+        """Группирует фрагменты в строки таблицы по координате y"""
+        rows = []
+        last_key = None
+        for page_no, x, y, text in sorted(fragments, key=lambda f: (f[0], -f[2], f[1])):
+            if last_key and last_key[0] == page_no and abs(last_key[1] - y) <= ROW_TOLERANCE:
+                rows[-1].append((x, text))
+            else:
+                rows.append([(x, text)])
+                last_key = (page_no, y)
+        for row in rows:
+            row.sort()
+        return rows
+
+    def _learn_column_layout(self, rows: List[List[Tuple[float, str]]]) -> Optional[List[Tuple[float, str]]]:
+        """Находит строку заголовков таблицы и запоминает x-границы колонок"""
+        for row in rows:
+            layout = []
+            for x, label in row:
+                label = label.lower()
+                field = next((f for prefix, f in COLUMN_HEADERS if label.startswith(prefix)), None)
+                layout.append((x, field))
+
+            fields = [field for _, field in layout]
+            if 'тариф' not in fields or 'итого' not in fields:
+                continue
+
+            if 'название' not in fields:
+                layout.insert(0, (float('-inf'), 'название'))
+            return layout
+        return None
+
+    def _slice_row(self, row: List[Tuple[float, str]], layout: List[Tuple[float, str]]) -> Dict[str, str]:
+        """Раскладывает фрагменты строки по колонкам согласно раскладке"""
+        starts = [x for x, _ in layout]
+        cells = {}
+        for x, text in row:
+            index = max(bisect_right(starts, x + COLUMN_TOLERANCE) - 1, 0)
+            field = layout[index][1]
+            if field:
+                cells[field] = f"{cells[field]} {text}" if field in cells else text
+        return cells
+
+    def parse_services_positional(self, fragments: List[Tuple], page_size: Optional[Tuple], data: Dict,
+                                  layouts: Optional[Dict] = None) -> bool:
+        """
+        Парсит услуги по координатам колонок. Возвращает False, если раскладку определить не удалось.
+        layouts - кэш выученных раскладок вызывающего (размер страницы -> [(x начала колонки, поле)]):
+        документ без строки заголовков разбирается по раскладке предыдущего того же формата.
+        Кэш принадлежит вызывающему, а не парсеру, поэтому парсер остается без состояния
+        """
+        if layouts is None:
+            layouts = {}
+        rows = self._group_rows(fragments)
+
+        layout = layouts.get(page_size)
+        cached = layout is not None
+        if not cached:
+            layout = self._learn_column_layout(rows)
+            if layout is None:
+                return False
+
+        current_section = None
+        services = {'жилищные_услуги': [], 'коммунальные_услуги': []}
+        insurance = None
+
+        for row in rows:
+            row_text = ' '.join(text for _, text in row)
+
+            if 'Начисления за жилищные услуги' in row_text:
+                current_section = 'жилищные_услуги'
+                continue
+            elif 'Начисления за коммунальные услуги' in row_text:
+                current_section = 'коммунальные_услуги'
+                continue
+            elif 'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ' in row_text:
+                insurance = self.parse_amount(self._slice_row(row, layout).get('итого', '')) or None
+                current_section = None
+                continue
+            elif 'Всего за' in row_text:
+                current_section = None
+                continue
+
+            if not current_section:
+                continue
+
+            cells = self._slice_row(row, layout)
+            name = cells.get('название', '').strip()
+            total = self.parse_amount(cells.get('итого', ''))
+            if not any(ch.isalpha() for ch in name) or total <= 0:
+                continue
 
-    def calculate_totals(self):
+            services[current_section].append({
+                'название': name,
+                'объем': self.parse_amount(cells.get('объем', '')),
+                'ед_изм': cells.get('ед_изм', '').strip(),
+                'тариф': self.parse_amount(cells.get('тариф', '')),
+                'итого': total
+            })
+
+        if not services['жилищные_услуги'] and not services['коммунальные_услуги']:
+            if cached:
+                # Раскладка от другого шаблона с тем же форматом страницы - учим заново
+                layouts.pop(page_size, None)
+                return self.parse_services_positional(fragments, page_size, data, layouts)
+            return False
+
+        layouts[page_size] = layout
+        for category, items in services.items():
+            data[category].extend(items)
+        if insurance:
+            data['страхование'] = insurance
+        return True
+
+    def calculate_totals(self, data: Dict):
         """Вычисляет итоговые суммы по категориям"""
         # Жилищные услуги
-        housing_total = sum(item['итого'] for item in self.data['жилищные_услуги'])
-        self.data['суммы_по_категориям']['Жилищные услуги'] = housing_total
+        housing_total = sum(item['итого'] for item in data['жилищные_услуги'])
+        data['суммы_по_категориям']['Жилищные услуги'] = housing_total
 
         # Коммунальные услуги
-        utility_total = sum(item['итого'] for item in self.data['коммунальные_услуги'])
-        self.data['суммы_по_категориям']['Коммунальные услуги'] = utility_total
+        utility_total = sum(item['итого'] for item in data['коммунальные_услуги'])
+        data['суммы_по_категориям']['Коммунальные услуги'] = utility_total
 
         # Страхование
-        if self.data['страхование']:
-            self.data['суммы_по_категориям']['Добровольное страхование'] = self.data['страхование']
+        if data['страхование']:
+            data['суммы_по_категориям']['Добровольное страхование'] = data['страхование']
 
         # Общий итог
         total = housing_total + utility_total
-        if self.data['страхование']:
-            total += self.data['страхование']
+        if data['страхование']:
+            total += data['страхование']
 
-        self.data['суммы_по_категориям']['ИТОГО'] = total
+        data['суммы_по_категориям']['ИТОГО'] = total
 
     def parse_pdf(self, pdf_path: str) -> Dict:
         """Основной метод парсинга PDF файла"""
         print(f"Обработка файла: {pdf_path}")
 
-        # Извлекаем текст
-        text = self.extract_text_from_pdf(pdf_path)
+        try:
+            with open_source(pdf_path) as file:
+                return self.parse_stream(file)
+        except OSError as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
 
+    def parse_bytes(self, data: Union[bytes, bytearray, memoryview]) -> Dict:
+        """Парсит PDF, уже загруженный в память (bytes, bytearray или memoryview)"""
+        return self.parse_stream(as_binary_stream(data))
+
+    def parse_stream(self, stream: BinaryIO) -> Dict:
+        """Парсит PDF из двоичного файлового объекта без записи на диск"""
+        stream = as_binary_stream(stream)
+        if self.positional:
+            text, fragments, page_size = self.extract_fragments_from_stream(stream)
+            return self.parse_text(text, fragments, page_size)
+
+        text = self.extract_text_from_stream(stream)
+        return self.parse_text(text)
+
+    def parse_text(self, text: str, fragments: List[Tuple] = None, page_size: Optional[Tuple] = None,
+                   layouts: Optional[Dict] = None) -> Dict:
+        """
+        Разбирает уже извлечённый текст ЕПД (фрагменты с координатами и кэш раскладок колонок -
+        для позиционного режима). Возвращает новый словарь результата
+        """
         if not text:
             print("Не удалось извлечь текст из PDF")
             return None
 
         # Парсим данные
-        self.parse_header_info(text)
-        self.parse_services(text)
-        self.calculate_totals()
+        data = empty_result()
+        self.parse_header_info(text, data)
+        if not (fragments and self.parse_services_positional(fragments, page_size, data, layouts)):
+            # Запасной вариант - разбор строк регулярными выражениями
+            self.parse_services(text, data)
+        self.calculate_totals(data)
 
-        return self.data
+        return data
+
+    def parse_header_pdf(self, pdf_path: str, max_pages: int = 1) -> Dict:
+        """Быстрый режим для каталога: только поля шапки, без таблицы начислений"""
+        try:
+            with open_source(pdf_path) as file:
+                return self.parse_header_stream(file, max_pages)
+        except OSError as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
+
+    def parse_header_stream(self, stream: Union[bytes, bytearray, memoryview, BinaryIO],
+                            max_pages: int = 1) -> Dict:
+        """Декодирует не больше max_pages страниц и останавливается, как только найдены все поля шапки"""
+        try:
+            pdf_reader = PyPDF2.PdfReader(as_binary_stream(stream))
+        except Exception as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
+        return self.parse_header_pages(page.extract_text() for page in pdf_reader.pages[:max_pages])
+
+    def parse_header_pages(self, page_texts: Iterable[str]) -> Dict:
+        """Поля шапки из текста страниц; страницы берутся, пока не найдены все поля"""
+        data = empty_result()
+        text = ''
+        try:
+            for page_text in page_texts:
+                text += page_text
+                self.parse_header_info(text, data)
+                if all(data[field] for field in HEADER_FIELDS):
+                    break
+        except Exception as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
+
+        if not text:
+            print("Не удалось извлечь текст из PDF")
+            return None
+
+        return {field: data[field] for field in ('период', 'лицевой_счет', 'фио', 'адрес', 'итого_к_оплате')}
 
 
 class EPDAnalyzer:
     """Класс для анализа и суммирования данных из нескольких ЕПД"""
 
     def __init__(self):
+        from epd_accounts import AccountRollups
+        from epd_services import ServiceDictionary
+
         self.monthly_data = []
+        # Итоги по счетам, домам и периодам обновляются при каждом add_epd
+        self.rollups = AccountRollups()
+        # Справочник услуг: канонические названия и целые id для группировок
+        self.services = ServiceDictionary()
+        # Хранилище истории (epd_store.EPDStore): если задано, таблицы строятся запросами к нему
+        self.store = None
+        self.store_filters = {}
+        # Поступления из банковских выписок для листа сверки (epd_reconcile.load_statements)
+        # и допуск по сумме, руб.
+        self.bank_payments = None
+        self.bank_tolerance = None
+
+    @classmethod
+    def from_store(cls, store, account: Optional[str] = None, period_from: Optional[int] = None,
+                   period_to: Optional[int] = None) -> 'EPDAnalyzer':
+        """Создает анализатор поверх истории в SQLite (периоды в виде 202401)"""
+        analyzer = cls()
+        analyzer.store = store
+        analyzer.store_filters = {'account': account, 'period_from': period_from, 'period_to': period_to}
+        return analyzer
 
     def add_epd(self, epd_data: Dict):
-        """Добавляет данные ЕПД в коллекцию"""
+        """
+        Добавляет данные ЕПД в коллекцию. Повторная квитанция того же счета за тот же период
+        заменяет предыдущую - так же, как в итогах по счетам (AccountRollups). Потоковый
+        StreamingAnalyzer заменить записанное не может и оставляет первую
+        """
         if epd_data:
+            replaced = self.rollups.add(epd_data)
+            if replaced is not None:
+                # Замены редки - ищем заменяемую квитанцию с конца, по идентичности
+                for position in range(len(self.monthly_data) - 1, -1, -1):
+                    if self.monthly_data[position] is replaced:
+                        del self.monthly_data[position]
+                        break
             self.monthly_data.append(epd_data)
 
     def create_summary_dataframe(self) -> pd.DataFrame:
         """Создает сводную таблицу по всем периодам"""
+        if self.store is not None:
+            return self.store.summary_dataframe(**self.store_filters)
+
         summary_rows = []
 
         for epd in self.monthly_data:
@@ -219,6 +578,9 @@ class EPDAnalyzer:
 
     def create_detailed_dataframe(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
         """Создает детальные таблицы по жилищным и коммунальным услугам"""
+        if self.store is not None:
+            return self.store.detailed_dataframes(**self.store_filters)
+
         housing_rows = []
         utility_rows = []
 
@@ -252,6 +614,15 @@ class EPDAnalyzer:
 
         return housing_df, utility_df
 
+    def create_services_frame(self) -> pd.DataFrame:
+        """Длинная таблица строк начислений для аналитики (см. epd_analytics)"""
+        if self.store is not None:
+            return self.store.services_frame(**self.store_filters)
+
+        from epd_analytics import services_frame
+
+        return services_frame(self.monthly_data, self.services)
+
     def save_to_excel(self, output_file: str):
         """Сохраняет все данные в Excel файл"""
         print(f"\nСохранение результатов в файл: {output_file}")
@@ -271,40 +642,226 @@ class EPDAnalyzer:
                 utility_df.to_excel(writer, sheet_name='Коммунальные услуги', index=False)
 
             # Итоговая статистика
-            if not summary_df.empty:
-                stats_data = []
-                numeric_columns = summary_df.select_dtypes(include=['float64', 'int64']).columns
-
-                for col in numeric_columns:
-                    if col in summary_df.columns:
-                        stats_data.append({
-                            'Категория': col,
-                            'Сумма за все периоды': summary_df[col].sum(),
-                            'Среднее за период': summary_df[col].mean(),
-                            'Минимум': summary_df[col].min(),
-                            'Максимум': summary_df[col].max()
-                        })
-
-                stats_df = pd.DataFrame(stats_data)
+            from epd_analytics import (account_pivot, consumption_sheet, service_pivot, sheet_parts,
+                                       statistics_frame, trends_sheet)
+
+            stats_df = statistics_frame(summary_df)
+            if not stats_df.empty:
                 stats_df.to_excel(writer, sheet_name='Статистика', index=False)
 
+            # Итоги по лицевым счетам и домам
+            if self.rollups.by_account:
+                self.rollups.accounts_dataframe().to_excel(writer, sheet_name='По счетам', index=False)
+                self.rollups.buildings_dataframe().to_excel(writer, sheet_name='По домам', index=False)
+
+            # Динамика тарифов и объемов по услугам
+            services = self.create_services_frame()
+            analytics_df = trends_sheet(services)
+            if not analytics_df.empty:
+                # Строка на (счет, услуга, месяц): у больших архивов не помещается на один лист Excel
+                for sheet_name, part in sheet_parts(analytics_df, 'Аналитика'):
+                    part.to_excel(writer, sheet_name=sheet_name, index=False)
+                consumption_sheet(services).to_excel(writer, sheet_name='Тренды потребления', index=False)
+
+            # Перекрестные таблицы период × услуга и счет × период
+            if not services.empty:
+                service_pivot(services, 'total').to_excel(writer, sheet_name='Суммы по услугам', index=False)
+                service_pivot(services, 'volume').to_excel(writer, sheet_name='Объемы по услугам', index=False)
+            accounts_df = account_pivot(summary_df)
+            if not accounts_df.empty:
+                accounts_df.to_excel(writer, sheet_name='Счета по периодам', index=False)
+
+            # Сверка сумм к оплате с платежами из банковских выписок
+            if self.bank_payments is not None and self.monthly_data:
+                from epd_reconcile import DEFAULT_TOLERANCE, RECONCILE_SHEET, reconcile_bills
+
+                tolerance = DEFAULT_TOLERANCE if self.bank_tolerance is None else self.bank_tolerance
+                reconcile_df = reconcile_bills(self.monthly_data, self.bank_payments, tolerance)
+                reconcile_df.to_excel(writer, sheet_name=RECONCILE_SHEET, index=False)
+                counts = reconcile_df['Статус'].value_counts()
+                print("Сверка с банком: " + ", ".join(f"{status} - {count}" for status, count in counts.items()))
+
         print(f"✓ Файл успешно создан: {output_file}")
 
 
+def build_catalog(pdf_files: List[Path], output_file: str) -> int:
+    """Каталог квитанций: только шапка каждого файла, без разбора таблицы начислений"""
+    from epd_templates import TemplateDispatcher
+
+    rows = []
+    parser = TemplateDispatcher()
+    for pdf_file in pdf_files:
+        header = parser.parse_header_pdf(str(pdf_file))
+        if header:
+            rows.append({
+                'Файл': pdf_file.name,
+                'Период': header.get('период') or 'Н/Д',
+                'Лицевой счет': header.get('лицевой_счет') or 'Н/Д',
+                'Адрес': header.get('адрес') or 'Н/Д',
+                'Итого к оплате': header.get('итого_к_оплате') or 'Н/Д',
+            })
+
+    if rows:
+        pd.DataFrame(rows).to_excel(output_file, sheet_name='Каталог', index=False)
+    return len(rows)
+
+
+def reparse_corpus(corpus_path: Union[str, Path]) -> EPDAnalyzer:
+    """Анализатор с квитанциями, заново разобранными из корпуса текста (дубликаты отбрасываются)"""
+    from epd_corpus import TextCorpus, reparse
+
+    analyzer = EPDAnalyzer()
+    duplicates = DuplicateDetector()
+    with TextCorpus(corpus_path) as corpus:
+        print(f"Разбор из корпуса {corpus_path}: файлов {len(corpus)}\n")
+        for source, bills in reparse(corpus):
+            for epd_data in bills:
+                if not duplicates.check_bill(epd_data, source):
+                    analyzer.add_epd(epd_data)
+    return analyzer
+
+
 def main():
     """Основная функция программы"""
     print("=" * 60)
     print("    ЕПД ПАРСЕР - Обработка платежных документов ЖКХ")
     print("=" * 60)
 
+    arg_parser = argparse.ArgumentParser(description="Обработка платежных документов ЖКХ")
+    arg_parser.add_argument('folder', nargs='?', default=r"c:\Users\grigo\OneDrive\KU",
+                            help="Папка с PDF файлами ЕПД")
+    arg_parser.add_argument('--db', help="Файл SQLite для сохранения истории квитанций")
+    arg_parser.add_argument('--from-db', metavar='DB',
+                            help="Отчет по истории квитанций из SQLite (--db) без чтения PDF")
+    arg_parser.add_argument('--account', help="Только этот лицевой счет (вместе с --from-db)")
+    arg_parser.add_argument('--period-from', metavar='ПЕРИОД',
+                            help="Начиная с периода, например «Январь 2024» (вместе с --from-db)")
+    arg_parser.add_argument('--period-to', metavar='ПЕРИОД',
+                            help="По период включительно (вместе с --from-db)")
+    arg_parser.add_argument('--headers-only', action='store_true',
+                            help="Быстрый каталог: только период, лицевой счет, адрес и итог")
+    arg_parser.add_argument('--stream', action='store_true',
+                            help="Потоковая обработка с постоянной памятью (для очень больших архивов)")
+    arg_parser.add_argument('--workers', type=int,
+                            help="Число процессов для разбора пачек квитанций (по умолчанию - число ядер)")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="Продолжить прерванную обработку: файлы из журнала не разбираются повторно "
+                                 "(кроме файлов с ошибкой и в карантине)")
+    arg_parser.add_argument('--timeout', type=float,
+                            help="Разбирать под надзором с лимитом времени на один файл, секунды "
+                                 "(по умолчанию - без надзора, в этом процессе)")
+    arg_parser.add_argument('--memory-limit', type=int, metavar='MB',
+                            help="Разбирать под надзором с лимитом памяти процесса, разбирающего файл, МБ "
+                                 "(нужен psutil; без него - только Linux)")
+    arg_parser.add_argument('--update', metavar='XLSX',
+                            help="Дописать в готовый файл анализа только новые периоды и лицевые счета")
+    arg_parser.add_argument('--mail', metavar='PATH',
+                            help="Почтовый ящик mbox или папка с письмами .eml: PDF-вложения разбираются "
+                                 "вместе с файлами папки")
+    arg_parser.add_argument('--corpus', nargs='?', const='', metavar='DB',
+                            help="Корпус извлеченного текста: уже извлеченные файлы не декодируются "
+                                 "(по умолчанию .epd_corpus.db в папке)")
+    arg_parser.add_argument('--reparse', action='store_true',
+                            help="Разобрать заново весь корпус текста, не читая PDF (вместе с --corpus)")
+    arg_parser.add_argument('--positional', action='store_true',
+                            help="Разбирать таблицу начислений по координатам колонок, а не по строкам текста "
+                                 "(для ЕПД, в которых колонки слипаются в тексте)")
+    arg_parser.add_argument('--bank', action='append', default=[], metavar='FILE',
+                            help="Банковская выписка CSV или файл обмена 1С для листа сверки оплат "
+                                 "(можно указать несколько раз)")
+    arg_parser.add_argument('--bank-tolerance', type=float, metavar='RUB',
+                            help="Допустимое расхождение оплаты и суммы к оплате, руб. (по умолчанию 1)")
+    arg_parser.add_argument('--bank-account', metavar='ACCOUNT',
+                            help="Свой расчетный счет: в сверке учитываются только поступления на него "
+                                 "(для файлов 1С по умолчанию - счет из заголовка выписки)")
+    args = arg_parser.parse_args()
+
     # Путь к папке с PDF файлами
-    pdf_folder = Path(r"c:\Users\grigo\OneDrive\KU")
+    pdf_folder = Path(args.folder)
+
+    # Ищем PDF файлы с ЕПД в названии, в том числе внутри ZIP-архивов папки
+    # (порядок фиксирован, чтобы продолжение давало тот же результат)
+    pdf_files = find_pdf_files(pdf_folder)
+    if args.mail:
+        from epd_mail import find_mail_attachments
+
+        # Письма читаются потоком; повторные вложения отбрасываются по хешу
+        pdf_files += find_mail_attachments(args.mail)
+
+    if args.update and args.stream:
+        arg_parser.error("--update нельзя сочетать с --stream")
+    if args.reparse and (args.update or args.stream):
+        arg_parser.error("--reparse нельзя сочетать с --update и --stream")
+    if args.reparse and args.positional:
+        arg_parser.error("--reparse нельзя сочетать с --positional: в корпусе нет координат текста")
+    if args.bank and (args.update or args.stream):
+        arg_parser.error("--bank нельзя сочетать с --update и --stream")
+    if args.from_db and (args.update or args.stream or args.reparse or args.bank):
+        arg_parser.error("--from-db нельзя сочетать с --update, --stream, --reparse и --bank")
+    if (args.account or args.period_from or args.period_to) and not args.from_db:
+        arg_parser.error("--account, --period-from и --period-to используются только с --from-db")
+    store_periods = {}
+    for option, value in (('period_from', args.period_from), ('period_to', args.period_to)):
+        if value is not None:
+            store_periods[option] = period_key(value)
+            if store_periods[option] is None:
+                arg_parser.error(f"--{option.replace('_', '-')}: период не распознан: {value}")
+
+    # Надзор только по запросу; лимит памяти, который нельзя соблюсти, - ошибка, а не тихий пропуск
+    supervised = bool(args.timeout or args.memory_limit)
+    if args.memory_limit:
+        from epd_watchdog import memory_limit_supported
+
+        if not memory_limit_supported():
+            arg_parser.error("--memory-limit: память процессов здесь не измеряется, установите psutil "
+                             "(pip install psutil)")
+
+    # Выписки читаются до разбора: ошибка в выписке не должна обнаружиться после обработки всей папки
+    bank_payments = None
+    if args.bank:
+        from epd_reconcile import load_statements
 
-    # Создаем анализатор
-    analyzer = EPDAnalyzer()
+        try:
+            bank_payments = load_statements(args.bank, args.bank_account)
+        except (OSError, ValueError) as e:
+            arg_parser.error(f"не удалось прочитать выписку: {e}")
+        print(f"Поступлений в выписках: {len(bank_payments)}")
+
+    corpus_path = None
+    if args.corpus is not None or args.reparse:
+        from epd_corpus import CORPUS_NAME
+
+        corpus_path = Path(args.corpus) if args.corpus else pdf_folder / CORPUS_NAME
+
+    if args.reparse:
+        # Новые правила разбора по тексту из корпуса: PDF не читаются и могут отсутствовать
+        if not corpus_path.exists():
+            print(f"\n⚠ Корпус текста не найден: {corpus_path}")
+            return
+        analyzer = reparse_corpus(corpus_path)
+        analyzer.bank_payments = bank_payments
+        analyzer.bank_tolerance = args.bank_tolerance
+        output_file = pdf_folder / f"EPD_Анализ_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        if analyzer.monthly_data:
+            analyzer.save_to_excel(str(output_file))
+        print(f"\nВсего обработано документов: {len(analyzer.monthly_data)}")
+        return
 
-    # Ищем PDF файлы с ЕПД в названии
-    pdf_files = list(pdf_folder.glob("ЕПД*.pdf"))
+    if args.from_db:
+        # Отчет строится запросами к истории: квитанции в память не загружаются
+        from epd_store import EPDStore
+
+        if not Path(args.from_db).exists():
+            print(f"\n⚠ База истории не найдена: {args.from_db}")
+            return
+        with EPDStore(args.from_db) as store:
+            analyzer = EPDAnalyzer.from_store(store, account=args.account, **store_periods)
+            bills_count = len(analyzer.create_summary_dataframe())
+            if bills_count:
+                output_file = pdf_folder / f"EPD_Анализ_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+                analyzer.save_to_excel(str(output_file))
+        print(f"\nКвитанций в отчете из истории: {bills_count}")
+        return
 
     if not pdf_files:
         print("\n⚠ Не найдено ни одного PDF файла с ЕПД в папке:")
@@ -314,25 +871,173 @@ def main():
 
     print(f"\nНайдено файлов: {len(pdf_files)}\n")
 
-    # Обрабатываем каждый файл
-    parser = EPDParser()
+    if args.headers_only:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_file = pdf_folder / f"EPD_Каталог_{timestamp}.xlsx"
+        count = build_catalog(pdf_files, str(output_file))
+        print(f"✓ В каталог {output_file.name} записано квитанций: {count}")
+        return
+
+    # Журнал завершенных файлов: после сбоя запуск с --resume продолжит с того же места.
+    # Имя и отметки времени выходного файла берутся из журнала, поэтому продолжение
+    # перезаписывает тот же файл тем же содержимым, что дал бы непрерывный запуск
+    journal = BatchJournal(pdf_folder / JOURNAL_NAME, resume=args.resume)
+    if journal.entries:
+        print(f"Продолжение обработки от {journal.started}: в журнале файлов {len(journal.entries)}\n")
+
+    # Режим дополнения: квитанции, уже записанные в книгу, отбрасываются после разбора
+    known_bills = None
+    if args.update:
+        from epd_update import bill_key, existing_keys
+
+        known_bills = existing_keys(args.update)
+        print(f"Дополнение файла {args.update}: в нем квитанций {len(known_bills)}\n")
+
+    # Создаем анализатор
+    output_file = pdf_folder / f"EPD_Анализ_{journal.started}.xlsx"
+    if args.stream:
+        from epd_streaming import ExcelStreamSink, StreamingAnalyzer
+
+        # Строки сразу пишутся в файл, квитанции в памяти не копятся
+        analyzer = StreamingAnalyzer(ExcelStreamSink(output_file))
+    else:
+        analyzer = EPDAnalyzer()
+        analyzer.bank_payments = bank_payments
+        analyzer.bank_tolerance = args.bank_tolerance
+
+    # Сначала дешевые проверки по порядку файлов: журнал и побайтовые копии
+    duplicates = DuplicateDetector()
+    plan = []
 
     for pdf_file in pdf_files:
         try:
-            epd_data = parser.parse_pdf(str(pdf_file))
-            if epd_data:
+            digest = file_hash(pdf_file)
+
+            entry = journal.completed(pdf_file, digest)
+            if entry:
+                duplicates.check_hash(digest, str(pdf_file))
+                plan.append((pdf_file, digest, entry))
+                continue
+
+            # Побайтовые копии отсекаем до парсинга
+            original = duplicates.check_hash(digest, str(pdf_file))
+            if original:
+                journal.record(pdf_file, digest, 'duplicate')
+                print(f"↷ Пропущен дубликат: {pdf_file.name} (совпадает с {Path(original).name})\n")
+                continue
+
+            plan.append((pdf_file, digest, None))
+        except Exception as e:
+            print(f"✗ Ошибка при обработке {pdf_file.name}: {e}\n")
+
+    from epd_bundle import BundleParser, ParseError
+
+    # Разбор: в этом процессе или, с --timeout/--memory-limit, под надзором (лимиты на файл).
+    # Результаты нужны в порядке файлов (журнал и дубликаты), разобранные раньше ждут в буфере;
+    # пачки квитанций делятся на отдельные квитанции
+    to_parse = [pdf_file for pdf_file, _, entry in plan if entry is None]
+    if supervised:
+        from epd_watchdog import SupervisedParser
+
+        parser_pool = SupervisedParser(workers=args.workers, time_limit=args.timeout,
+                                       memory_limit_mb=args.memory_limit, corpus_path=corpus_path,
+                                       positional=args.positional)
+    else:
+        parser_pool = BundleParser(workers=args.workers, corpus_path=corpus_path, positional=args.positional)
+    parsed_files = parser_pool.iter_parse(to_parse, ordered=True)
+
+    for pdf_file, digest, entry in plan:
+        try:
+            if entry:
+                # Файл обработан в прерванном запуске - берем результат из журнала
+                if entry['status'] == 'ok':
+                    for epd_data in journal.result(entry):
+                        duplicates.check_bill(epd_data, str(pdf_file))
+                        analyzer.add_epd(epd_data)
+                print(f"↺ Из журнала: {pdf_file.name}")
+                continue
+
+            _, parsed, timings = next(parsed_files)
+            if isinstance(parsed, ParseError):
+                journal.record(pdf_file, digest, 'quarantine' if parsed.quarantined else 'error')
+                continue
+
+            bills = []
+            for epd_data in parsed:
+                # В пачке могут быть и новые квитанции, и уже записанные в книгу - проверяем каждую
+                if known_bills and bill_key(epd_data.get('период'), epd_data.get('лицевой_счет')) in known_bills:
+                    print(f"↷ Уже есть в книге: {pdf_file.name}, счет {epd_data.get('лицевой_счет', 'Н/Д')} "
+                          f"за {epd_data.get('период', 'Н/Д')}")
+                    continue
+                original = duplicates.check_bill(epd_data, str(pdf_file))
+                if original:
+                    print(f"↷ Пропущен дубликат: {pdf_file.name}, счет {epd_data.get('лицевой_счет', 'Н/Д')} "
+                          f"(та же квитанция, что {Path(original).name})\n")
+                    continue
                 analyzer.add_epd(epd_data)
+                bills.append(epd_data)
+
+            if not bills:
+                journal.record(pdf_file, digest, 'duplicate')
+                continue
+
+            journal.record(pdf_file, digest, 'ok', bills)
+            if len(parsed) > 1:
+                print(f"✓ Обработана пачка: {pdf_file.name}, квитанций: {len(bills)} за {timings['parse']:.1f} с")
+                print(f"  Итого: {sum(b.get('суммы_по_категориям', {}).get('ИТОГО', 0) for b in bills):.2f} руб.\n")
+            else:
                 print(f"✓ Обработан: {pdf_file.name}")
                 print(f"  Период: {epd_data.get('период', 'Н/Д')}")
                 print(f"  Итого: {epd_data.get('суммы_по_категориям', {}).get('ИТОГО', 0):.2f} руб.\n")
         except Exception as e:
+            # В журнал не пишем - при продолжении файл будет разобран заново
             print(f"✗ Ошибка при обработке {pdf_file.name}: {e}\n")
 
+    parser_pool.close()
+
+    if supervised and parser_pool.quarantine:
+        report_file = pdf_folder / f"EPD_Карантин_{journal.started}.csv"
+        count = parser_pool.write_quarantine_report(report_file)
+        print(f"⚠ Файлов в карантине: {count}, отчет: {report_file}")
+
+    journal.close()
+
+    if args.stream:
+        analyzer.close()
+        make_reproducible(output_file, journal.started_at)
+        print("\n" + "=" * 60)
+        print(f"Всего обработано документов: {analyzer.bills_count}")
+        if analyzer.skipped:
+            print(f"↷ Повторных квитанций того же счета и периода пропущено: {analyzer.skipped} "
+                  f"(в потоковом режиме остается первая)")
+        print(f"✓ Результаты записаны в файл: {output_file}")
+        print("\nИТОГОВЫЕ СУММЫ:")
+        for field, stats in analyzer.stats.items():
+            if stats.count:
+                print(f"  {field}: {stats.total:,.2f} руб.")
+        return
+
     # Сохраняем результаты
     if analyzer.monthly_data:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = pdf_folder / f"EPD_Анализ_{timestamp}.xlsx"
-        analyzer.save_to_excel(str(output_file))
+        if args.update:
+            from epd_update import update_workbook
+
+            added = update_workbook(args.update, analyzer)
+            print(f"✓ В файл {args.update} добавлено квитанций: {added}")
+        else:
+            analyzer.save_to_excel(str(output_file))
+            make_reproducible(output_file, journal.started_at)
+
+        if args.db:
+            from epd_store import EPDStore
+
+            with EPDStore(args.db) as store:
+                saved = store.add_bills(analyzer.monthly_data)
+            print(f"✓ В историю {args.db} сохранено квитанций: {saved}")
+
+        if analyzer.services.stats()['lookups']:
+            # Справочник заполняется при построении листов аналитики; --update их не строит
+            print(analyzer.services.report())
 
         print("\n" + "=" * 60)
         print("Обработка завершена!")
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Распределенная пакетная обработка ЕПД через общую очередь заданий в SQLite
+
+Очередь - файл SQLite на общем диске, сервер не нужен. Исполнители на разных
+машинах берут файлы в аренду на ограниченное время и продлевают ее, пока
+разбирают файл; если исполнитель пропал, аренда истекает и файл достается
+другому. Ошибка возвращает файл в очередь, после MAX_ATTEMPTS попыток он
+помечается сбойным. Квитанции каждого файла записываются в ту же базу, а шаг
+слияния собирает их в обычный отчет EPDAnalyzer.
+
+    python epd_queue.py add очередь.db <папка>      - поставить ЕПД*.pdf в очередь
+    python epd_queue.py work очередь.db             - исполнитель (на каждой машине)
+    python epd_queue.py merge очередь.db отчет.xlsx - слияние результатов
+    python epd_queue.py status очередь.db           - состояние очереди
+
+Пути к файлам должны быть одинаковыми на всех машинах (общая папка), часы
+машин - синхронизированы.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from epd_archive import find_pdf_files
+from epd_dedup import file_hash
+
+
+# Срок аренды файла исполнителем (секунды); продлевается каждую треть срока
+DEFAULT_LEASE = 120.0
+MAX_ATTEMPTS = 3
+
+# Пауза исполнителя, когда свободных файлов нет, но часть еще в аренде у других
+IDLE_INTERVAL = 1.0
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    path TEXT PRIMARY KEY,
+    hash TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, lease_until);
+'''
+
+
+def worker_name() -> str:
+    """Имя исполнителя: машина и процесс"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobQueue:
+    """Очередь файлов с арендой и повторами поверх общего файла SQLite"""
+
+    def __init__(self, db_path: Union[str, Path], max_attempts: int = MAX_ATTEMPTS):
+        self.db_path = str(db_path)
+        self.max_attempts = max_attempts
+        # Транзакции открываются явно (BEGIN IMMEDIATE), чтобы выдача аренды была атомарной
+        self.connection = sqlite3.connect(self.db_path, timeout=60, isolation_level=None,
+                                          check_same_thread=False)
+        self._lock = threading.Lock()
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Закрывает соединение с очередью"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _transaction(self, statements: List[Tuple[str, tuple]]) -> List[sqlite3.Cursor]:
+        """Выполняет запросы одной пишущей транзакцией"""
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                cursors = [self.connection.execute(sql, params) for sql, params in statements]
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+            return cursors
+
+    def add(self, pdf_paths: Iterable[Union[str, Path]]) -> int:
+        """Ставит файлы в очередь (повторно и побайтовые копии - нет); возвращает число новых"""
+        with self._lock:
+            known = {row[0] for row in self.connection.execute('SELECT hash FROM jobs')}
+        added = 0
+        statements = []
+        for pdf_path in pdf_paths:
+            digest = file_hash(pdf_path)
+            if digest in known:
+                continue
+            known.add(digest)
+            statements.append(('INSERT OR IGNORE INTO jobs(path, hash) VALUES (?, ?)',
+                               (str(Path(pdf_path).resolve()), digest)))
+        for cursor in self._transaction(statements):
+            added += cursor.rowcount
+        return added
+
+    def lease(self, worker: str, lease_seconds: float = DEFAULT_LEASE) -> Optional[str]:
+        """Берет в аренду свободный файл (или файл с истекшей арендой); None - свободных нет"""
+        now = time.time()
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                # Исполнитель пропал на последней попытке - файл больше не выдаем
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'истекла аренда' "
+                    "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                )
+                row = self.connection.execute(
+                    "SELECT path FROM jobs WHERE status = 'pending' "
+                    "OR (status = 'leased' AND lease_until < ?) ORDER BY path LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row:
+                    self.connection.execute(
+                        "UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                        "WHERE path = ?",
+                        (worker, now + lease_seconds, row[0])
+                    )
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+        return row[0] if row else None
+
+    def renew(self, path: str, worker: str, lease_seconds: float = DEFAULT_LEASE) -> bool:
+        """Продлевает аренду; False - аренда уже перешла к другому исполнителю"""
+        cursor, = self._transaction([(
+            "UPDATE jobs SET lease_until = ? WHERE path = ? AND worker = ? AND status = 'leased'",
+            (time.time() + lease_seconds, path, worker)
+        )])
+        return cursor.rowcount == 1
+
+    def complete(self, path: str, worker: str, bills: List[Dict]) -> bool:
+        """Записывает квитанции файла; False - аренда истекла и результат не принят"""
+        cursor, = self._transaction([(
+            "UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, result = ? "
+            "WHERE path = ? AND worker = ? AND status = 'leased'",
+            (zlib.compress(json.dumps(bills, ensure_ascii=False).encode('utf-8')), path, worker)
+        )])
+        return cursor.rowcount == 1
+
+    def fail(self, path: str, worker: str, error: str):
+        """Возвращает файл в очередь после ошибки (или помечает сбойным после последней попытки)"""
+        self._transaction([(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_until = NULL, error = ? WHERE path = ? AND worker = ? AND status = 'leased'",
+            (self.max_attempts, error, path, worker)
+        )])
+
+    def counts(self) -> Dict[str, int]:
+        """Число файлов по состояниям"""
+        with self._lock:
+            return dict(self.connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+    def results(self) -> Iterator[Tuple[str, List[Dict]]]:
+        """(файл, квитанции) разобранных файлов в порядке путей"""
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT path, result FROM jobs WHERE status = 'done' ORDER BY path"
+            ).fetchall()
+        for path, result in rows:
+            yield path, json.loads(zlib.decompress(result).decode('utf-8'))
+
+    def failures(self) -> List[Tuple[str, int, str]]:
+        """(файл, попыток, ошибка) сбойных файлов"""
+        with self._lock:
+            return self.connection.execute(
+                "SELECT path, attempts, error FROM jobs WHERE status = 'failed' ORDER BY path"
+            ).fetchall()
+
+
+class _LeaseKeeper(threading.Thread):
+    """Фоновое продление аренды, пока исполнитель разбирает файл"""
+
+    def __init__(self, queue: JobQueue, path: str, worker: str, lease_seconds: float):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.path = path
+        self.worker = worker
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            if not self.queue.renew(self.path, self.worker, self.lease_seconds):
+                break
+
+
+def run_worker(db_path: Union[str, Path], worker: Optional[str] = None,
+               lease_seconds: float = DEFAULT_LEASE, wait: bool = True) -> int:
+    """
+    Исполнитель: разбирает файлы из очереди, пока они есть. wait - ждать файлы,
+    арендованные другими (их аренда может истечь). Возвращает число разобранных файлов
+    """
+    from epd_bundle import BundleParser
+
+    worker = worker or worker_name()
+    done = 0
+    with JobQueue(db_path) as queue, BundleParser(workers=1) as parser:
+        while True:
+            path = queue.lease(worker, lease_seconds)
+            if path is None:
+                if wait and queue.counts().get('leased'):
+                    time.sleep(IDLE_INTERVAL)
+                    continue
+                break
+
+            keeper = _LeaseKeeper(queue, path, worker, lease_seconds)
+            keeper.start()
+            try:
+                bills = parser.parse_pdf(path)
+            except Exception as e:
+                bills = None
+                error = f"{type(e).__name__}: {e}"
+            else:
+                error = None if bills else 'квитанции не найдены'
+            finally:
+                keeper.stopped.set()
+                keeper.join()
+
+            if error:
+                print(f"✗ Ошибка при обработке {Path(path).name}: {error}\n")
+                queue.fail(path, worker, error)
+            elif queue.complete(path, worker, bills):
+                done += 1
+                print(f"✓ Обработан: {Path(path).name}, квитанций: {len(bills)}\n")
+            else:
+                print(f"⚠ Аренда истекла, результат отброшен: {Path(path).name}\n")
+    return done
+
+
+def merge(db_path: Union[str, Path]):
+    """Собирает квитанции всех разобранных файлов очереди в EPDAnalyzer (дубликаты отбрасываются)"""
+    from epd_dedup import DuplicateDetector
+    from epd_parser import EPDAnalyzer
+
+    analyzer = EPDAnalyzer()
+    duplicates = DuplicateDetector()
+    with JobQueue(db_path) as queue:
+        for path, bills in queue.results():
+            for epd_data in bills:
+                if not duplicates.check_bill(epd_data, path):
+                    analyzer.add_epd(epd_data)
+    return analyzer
+
+
+def main():
+    """Командная строка: add, work, merge, status"""
+    arg_parser = argparse.ArgumentParser(description="Распределенная обработка ЕПД через общую очередь")
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    add_parser = commands.add_parser('add', help="Поставить PDF файлы папки в очередь")
+    add_parser.add_argument('queue', help="Файл очереди SQLite на общем диске")
+    add_parser.add_argument('folder', help="Папка с PDF файлами ЕПД")
+
+    work_parser = commands.add_parser('work', help="Запустить исполнителя")
+    work_parser.add_argument('queue')
+    work_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE, help="Срок аренды файла, секунды")
+
+    merge_parser = commands.add_parser('merge', help="Собрать результаты в файл Excel")
+    merge_parser.add_argument('queue')
+    merge_parser.add_argument('output', help="Файл Excel для отчета")
+
+    status_parser = commands.add_parser('status', help="Состояние очереди")
+    status_parser.add_argument('queue')
+
+    args = arg_parser.parse_args()
+
+    if args.command == 'add':
+        pdf_files = find_pdf_files(args.folder)
+        with JobQueue(args.queue) as queue:
+            added = queue.add(pdf_files)
+        print(f"✓ В очередь поставлено файлов: {added} (найдено {len(pdf_files)})")
+    elif args.command == 'work':
+        done = run_worker(args.queue, lease_seconds=args.lease)
+        print(f"✓ Исполнитель {worker_name()} разобрал файлов: {done}")
+    elif args.command == 'merge':
+        analyzer = merge(args.queue)
+        if analyzer.monthly_data:
+            analyzer.save_to_excel(args.output)
+        print(f"Всего обработано документов: {len(analyzer.monthly_data)}")
+    else:
+        with JobQueue(args.queue) as queue:
+            print(queue.counts())
+            for path, attempts, error in queue.failures():
+                print(f"✗ {Path(path).name}: {error} (попыток: {attempts})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сверка квитанций с банковскими выписками
+
+Выписки (CSV или файл обмена 1С «1CClientBankExchange») загружаются целиком
+в таблицу; лицевой счет и период платежа извлекаются из назначения платежа
+векторными регулярными выражениями pandas. Платежи суммируются по ключу
+(лицевой счет, период) и соединяются с квитанциями хеш-соединением
+(DataFrame.merge), поэтому сотни тысяч строк выписки сверяются за секунды.
+Результат - лист «Сверка с банком»: оплачено, частично, переплата, не оплачено
+и платежи без квитанции. Квитанции и платежи без лицевого счета или периода не
+сопоставляются ни с чем и выводятся отдельно со статусом «Нет ключа сверки».
+
+Учитываются только поступления: в CSV - колонки прихода (кредит), в файле 1С -
+документы, у которых счет получателя - свой расчетный счет (из заголовка файла
+или параметра recipient_account).
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+
+from epd_parser import MONTH_PREFIXES, period_key
+
+
+# Допустимое расхождение суммы платежа и квитанции, руб.
+DEFAULT_TOLERANCE = 1.0
+
+RECONCILE_SHEET = 'Сверка с банком'
+
+MONTH_NAMES = ('Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+               'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь')
+
+# Колонки выписки CSV (сравнение без регистра); первая найденная выигрывает
+# Только приход: расход (дебет) - это списания со счета, а не оплаты квитанций
+AMOUNT_COLUMNS = ('сумма', 'сумма платежа', 'сумма операции', 'кредит', 'приход', 'поступление', 'amount')
+PURPOSE_COLUMNS = ('назначение платежа', 'назначение', 'назначениеплатежа', 'описание', 'purpose')
+ACCOUNT_COLUMNS = ('лицевой счет', 'лицевой_счет', 'лс', 'account')
+PERIOD_COLUMNS = ('период', 'period')
+RECIPIENT_COLUMNS = ('счет получателя', 'получательсчет', 'расчетный счет получателя')
+
+ACCOUNT_PATTERN = r'(?<![а-яё])(?:л\s*/\s*с|лс|лиц\w*\.?\s*сч\w*)\.?\s*[:№#]?\s*(\d[\d\s-]{3,}\d)'
+PERIOD_NAME_PATTERN = r'(' + '|'.join(sorted(MONTH_PREFIXES)) + r')[а-яё]*\.?\s+(\d{4})'
+PERIOD_NUMBER_PATTERN = r'(?<!\d)(0[1-9]|1[0-2])[./](20\d{2})(?!\d)'
+
+DUE_RE = re.compile(r'(\d[\d\s]*)руб\.?\s*(\d+)\s*коп')
+
+STATUS_PAID = 'Оплачено'
+STATUS_PARTIAL = 'Частичная оплата'
+STATUS_OVERPAID = 'Переплата'
+STATUS_UNPAID = 'Не оплачено'
+STATUS_NO_BILL = 'Платеж без квитанции'
+STATUS_NO_KEY = 'Нет ключа сверки'
+
+PAYMENT_COLUMNS = ['source', 'amount', 'purpose', 'account', 'period_key']
+
+
+def normalize_account(account) -> Optional[str]:
+    """Лицевой счет только из цифр (пробелы и дефисы в выписках пишут по-разному)"""
+    digits = re.sub(r'\D', '', str(account or ''))
+    return digits or None
+
+
+def period_label(key: Optional[int]) -> str:
+    """202401 -> «Январь 2024»"""
+    if not key:
+        return 'Н/Д'
+    return f"{MONTH_NAMES[key % 100 - 1]} {key // 100}"
+
+
+def due_amount(epd_data: Dict) -> float:
+    """Сумма к оплате по квитанции: «6 201 руб. 04 коп.», число или итог по категориям"""
+    due = epd_data.get('итого_к_оплате')
+    if isinstance(due, (int, float)):
+        return float(due)
+    match = DUE_RE.search(due or '')
+    if match:
+        return int(match.group(1).replace(' ', '')) + int(match.group(2)) / 100
+    return float(epd_data.get('суммы_по_категориям', {}).get('ИТОГО') or 0.0)
+
+
+def bills_frame(bills: Iterable[Dict]) -> pd.DataFrame:
+    """Квитанции для сверки: ключ (счет, период), период и сумма к оплате"""
+    rows = [{
+        'account': normalize_account(epd.get('лицевой_счет')),
+        'period_key': period_key(epd.get('период')),
+        'Период': epd.get('период') or 'Н/Д',
+        'Лицевой счет': epd.get('лицевой_счет') or 'Н/Д',
+        'due': due_amount(epd),
+    } for epd in bills if epd]
+    frame = pd.DataFrame(rows, columns=['account', 'period_key', 'Период', 'Лицевой счет', 'due'])
+    frame = frame.astype({'period_key': 'Int64'})
+    # Повторная квитанция того же счета за тот же период заменяет предыдущую;
+    # квитанции без счета или периода - разные квитанции, их не схлопываем
+    keyed = has_key(frame)
+    return pd.concat([frame[keyed].drop_duplicates(['account', 'period_key'], keep='last'), frame[~keyed]])
+
+
+def has_key(frame: pd.DataFrame) -> pd.Series:
+    """Строки, у которых известны и лицевой счет, и период"""
+    return frame['account'].notna() & frame['period_key'].notna()
+
+
+def _read_text(path: Path) -> str:
+    """Текст выписки: UTF-8 или, для выгрузок 1С и банков, Windows-1251"""
+    data = path.read_bytes()
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251')
+
+
+def _parse_amounts(values: pd.Series) -> pd.Series:
+    """«1 234,56» -> 1234.56 для всей колонки сразу"""
+    cleaned = values.astype(str).str.replace(r'[^\d,.-]', '', regex=True).str.replace(',', '.', regex=False)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+def _find_column(columns: List[str], names: tuple) -> Optional[str]:
+    lowered = {str(column).strip().lower(): column for column in columns}
+    return next((lowered[name] for name in names if name in lowered), None)
+
+
+def _load_1c(path: Path, text: str, recipient_account: Optional[str] = None) -> pd.DataFrame:
+    """
+    Поступления из файла обмена 1С: документы СекцияДокумент ... КонецДокумента
+    (поля Ключ=Значение), у которых счет получателя - свой расчетный счет
+    """
+    records = []
+    own_accounts = set()
+    document = None
+    for line in text.splitlines():
+        if line.startswith('СекцияДокумент'):
+            document = {}
+        elif line.startswith('КонецДокумента'):
+            if document is not None:
+                records.append(document)
+            document = None
+        elif '=' in line:
+            key, value = line.split('=', 1)
+            if document is not None:
+                document[key.strip()] = value.strip()
+            elif key.strip() == 'РасчСчет':
+                # Заголовок файла: счета, по которым сделана выгрузка
+                own_accounts.add(value.strip())
+
+    if recipient_account:
+        own_accounts = {normalize_account(recipient_account)}
+    if not own_accounts:
+        raise ValueError(f"В выписке {path.name} нет расчетного счета (РасчСчет): "
+                         f"не определить поступления, укажите счет получателя")
+
+    incoming = [document for document in records
+                if normalize_account(document.get('ПолучательСчет') or document.get('ПолучательРасчСчет'))
+                in own_accounts]
+    frame = pd.DataFrame(incoming)
+    return pd.DataFrame({
+        'amount': frame.get('Сумма', pd.Series(dtype=str)),
+        'purpose': frame.get('НазначениеПлатежа', pd.Series(dtype=str)),
+    })
+
+
+def _load_csv(path: Path, text: str, recipient_account: Optional[str] = None) -> pd.DataFrame:
+    """Строки выписки CSV (разделитель ; или ,) с колонками суммы прихода и назначения платежа"""
+    import io
+
+    header = text.split('\n', 1)[0]
+    frame = pd.read_csv(io.StringIO(text), sep=';' if ';' in header else ',', dtype=str)
+    columns = list(frame.columns)
+    amount_column = _find_column(columns, AMOUNT_COLUMNS)
+    purpose_column = _find_column(columns, PURPOSE_COLUMNS)
+    if amount_column is None:
+        raise ValueError(f"В выписке {path.name} нет колонки суммы поступления")
+
+    recipient_column = _find_column(columns, RECIPIENT_COLUMNS)
+    if recipient_account and recipient_column:
+        recipients = frame[recipient_column].fillna('').astype(str).str.replace(r'\D', '', regex=True)
+        frame = frame[recipients == normalize_account(recipient_account)]
+
+    result = pd.DataFrame({
+        'amount': frame[amount_column],
+        'purpose': frame[purpose_column] if purpose_column else '',
+    })
+    # Явные колонки счета и периода, если банк их выгружает
+    account_column = _find_column(columns, ACCOUNT_COLUMNS)
+    period_column = _find_column(columns, PERIOD_COLUMNS)
+    if account_column:
+        result['account_text'] = frame[account_column]
+    if period_column:
+        result['period_text'] = frame[period_column]
+    return result
+
+
+def load_statement(statement_path: Union[str, Path], recipient_account: Optional[str] = None) -> pd.DataFrame:
+    """
+    Поступления выписки: source, amount, purpose, account, period_key.
+    Счет и период берутся из отдельных колонок или из назначения платежа.
+    recipient_account - свой расчетный счет: учитываются только платежи на него
+    """
+    path = Path(statement_path)
+    text = _read_text(path)
+    if text.lstrip().startswith('1CClientBankExchange'):
+        frame = _load_1c(path, text, recipient_account)
+    else:
+        frame = _load_csv(path, text, recipient_account)
+
+    frame['source'] = path.name
+    frame['amount'] = _parse_amounts(frame['amount'])
+    frame['purpose'] = frame['purpose'].fillna('').astype(str)
+    purpose = frame['purpose'].str.lower()
+
+    account_text = frame['account_text'] if 'account_text' in frame else purpose.str.extract(ACCOUNT_PATTERN)[0]
+    frame['account'] = account_text.fillna('').astype(str).str.replace(r'\D', '', regex=True).replace('', None)
+
+    period_text = frame['period_text'].fillna('').astype(str).str.lower() if 'period_text' in frame else purpose
+    by_name = period_text.str.extract(PERIOD_NAME_PATTERN)
+    by_number = period_text.str.extract(PERIOD_NUMBER_PATTERN)
+    months = by_name[0].str[:3].map(MONTH_PREFIXES).fillna(pd.to_numeric(by_number[0], errors='coerce'))
+    years = pd.to_numeric(by_name[1], errors='coerce').fillna(pd.to_numeric(by_number[1], errors='coerce'))
+    frame['period_key'] = (years * 100 + months).astype('Int64')
+
+    # Отрицательные суммы - списания
+    frame = frame[frame['amount'].notna() & (frame['amount'] > 0)]
+    return frame[PAYMENT_COLUMNS]
+
+
+def load_statements(statement_paths: Iterable[Union[str, Path]],
+                    recipient_account: Optional[str] = None) -> pd.DataFrame:
+    """Поступления всех выписок одной таблицей"""
+    frames = [load_statement(path, recipient_account) for path in statement_paths]
+    if not frames:
+        return pd.DataFrame(columns=PAYMENT_COLUMNS).astype({'amount': float, 'period_key': 'Int64'})
+    return pd.concat(frames, ignore_index=True)
+
+
+def reconcile(bills: pd.DataFrame, payments: pd.DataFrame, tolerance: float = DEFAULT_TOLERANCE) -> pd.DataFrame:
+    """
+    Лист сверки: квитанции с оплатой по ключу (счет, период), платежи без квитанций
+    и, в конце, квитанции и платежи без ключа - их сопоставить не с чем
+    """
+    bills = bills.astype({'period_key': 'Int64'})
+    payments = payments.astype({'period_key': 'Int64'})
+    # Только полные ключи: merge сопоставил бы пустые ключи друг с другом
+    bills_keyed = has_key(bills)
+    payments_keyed = has_key(payments)
+
+    paid = payments[payments_keyed].groupby(['account', 'period_key']).agg(
+        paid=('amount', 'sum'), payments=('amount', 'size'), sources=('source', 'first')
+    ).reset_index()
+
+    joined = bills[bills_keyed].merge(paid, on=['account', 'period_key'], how='outer', indicator=True)
+    joined['paid'] = joined['paid'].fillna(0.0)
+    joined['payments'] = joined['payments'].fillna(0).astype(int)
+    difference = joined['paid'] - joined['due'].fillna(0.0)
+
+    status = pd.Series(STATUS_PAID, index=joined.index)
+    status[difference < -tolerance] = STATUS_PARTIAL
+    status[(joined['paid'] == 0) & (joined['due'] > tolerance)] = STATUS_UNPAID
+    status[difference > tolerance] = STATUS_OVERPAID
+    status[joined['_merge'] == 'right_only'] = STATUS_NO_BILL
+
+    no_bill = joined['_merge'] == 'right_only'
+    joined.loc[no_bill, 'Период'] = joined.loc[no_bill, 'period_key'].map(period_label)
+    joined.loc[no_bill, 'Лицевой счет'] = joined.loc[no_bill, 'account']
+
+    report = pd.DataFrame({
+        'Период': joined['Период'],
+        'Лицевой счет': joined['Лицевой счет'],
+        'К оплате': joined['due'].round(2),
+        'Оплачено': joined['paid'].round(2),
+        'Разница': difference.round(2) + 0.0,
+        'Платежей': joined['payments'],
+        'Статус': status,
+        'Выписка': joined['sources'],
+    })
+    order = joined['period_key'].fillna(0).astype(int)
+    report = report.assign(_order=order, _no_bill=no_bill).sort_values(
+        ['_no_bill', '_order', 'Лицевой счет'], kind='stable').drop(columns=['_order', '_no_bill'])
+
+    return pd.concat([report, _unkeyed_rows(bills[~bills_keyed], payments[~payments_keyed])], ignore_index=True)
+
+
+def _unkeyed_rows(bills: pd.DataFrame, payments: pd.DataFrame) -> pd.DataFrame:
+    """Квитанции и платежи без лицевого счета или периода - по одной строке, без сопоставления"""
+    bill_rows = pd.DataFrame({
+        'Период': bills['Период'],
+        'Лицевой счет': bills['Лицевой счет'],
+        'К оплате': bills['due'].round(2),
+        'Оплачено': 0.0,
+        'Разница': float('nan'),
+        'Платежей': 0,
+        'Статус': STATUS_NO_KEY,
+        'Выписка': None,
+    })
+    payment_rows = pd.DataFrame({
+        'Период': payments['period_key'].map(period_label, na_action='ignore').fillna('Н/Д'),
+        'Лицевой счет': payments['account'].fillna('Н/Д'),
+        'К оплате': float('nan'),
+        'Оплачено': payments['amount'].round(2),
+        'Разница': float('nan'),
+        'Платежей': 1,
+        'Статус': STATUS_NO_KEY,
+        'Выписка': payments['source'],
+    })
+    return pd.concat([frame for frame in (bill_rows, payment_rows) if not frame.empty] or [bill_rows],
+                     ignore_index=True)
+
+
+def reconcile_bills(bills: Iterable[Dict], payments: pd.DataFrame,
+                    tolerance: float = DEFAULT_TOLERANCE) -> pd.DataFrame:
+    """Сверка квитанций с поступлениями (load_statements) - лист «Сверка с банком»"""
+    return reconcile(bills_frame(bills), payments, tolerance)
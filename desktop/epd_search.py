@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индексы для поиска и фильтрации строк таблицы услуг GUI
+
+Строки индексируются один раз при добавлении: инвертированный индекс по
+словам названия услуги, множества строк по категориям и отсортированные
+индексы по периоду и сумме. Фильтр не просматривает все строки - он
+пересекает списки из индексов, поэтому ответ приходит сразу, пока
+пользователь печатает, даже на сотнях тысяч строк.
+"""
+
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Set
+
+from epd_parser import period_key
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def name_tokens(text: str) -> List[str]:
+    """Слова названия в нижнем регистре"""
+    return WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+class _SortedIndex:
+    """Отсортированный индекс значение -> строки; сортируется при первом запросе после добавлений"""
+
+    def __init__(self):
+        self._pairs = []
+        self._keys = []
+        self._rows = []
+        self._dirty = False
+
+    def add(self, value, row: int):
+        if value is not None:
+            self._pairs.append((value, row))
+            self._dirty = True
+
+    def range(self, low=None, high=None) -> Set[int]:
+        """Строки со значением в диапазоне [low, high] (None - без границы)"""
+        if self._dirty:
+            self._pairs.sort()
+            self._keys = [value for value, _ in self._pairs]
+            self._rows = [row for _, row in self._pairs]
+            self._dirty = False
+        start = 0 if low is None else bisect_left(self._keys, low)
+        stop = len(self._keys) if high is None else bisect_right(self._keys, high)
+        return set(self._rows[start:stop])
+
+
+class ServiceIndex:
+    """Индекс строк таблицы услуг; строки - номера по порядку добавления"""
+
+    def __init__(self):
+        self.items = []
+        # Идентификатор строки -> номер; удаленные строки остаются в индексах как None в items
+        self._rows: Dict = {}
+        self._removed = 0
+        # Слово названия -> строки, в названии которых оно есть
+        self._words: Dict[str, Set[int]] = {}
+        self._categories: Dict[str, Set[int]] = {}
+        self._periods = _SortedIndex()
+        self._amounts = _SortedIndex()
+        # Кэш подстрок запроса: подстрока -> подходящие слова словаря
+        self._word_matches: Dict[str, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.items) - self._removed
+
+    def add(self, item, name: str, period: Optional[str], category: str, amount: Optional[float]) -> int:
+        """Добавляет строку (item - идентификатор строки в таблице) и возвращает ее номер"""
+        row = len(self.items)
+        self.items.append(item)
+        self._rows[item] = row
+        for token in set(name_tokens(name)):
+            if token not in self._words:
+                self._word_matches.clear()
+            self._words.setdefault(token, set()).add(row)
+        self._categories.setdefault(category, set()).add(row)
+        self._periods.add(period_key(period), row)
+        self._amounts.add(amount, row)
+        return row
+
+    def remove(self, item):
+        """Удаляет строку (например, квитанцию, замененную повторной); номера остальных не меняются"""
+        row = self._rows.pop(item, None)
+        if row is not None:
+            self.items[row] = None
+            self._removed += 1
+
+    def _matching_words(self, fragment: str) -> List[str]:
+        """Слова словаря, содержащие фрагмент запроса (словарь названий услуг невелик)"""
+        words = self._word_matches.get(fragment)
+        if words is None:
+            words = self._word_matches[fragment] = [word for word in self._words if fragment in word]
+        return words
+
+    def _name_rows(self, text: str) -> Set[int]:
+        """Строки, в названии которых есть все слова запроса (каждое - как подстрока слова)"""
+        result = None
+        for fragment in name_tokens(text):
+            rows = set()
+            for word in self._matching_words(fragment):
+                rows |= self._words[word]
+            result = rows if result is None else result & rows
+            if not result:
+                break
+        return result if result is not None else set(self._rows.values())
+
+    def search(self, name: str = '', period_from: Optional[str] = None, period_to: Optional[str] = None,
+               categories: Iterable[str] = None, amount_min: Optional[float] = None,
+               amount_max: Optional[float] = None) -> List:
+        """Идентификаторы строк, прошедших все заданные фильтры, в порядке добавления"""
+        candidates = []
+        if name.strip():
+            candidates.append(self._name_rows(name))
+        if period_from or period_to:
+            candidates.append(self._periods.range(period_key(period_from), period_key(period_to)))
+        if categories is not None:
+            candidates.append(set().union(*(self._categories.get(category, set()) for category in categories)))
+        if amount_min is not None or amount_max is not None:
+            candidates.append(self._amounts.range(amount_min, amount_max))
+
+        if not candidates:
+            return [item for item in self.items if item is not None]
+
+        # Пересекаем от самого короткого списка
+        candidates.sort(key=len)
+        rows = candidates[0]
+        for other in candidates[1:]:
+            rows = rows & other
+        return [self.items[row] for row in sorted(rows) if self.items[row] is not None]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Справочник услуг ЕПД - канонические названия и компактные целые id
+
+Названия услуг приходят из парсера свободным текстом («ХВС», «Холодное
+водоснабжение», «ХОЛ. ВОДОСНАБЖЕНИЕ»). Справочник приводит их к каноническому
+названию через таблицу синонимов и выдает каждому небольшое целое id, чтобы
+группировки, сводные таблицы и индексы работали с числами, а не со строками.
+"""
+
+import json
+import re
+import sys
+from pathlib import Path
+from typing import Dict, List, Union
+
+
+# Каноническое название -> варианты написания в разных ЕПД
+DEFAULT_SYNONYMS = {
+    'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ': ['ХВС', 'ХОЛ. ВОДОСНАБЖЕНИЕ', 'ХОЛОДНАЯ ВОДА'],
+    'ГОРЯЧЕЕ ВОДОСНАБЖЕНИЕ': ['ГВС', 'ГОР. ВОДОСНАБЖЕНИЕ', 'ГОРЯЧАЯ ВОДА'],
+    'ВОДООТВЕДЕНИЕ': ['КАНАЛИЗАЦИЯ', 'ВОДООТВЕДЕНИЕ (КАНАЛИЗАЦИЯ)'],
+    'ЭЛЕКТРОЭНЕРГИЯ': ['ЭЛЕКТРОСНАБЖЕНИЕ', 'Э/Э', 'ЭЛЕКТРИЧЕСТВО'],
+    'ОТОПЛЕНИЕ': ['ТЕПЛОСНАБЖЕНИЕ', 'ТЕПЛОВАЯ ЭНЕРГИЯ'],
+    'ОБРАЩЕНИЕ С ТКО': ['ТКО', 'ВЫВОЗ ТКО', 'ВЫВОЗ МУСОРА'],
+    'СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ': ['СОДЕРЖАНИЕ ЖИЛ. ПОМЕЩЕНИЯ', 'СОДЕРЖАНИЕ И РЕМОНТ ЖИЛОГО ПОМЕЩЕНИЯ'],
+    'ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ': ['КАПРЕМОНТ', 'КАП. РЕМОНТ', 'КАПИТАЛЬНЫЙ РЕМОНТ'],
+}
+
+# Размер id услуги в таблицах pandas (int32)
+SERVICE_ID_BYTES = 4
+
+_NON_WORD_RE = re.compile(r'[^\w/]+')
+
+
+def normalize_name(name: str) -> str:
+    """Нормализует название: верхний регистр, Ё -> Е, без знаков препинания и лишних пробелов"""
+    name = name.upper().replace('Ё', 'Е')
+    return ' '.join(_NON_WORD_RE.sub(' ', name).split())
+
+
+class ServiceDictionary:
+    """Отображение сырых названий услуг в канонические id с кэшем"""
+
+    def __init__(self, synonyms: Dict[str, List[str]] = None):
+        # id -> каноническое название
+        self.names = []
+        # нормализованное название -> id
+        self._ids = {}
+        # сырое название -> id (кэш нормализатора)
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+        self._raw_bytes = 0
+
+        for canonical, variants in (DEFAULT_SYNONYMS if synonyms is None else synonyms).items():
+            service_id = self._intern(canonical)
+            for variant in variants:
+                self._ids.setdefault(normalize_name(variant), service_id)
+
+    @classmethod
+    def from_json(cls, path: Union[str, Path]) -> 'ServiceDictionary':
+        """Загружает таблицу синонимов из JSON вида {"каноническое": ["вариант", ...]}"""
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file))
+
+    def _intern(self, name: str) -> int:
+        """Возвращает id нормализованного названия, заводя новый при необходимости"""
+        key = normalize_name(name)
+        service_id = self._ids.get(key)
+        if service_id is None:
+            service_id = len(self.names)
+            self.names.append(key)
+            self._ids[key] = service_id
+        return service_id
+
+    def service_id(self, raw_name: str) -> int:
+        """id услуги по сырому названию из квитанции"""
+        self._raw_bytes += sys.getsizeof(raw_name)
+        service_id = self._cache.get(raw_name)
+        if service_id is not None:
+            self.hits += 1
+            return service_id
+
+        self.misses += 1
+        service_id = self._intern(raw_name)
+        self._cache[raw_name] = service_id
+        return service_id
+
+    def canonical_name(self, raw_name: str) -> str:
+        """Каноническое название услуги"""
+        return self.names[self.service_id(raw_name)]
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика: попадания в кэш и оценка экономии памяти на строках начислений"""
+        lookups = self.hits + self.misses
+        return {
+            'lookups': lookups,
+            'raw_names': len(self._cache),
+            'services': len(set(self._cache.values())),
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'memory_saved': max(self._raw_bytes - lookups * SERVICE_ID_BYTES, 0),
+        }
+
+    def report(self) -> str:
+        """Статистика справочника одной строкой для консоли"""
+        stats = self.stats()
+        return (f"Справочник услуг: {stats['raw_names']} вариантов названий -> {stats['services']} услуг, "
+                f"попаданий в кэш {stats['hit_rate']:.1%}, "
+                f"экономия памяти ~{stats['memory_saved'] / 1024:.1f} КБ")
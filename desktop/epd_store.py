@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+История ЕПД в локальной базе SQLite
+
+Разобранные квитанции сохраняются в нормализованные таблицы (квитанции,
+справочник услуг, строки начислений) с индексами по лицевому счету, периоду
+и услуге. Таблицы для анализа строятся запросами по индексам, без повторного
+разбора PDF.
+"""
+
+import sqlite3
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+from epd_parser import period_key
+from epd_services import ServiceDictionary
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS bills (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    period TEXT,
+    period_key INTEGER,
+    account TEXT,
+    fio TEXT,
+    address TEXT,
+    total_due TEXT,
+    total_no_insurance REAL,
+    insurance REAL,
+    housing_total REAL,
+    utility_total REAL,
+    total REAL
+);
+CREATE TABLE IF NOT EXISTS services (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS bill_services (
+    bill_id INTEGER NOT NULL REFERENCES bills(id) ON DELETE CASCADE,
+    service_id INTEGER NOT NULL REFERENCES services(id),
+    category TEXT NOT NULL,
+    volume REAL,
+    unit TEXT,
+    tariff REAL,
+    total REAL
+);
+CREATE INDEX IF NOT EXISTS idx_bills_account_period ON bills(account, period_key);
+CREATE INDEX IF NOT EXISTS idx_bills_period ON bills(period_key);
+CREATE INDEX IF NOT EXISTS idx_bill_services_bill ON bill_services(bill_id);
+CREATE INDEX IF NOT EXISTS idx_bill_services_service ON bill_services(service_id);
+'''
+
+# Категории услуг: ключ в данных парсера -> значение в таблице bill_services
+CATEGORIES = {
+    'жилищные_услуги': 'housing',
+    'коммунальные_услуги': 'utility',
+}
+
+
+class EPDStore:
+    """Локальное хранилище истории ЕПД"""
+
+    def __init__(self, db_path: Union[str, Path], services: ServiceDictionary = None):
+        self.db_path = str(db_path)
+        # Услуги хранятся под каноническими названиями справочника
+        self.services = ServiceDictionary() if services is None else services
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Закрывает соединение с базой"""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _service_ids(self, names: Iterable[str]) -> Dict[str, int]:
+        """Возвращает id услуг по названиям, добавляя новые в справочник"""
+        names = sorted(set(names))
+        self.connection.executemany(
+            'INSERT OR IGNORE INTO services(name) VALUES (?)', [(name,) for name in names]
+        )
+        ids = {}
+        # Ограничение SQLite на число параметров - запрашиваем пачками
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            ids.update(self.connection.execute(
+                f'SELECT name, id FROM services WHERE name IN ({placeholders})', chunk
+            ))
+        return ids
+
+    def add_bills(self, bills: Iterable[Dict]) -> int:
+        """Сохраняет квитанции одной транзакцией; квитанция того же счета за тот же период заменяется"""
+        # Внутри пачки тоже оставляем последнюю квитанцию по счету и периоду
+        latest = {}
+        for epd in bills:
+            if epd:
+                key = (epd.get('лицевой_счет'), epd.get('период'))
+                latest[key if all(key) else id(epd)] = epd
+        bills = list(latest.values())
+        if not bills:
+            return 0
+
+        with self.connection:
+            service_ids = self._service_ids(
+                self.services.canonical_name(service['название'])
+                for epd in bills
+                for category in CATEGORIES
+                for service in epd.get(category, [])
+            )
+
+            self.connection.executemany(
+                'DELETE FROM bills WHERE account = ? AND period = ?',
+                [(epd.get('лицевой_счет'), epd.get('период')) for epd in bills]
+            )
+
+            service_rows = []
+            for epd in bills:
+                sums = epd.get('суммы_по_категориям', {})
+                cursor = self.connection.execute(
+                    'INSERT INTO bills(source, period, period_key, account, fio, address, total_due, '
+                    'total_no_insurance, insurance, housing_total, utility_total, total) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        epd.get('file_path'),
+                        epd.get('период'),
+                        period_key(epd.get('период')),
+                        epd.get('лицевой_счет'),
+                        epd.get('фио'),
+                        epd.get('адрес'),
+                        epd.get('итого_к_оплате'),
+                        epd.get('итого_к_оплате_без_страхования'),
+                        epd.get('страхование'),
+                        sums.get('Жилищные услуги'),
+                        sums.get('Коммунальные услуги'),
+                        sums.get('ИТОГО'),
+                    )
+                )
+                bill_id = cursor.lastrowid
+
+                for category, code in CATEGORIES.items():
+                    for service in epd.get(category, []):
+                        service_id = service_ids[self.services.canonical_name(service['название'])]
+                        service_rows.append((
+                            bill_id, service_id, code,
+                            service['объем'], service['ед_изм'], service['тариф'], service['итого']
+                        ))
+
+            self.connection.executemany(
+                'INSERT INTO bill_services(bill_id, service_id, category, volume, unit, tariff, total) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                service_rows
+            )
+
+        return len(bills)
+
+    def _filters(self, account: Optional[str], period_from: Optional[int],
+                 period_to: Optional[int]) -> Tuple[str, List]:
+        """Условие WHERE по счету и диапазону периодов (периоды в виде 202401)"""
+        conditions = []
+        params = []
+        if account is not None:
+            conditions.append('b.account = ?')
+            params.append(account)
+        if period_from is not None:
+            conditions.append('b.period_key >= ?')
+            params.append(period_from)
+        if period_to is not None:
+            conditions.append('b.period_key <= ?')
+            params.append(period_to)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        return where, params
+
+    def summary_dataframe(self, account: Optional[str] = None, period_from: Optional[int] = None,
+                          period_to: Optional[int] = None) -> pd.DataFrame:
+        """Сводная таблица в формате EPDAnalyzer.create_summary_dataframe"""
+        where, params = self._filters(account, period_from, period_to)
+        df = pd.read_sql_query(
+            'SELECT b.period AS "Период", b.account AS "Лицевой счет", b.fio AS "ФИО", '
+            'b.housing_total AS "Жилищные услуги", b.utility_total AS "Коммунальные услуги", '
+            'b.insurance AS "Добровольное страхование", b.total AS "ИТОГО" '
+            f'FROM bills b{where} ORDER BY b.period_key, b.account',
+            self.connection, params=params
+        )
+        if df['Добровольное страхование'].isna().all():
+            df = df.drop(columns=['Добровольное страхование'])
+        return df
+
+    def services_frame(self, account: Optional[str] = None, period_from: Optional[int] = None,
+                       period_to: Optional[int] = None) -> pd.DataFrame:
+        """Длинная таблица строк начислений в формате epd_analytics.services_frame"""
+        where, params = self._filters(account, period_from, period_to)
+        df = pd.read_sql_query(
+            'SELECT b.account, b.period, b.period_key, bs.category, bs.service_id, s.name AS service, '
+            'bs.volume, bs.unit, bs.tariff, bs.total '
+            'FROM bill_services bs '
+            'JOIN bills b ON b.id = bs.bill_id '
+            f'JOIN services s ON s.id = bs.service_id{where} '
+            'ORDER BY b.period_key, b.account, bs.rowid',
+            self.connection, params=params
+        )
+        df['category'] = df['category'].map({'housing': 'Жилищные', 'utility': 'Коммунальные'})
+        df['service_id'] = df['service_id'].astype('int32')
+        df['service'] = df['service'].astype('category')
+        return df
+
+    def detailed_dataframes(self, account: Optional[str] = None, period_from: Optional[int] = None,
+                            period_to: Optional[int] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Детальные таблицы в формате EPDAnalyzer.create_detailed_dataframe"""
+        where, params = self._filters(account, period_from, period_to)
+        df = pd.read_sql_query(
+            'SELECT bs.category, b.period AS "Период", s.name AS "Услуга", bs.volume AS "Объем", '
+            'bs.unit AS "Ед. изм.", bs.tariff AS "Тариф", bs.total AS "Сумма" '
+            'FROM bill_services bs '
+            'JOIN bills b ON b.id = bs.bill_id '
+            f'JOIN services s ON s.id = bs.service_id{where} '
+            'ORDER BY b.period_key, b.account, bs.rowid',
+            self.connection, params=params
+        )
+        housing_df = df[df['category'] == 'housing'].drop(columns=['category']).reset_index(drop=True)
+        utility_df = df[df['category'] == 'utility'].drop(columns=['category']).reset_index(drop=True)
+        return housing_df, utility_df
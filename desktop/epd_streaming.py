@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковая агрегация ЕПД с ограниченной памятью
+
+В отличие от EPDAnalyzer, квитанции не копятся в monthly_data: строки сводной
+и детальных таблиц сразу записываются в выходной приемник, а статистика и итоги
+по периодам ведутся накопительными счетчиками. Память не растет с числом
+квитанций - только с числом периодов (и набором ключей уже записанных квитанций).
+
+Одна квитанция на (лицевой счет, период), как и в EPDAnalyzer, но строки уже
+записаны и заменить их нельзя, поэтому остается первая квитанция, а повторные
+пропускаются и считаются в skipped. Квитанции без счета или периода ничего
+не заменяют и записываются все.
+"""
+
+import csv
+from pathlib import Path
+from typing import Dict, List, Union
+
+from openpyxl import Workbook
+
+from epd_accounts import NO_VALUE, bill_totals
+from epd_parser import period_key
+
+
+SUMMARY_COLUMNS = [
+    'Период', 'Лицевой счет', 'ФИО',
+    'Жилищные услуги', 'Коммунальные услуги', 'Добровольное страхование', 'ИТОГО'
+]
+DETAIL_COLUMNS = ['Период', 'Услуга', 'Объем', 'Ед. изм.', 'Тариф', 'Сумма']
+STATS_COLUMNS = ['Категория', 'Сумма за все периоды', 'Среднее за период', 'Минимум', 'Максимум']
+PERIOD_COLUMNS = ['Период', 'Квитанций', 'Жилищные услуги', 'Коммунальные услуги', 'Страхование', 'Итого']
+
+# Числовые колонки сводной таблицы, по которым ведется статистика
+STATS_FIELDS = ['Жилищные услуги', 'Коммунальные услуги', 'Добровольное страхование', 'ИТОГО']
+
+
+class ExcelStreamSink:
+    """Приемник строк в Excel в режиме write-only (строки не держатся в памяти)"""
+
+    def __init__(self, output_file: Union[str, Path]):
+        self.output_file = str(output_file)
+        self.workbook = Workbook(write_only=True)
+        self._sheets = {}
+
+    def write(self, sheet_name: str, columns: List[str], row: Dict):
+        """Дописывает строку в лист, создавая лист с заголовком при первой записи"""
+        sheet = self._sheets.get(sheet_name)
+        if sheet is None:
+            sheet = self.workbook.create_sheet(sheet_name)
+            sheet.append(columns)
+            self._sheets[sheet_name] = sheet
+        sheet.append([row.get(column) for column in columns])
+
+    def close(self):
+        """Сохраняет книгу"""
+        self.workbook.save(self.output_file)
+
+
+class CsvStreamSink:
+    """Приемник строк в CSV: отдельный файл на каждый лист"""
+
+    def __init__(self, folder: Union[str, Path]):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self._files = {}
+
+    def write(self, sheet_name: str, columns: List[str], row: Dict):
+        """Дописывает строку в CSV листа"""
+        entry = self._files.get(sheet_name)
+        if entry is None:
+            file = open(self.folder / f"{sheet_name}.csv", 'w', newline='', encoding='utf-8-sig')
+            writer = csv.DictWriter(file, fieldnames=columns, delimiter=';', extrasaction='ignore')
+            writer.writeheader()
+            entry = self._files[sheet_name] = (file, writer)
+        entry[1].writerow(row)
+
+    def close(self):
+        """Закрывает все файлы"""
+        for file, _ in self._files.values():
+            file.close()
+        self._files.clear()
+
+
+class RunningStats:
+    """Накопительная статистика по колонке: сумма, число значений, минимум, максимум"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class StreamingAnalyzer:
+    """Потоковый аналог EPDAnalyzer: тот же add_epd, но без хранения квитанций"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.bills_count = 0
+        self.stats = {field: RunningStats() for field in STATS_FIELDS}
+        # период -> накопленные суммы (растет с числом периодов, а не квитанций)
+        self.periods = {}
+        # (лицевой счет, период) уже записанных квитанций и число пропущенных повторных
+        self.keys = set()
+        self.skipped = 0
+
+    def add_epd(self, epd_data: Dict):
+        """Записывает строки квитанции в приемник и обновляет накопители"""
+        if not epd_data:
+            return
+
+        account = epd_data.get('лицевой_счет') or NO_VALUE
+        period = epd_data.get('период') or NO_VALUE
+        if account != NO_VALUE and period != NO_VALUE:
+            if (account, period) in self.keys:
+                # В EPDAnalyzer повторная квитанция заменила бы предыдущую, но та уже записана
+                print(f"↷ Повторная квитанция счета {account} за {period} пропущена: "
+                      f"в потоковом режиме остается первая")
+                self.skipped += 1
+                return
+            self.keys.add((account, period))
+
+        period = epd_data.get('период', 'Н/Д')
+        row = {
+            'Период': period,
+            'Лицевой счет': epd_data.get('лицевой_счет', 'Н/Д'),
+            'ФИО': epd_data.get('фио', 'Н/Д'),
+        }
+        row.update(epd_data.get('суммы_по_категориям', {}))
+        self.sink.write('Сводная таблица', SUMMARY_COLUMNS, row)
+
+        for field, stats in self.stats.items():
+            if row.get(field) is not None:
+                stats.add(row[field])
+
+        for category, sheet_name in (('жилищные_услуги', 'Жилищные услуги'),
+                                     ('коммунальные_услуги', 'Коммунальные услуги')):
+            for service in epd_data.get(category, []):
+                self.sink.write(sheet_name, DETAIL_COLUMNS, {
+                    'Период': period,
+                    'Услуга': service['название'],
+                    'Объем': service['объем'],
+                    'Ед. изм.': service['ед_изм'],
+                    'Тариф': service['тариф'],
+                    'Сумма': service['итого']
+                })
+
+        sums = self.periods.setdefault(period, dict.fromkeys(bill_totals({}), 0))
+        for field, value in bill_totals(epd_data).items():
+            sums[field] += value
+
+        self.bills_count += 1
+
+    def close(self):
+        """Дописывает статистику и итоги по периодам и закрывает приемник"""
+        for field, stats in self.stats.items():
+            if stats.count:
+                self.sink.write('Статистика', STATS_COLUMNS, {
+                    'Категория': field,
+                    'Сумма за все периоды': stats.total,
+                    'Среднее за период': stats.mean,
+                    'Минимум': stats.minimum,
+                    'Максимум': stats.maximum,
+                })
+
+        for period in sorted(self.periods, key=lambda p: (period_key(p) or 0, str(p))):
+            sums = self.periods[period]
+            self.sink.write('По периодам', PERIOD_COLUMNS, {
+                'Период': period,
+                'Квитанций': sums['bills'],
+                'Жилищные услуги': sums['housing'],
+                'Коммунальные услуги': sums['utility'],
+                'Страхование': sums['insurance'],
+                'Итого': sums['total'],
+            })
+
+        self.sink.close()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Шаблоны ЕПД - распознавание раскладки документа и выбор специализированного парсера
+
+ЕПД разных регионов и поставщиков называются одинаково, но свёрстаны по-разному.
+Диспетчер снимает «отпечаток» первой страницы (маркерные строки, шрифты, размер
+страницы) и передаёт текст парсеру зарегистрированного шаблона. Если шаблон не
+распознан, используется общий парсер (EPDParser или переданный fallback_class).
+Через диспетчер разбирают BundleParser (консоль, исполнители под надзором,
+очередь, повторный разбор корпуса) и интерфейс.
+"""
+
+import re
+from itertools import chain
+import PyPDF2
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+from epd_archive import open_source
+from epd_parser import EPDParser, as_binary_stream, extract_page, page_size
+
+
+MONTHS_PATTERN = r'(?:январь|февраль|март|апрель|май|июнь|июль|август|сентябрь|октябрь|ноябрь|декабрь)'
+
+
+class MosOblEPDParser(EPDParser):
+    """Парсер ЕПД Московской области с узкими предкомпилированными шаблонами"""
+
+    PERIOD_RE = re.compile(r'ЗА\s+(' + MONTHS_PATTERN + r'\s+\d{4})', re.IGNORECASE)
+    ACCOUNT_RE = re.compile(r'Лицевой счет:\s*(\d+[\s-]*\d+)')
+    FIO_RE = re.compile(r'ФИО:[ \t]*([А-ЯЁ][А-ЯЁ \t]*[А-ЯЁ])')
+    ADDRESS_RE = re.compile(r'Адрес:[ \t]*([^\n]+)')
+    TOTAL_NO_INSURANCE_RE = re.compile(
+        r'(\d[\d ]*)руб\.\s*(\d+)\s*коп\.[^\n]{0,100}?ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ[^\n]*?БЕЗ'
+    )
+    TOTAL_RE = re.compile(
+        r'(\d[\d ]*)руб\.\s*(\d+)\s*коп\.[^\n]{0,100}?ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ[^\n]*?С\s+УЧЕТОМ'
+    )
+    SERVICE_RE = re.compile(
+        r'^([А-ЯЁ][А-ЯЁ\s/\(\)\.-]*?)\s+(\d+(?:[,.]\d+)?)\s+'
+        r'(кв\.м\.|куб\.\s*м\.|к[вВ]т[\./]?ч|Гкал)\s+(\d+[,.]\d+)\s.*?(\d+[,.]\d{2})\s*$'
+    )
+
+    def parse_header_info(self, text: str, data: Dict):
+        """Извлекает шапку документа по шаблонам Московской области в data"""
+        period_match = self.PERIOD_RE.search(text)
+        if period_match:
+            data['период'] = period_match.group(1)
+
+        account_match = self.ACCOUNT_RE.search(text)
+        if account_match:
+            data['лицевой_счет'] = account_match.group(1).strip()
+
+        fio_match = self.FIO_RE.search(text)
+        if fio_match:
+            data['фио'] = fio_match.group(1).strip()
+
+        address_match = self.ADDRESS_RE.search(text)
+        if address_match:
+            data['адрес'] = ' '.join(address_match.group(1).split())
+
+        # Обе суммы - числом: строки «БЕЗ учета» и «С УЧЕТОМ страхования» ищутся каждая по своей подписи
+        total_no_ins_match = self.TOTAL_NO_INSURANCE_RE.search(text)
+        if total_no_ins_match:
+            data['итого_к_оплате_без_страхования'] = self._rubles(total_no_ins_match)
+
+        total_match = self.TOTAL_RE.search(text)
+        if total_match:
+            data['итого_к_оплате'] = self._rubles(total_match)
+
+    @staticmethod
+    def _rubles(match: re.Match) -> float:
+        """Сумма из групп «рубли» и «копейки» («3 870 руб. 45 коп.» -> 3870.45)"""
+        return int(match.group(1).replace(' ', '')) + int(match.group(2)) / 100
+
+    def _parse_service_section(self, section_text: str, category: str, data: Dict):
+        """Парсит секцию услуг одним предкомпилированным шаблоном строки"""
+        for line in section_text.split('\n'):
+            service_match = self.SERVICE_RE.search(line.strip())
+            if not service_match:
+                continue
+
+            data[category].append({
+                'название': service_match.group(1).strip(),
+                'объем': self.parse_amount(service_match.group(2)),
+                'ед_изм': service_match.group(3).strip(),
+                'тариф': self.parse_amount(service_match.group(4)),
+                'итого': self.parse_amount(service_match.group(5))
+            })
+
+
+class LayoutTemplate:
+    """Шаблон ЕПД: признаки для распознавания и класс специализированного парсера"""
+
+    def __init__(self, name: str, parser_class: type, markers: Tuple[str, ...] = (),
+                 fonts: Tuple[str, ...] = (), page_size: Optional[Tuple[int, int]] = None):
+        self.name = name
+        self.parser_class = parser_class
+        self.markers = tuple(markers)
+        self.fonts = frozenset(fonts)
+        self.page_size = page_size
+
+    def matches(self, fingerprint: Dict) -> bool:
+        """Проверяет, подходит ли отпечаток первой страницы под шаблон"""
+        if self.page_size and fingerprint['page_size'] != self.page_size:
+            return False
+        if not self.fonts <= fingerprint['fonts']:
+            return False
+        return all(marker in fingerprint['text'] for marker in self.markers)
+
+
+def page_fonts(page) -> frozenset:
+    """Имена шрифтов страницы без префикса подмножества (ABCDEF+Arial -> Arial)"""
+    fonts = set()
+    resources = page.get('/Resources')
+    if resources is None:
+        return frozenset()
+    font_dict = resources.get_object().get('/Font')
+    if font_dict is None:
+        return frozenset()
+    for font in font_dict.get_object().values():
+        base_font = font.get_object().get('/BaseFont')
+        if base_font:
+            fonts.add(str(base_font).lstrip('/').split('+', 1)[-1])
+    return frozenset(fonts)
+
+
+def fingerprint_page(page, text: str) -> Dict:
+    """Отпечаток страницы: размер, шрифты и уже извлечённый текст"""
+    return {
+        'page_size': page_size(page),
+        'fonts': page_fonts(page),
+        'text': text,
+    }
+
+
+def text_fingerprint(text: str) -> Dict:
+    """Отпечаток только по тексту (корпус текста): шаблоны с размером страницы или шрифтами не подойдут"""
+    return {'page_size': None, 'fonts': frozenset(), 'text': text}
+
+
+# Шаблоны проверяются по порядку, первый подошедший выигрывает
+DEFAULT_TEMPLATES = [
+    LayoutTemplate(
+        'Московская область',
+        MosOblEPDParser,
+        markers=('ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ', 'ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ', 'Начисления за жилищные услуги'),
+    ),
+]
+
+
+class TemplateDispatcher:
+    """Определяет шаблон ЕПД по первой странице и передаёт разбор его парсеру"""
+
+    def __init__(self, templates: List[LayoutTemplate] = None, positional: bool = False,
+                 fallback_class: type = EPDParser):
+        self.templates = list(DEFAULT_TEMPLATES if templates is None else templates)
+        self.positional = positional
+        # Парсер нераспознанных документов
+        self.fallback_class = fallback_class
+        # Парсер каждого шаблона без состояния: создается один раз и разбирает все его документы
+        self._parsers = {}
+
+    def register(self, template: LayoutTemplate, first: bool = True):
+        """Регистрирует шаблон (по умолчанию - с наивысшим приоритетом)"""
+        if first:
+            self.templates.insert(0, template)
+        else:
+            self.templates.append(template)
+
+    def classify(self, fingerprint: Dict) -> Optional[LayoutTemplate]:
+        """Возвращает подходящий шаблон или None для неизвестной раскладки"""
+        for template in self.templates:
+            if template.matches(fingerprint):
+                return template
+        return None
+
+    def parser_for(self, template: Optional[LayoutTemplate]) -> EPDParser:
+        """Парсер шаблона (общий парсер для нераспознанных документов)"""
+        name = template.name if template else None
+        parser = self._parsers.get(name)
+        if parser is None:
+            parser_class = template.parser_class if template else self.fallback_class
+            # Позиционный режим передается только тем, кто его просит: у парсера интерфейса его нет
+            parser = parser_class(positional=True) if self.positional else parser_class()
+            parser = self._parsers.setdefault(name, parser)
+        return parser
+
+    def parse_text(self, text: str, fingerprint: Dict, fragments: List[Tuple] = None,
+                   page_size: Optional[Tuple] = None, layouts: Optional[Dict] = None) -> Dict:
+        """Разбирает извлеченный текст парсером шаблона, распознанного по отпечатку"""
+        parser = self.parser_for(self.classify(fingerprint))
+        return parser.parse_text(text, fragments, page_size, layouts)
+
+    def parse_pdf(self, pdf_path: str) -> Dict:
+        """Парсит PDF файл парсером распознанного шаблона"""
+        print(f"Обработка файла: {pdf_path}")
+        try:
+            with open_source(pdf_path) as file:
+                return self.parse_stream(file)
+        except OSError as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
+
+    def parse_header_pdf(self, pdf_path: str, max_pages: int = 1) -> Dict:
+        """Только поля шапки, разобранные парсером распознанного шаблона (каталог, дополнение книги)"""
+        try:
+            with open_source(pdf_path) as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                first_text = pdf_reader.pages[0].extract_text()
+                parser = self.parser_for(self.classify(fingerprint_page(pdf_reader.pages[0], first_text)))
+                more_texts = (page.extract_text() for page in pdf_reader.pages[1:max_pages])
+                return parser.parse_header_pages(chain([first_text], more_texts))
+        except Exception as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
+
+    def parse_bytes(self, data: Union[bytes, bytearray, memoryview]) -> Dict:
+        """Парсит PDF, уже загруженный в память"""
+        return self.parse_stream(as_binary_stream(data))
+
+    def parse_stream(self, stream: BinaryIO) -> Dict:
+        """Извлекает текст один раз, определяет шаблон и разбирает документ"""
+        fragments = [] if self.positional else None
+        try:
+            pdf_reader = PyPDF2.PdfReader(as_binary_stream(stream))
+            # Текст страниц извлекается один раз и переиспользуется для отпечатка
+            texts = [extract_page(page, page_no, fragments) for page_no, page in enumerate(pdf_reader.pages)]
+        except Exception as e:
+            print(f"Ошибка при чтении PDF: {e}")
+            return None
+
+        if not texts:
+            print("Не удалось извлечь текст из PDF")
+            return None
+
+        return self.parse_text(''.join(texts), fingerprint_page(pdf_reader.pages[0], texts[0]),
+                               fragments, page_size(pdf_reader.pages[0]))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Дополнение существующего файла анализа новыми квитанциями
+
+Вместо записи нового EPD_Анализ_<время>.xlsx со всей историей в уже готовую
+книгу дописываются только квитанции тех (период, лицевой счет), которых в ней
+еще нет. Лист «Статистика» пересчитывается на месте, остальные листы
+(итоги по счетам, аналитика) не трогаются.
+"""
+
+from pathlib import Path
+from typing import List, Set, Tuple, Union
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+SUMMARY_SHEET = 'Сводная таблица'
+STATS_SHEET = 'Статистика'
+DETAIL_SHEETS = ('Жилищные услуги', 'Коммунальные услуги')
+KEY_COLUMNS = ('Период', 'Лицевой счет')
+STATS_COLUMNS = ['Категория', 'Сумма за все периоды', 'Среднее за период', 'Минимум', 'Максимум']
+
+# Текстовые колонки сводной таблицы - по ним статистика не считается
+TEXT_COLUMNS = ('Период', 'Лицевой счет', 'ФИО')
+
+
+def _header(sheet) -> List[str]:
+    return [cell.value for cell in next(sheet.iter_rows(min_row=1, max_row=1))]
+
+
+def bill_key(period, account) -> Tuple[str, str]:
+    """Ключ квитанции в книге: (период, лицевой счет) строками"""
+    return str(period or 'Н/Д'), str(account or 'Н/Д')
+
+
+def existing_keys(workbook_path: Union[str, Path]) -> Set[Tuple[str, str]]:
+    """(период, лицевой счет) квитанций, уже записанных в книгу (читается только сводный лист)"""
+    workbook = load_workbook(workbook_path, read_only=True)
+    try:
+        if SUMMARY_SHEET not in workbook.sheetnames:
+            return set()
+        rows = workbook[SUMMARY_SHEET].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        if not all(column in header for column in KEY_COLUMNS):
+            return set()
+        period_index, account_index = (header.index(column) for column in KEY_COLUMNS)
+        return {bill_key(row[period_index], row[account_index]) for row in rows}
+    finally:
+        workbook.close()
+
+
+def _cell_value(value):
+    """Значение для ячейки: NaN из pandas - пустая ячейка"""
+    return None if pd.isna(value) else value
+
+
+def append_rows(workbook, sheet_name: str, frame: pd.DataFrame):
+    """Дописывает строки таблицы в лист по именам колонок; недостающие колонки добавляются справа"""
+    if frame.empty:
+        return
+
+    if sheet_name in workbook.sheetnames:
+        sheet = workbook[sheet_name]
+        header = _header(sheet)
+    else:
+        sheet = workbook.create_sheet(sheet_name)
+        header = []
+
+    for column in frame.columns:
+        if column not in header:
+            header.append(column)
+            sheet.cell(row=1, column=len(header), value=column)
+
+    for record in frame.to_dict('records'):
+        sheet.append([_cell_value(record.get(column)) for column in header])
+
+
+def update_statistics(workbook):
+    """Пересчитывает лист «Статистика» по сводной таблице, сохраняя его строки на месте"""
+    summary = workbook[SUMMARY_SHEET]
+    header = _header(summary)
+    columns = {name: [] for name in header if name not in TEXT_COLUMNS}
+    for row in summary.iter_rows(min_row=2, values_only=True):
+        for name, value in zip(header, row):
+            if name in columns and isinstance(value, (int, float)):
+                columns[name].append(value)
+
+    if STATS_SHEET in workbook.sheetnames:
+        sheet = workbook[STATS_SHEET]
+    else:
+        sheet = workbook.create_sheet(STATS_SHEET)
+        sheet.append(STATS_COLUMNS)
+    rows = {sheet.cell(row=row, column=1).value: row for row in range(2, sheet.max_row + 1)}
+
+    for name, values in columns.items():
+        if not values:
+            continue
+        row = rows.get(name)
+        if row is None:
+            row = sheet.max_row + 1
+        stats = (name, sum(values), sum(values) / len(values), min(values), max(values))
+        for column, value in enumerate(stats, start=1):
+            sheet.cell(row=row, column=column, value=value)
+
+
+def update_workbook(workbook_path: Union[str, Path], analyzer) -> int:
+    """
+    Дописывает в книгу квитанции анализатора, которых в ней еще нет.
+    Возвращает число добавленных квитанций
+    """
+    known = existing_keys(workbook_path)
+    new_bills = []
+    for epd in analyzer.monthly_data:
+        key = bill_key(epd.get('период'), epd.get('лицевой_счет'))
+        if key not in known:
+            known.add(key)
+            new_bills.append(epd)
+
+    if not new_bills:
+        return 0
+
+    # Таблицы строятся тем же анализатором, что и полный отчет, но только по новым квитанциям
+    from epd_parser import EPDAnalyzer
+
+    delta = EPDAnalyzer()
+    for epd in new_bills:
+        delta.add_epd(epd)
+
+    workbook = load_workbook(workbook_path)
+    append_rows(workbook, SUMMARY_SHEET, delta.create_summary_dataframe())
+    for sheet_name, frame in zip(DETAIL_SHEETS, delta.create_detailed_dataframe()):
+        append_rows(workbook, sheet_name, frame)
+    update_statistics(workbook)
+    workbook.save(workbook_path)
+
+    return len(new_bills)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Разбор ЕПД под надзором: ограничение времени и памяти на документ
+
+Каждый файл разбирается в отдельном процессе-исполнителе. Надзирающий процесс
+следит за временем разбора и памятью исполнителя; при превышении лимита
+исполнитель убивается и заменяется новым, файл попадает в карантин, а пакет
+продолжает обрабатываться остальными исполнителями.
+
+Результаты выдаются генератором iter_parse по мере готовности, поэтому
+потребитель (отчет, база, интерфейс) работает параллельно с разбором.
+
+Память исполнителя измеряется через psutil, а без него - по /proc (только Linux).
+Если измерить ее нельзя, лимит памяти не принимается: молча не действующий
+лимит хуже явной ошибки.
+"""
+
+import csv
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from epd_bundle import ParseError
+from epd_parser import EPDParser
+
+
+DEFAULT_TIME_LIMIT = 300.0
+
+# Как часто надзирающий процесс проверяет время и память исполнителей (секунды)
+POLL_INTERVAL = 0.1
+
+# Буфер упорядоченной выдачи по умолчанию - столько файлов на исполнителя
+# может быть разобрано вперед первого еще не выданного
+ORDER_BUFFER_PER_WORKER = 4
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def memory_usage(pid: int) -> Optional[int]:
+    """Резидентная память процесса в байтах (None, если узнать нельзя)"""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f'/proc/{pid}/statm') as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memory_limit_supported() -> bool:
+    """Можно ли измерять память исполнителей (psutil или /proc)"""
+    return memory_usage(os.getpid()) is not None
+
+
+def _worker_loop(conn, corpus_path, positional, parser_class, templates):
+    """Цикл исполнителя: получает путь, возвращает ('ok', квитанции, секунды) или ('error', текст, секунды)"""
+    from epd_bundle import BundleParser
+
+    # Внутри исполнителя пачка разбирается последовательно - параллельность дают сами исполнители
+    parser = BundleParser(workers=1, parser_class=parser_class, corpus_path=corpus_path, positional=positional,
+                          templates=templates)
+    while True:
+        try:
+            pdf_path = conn.recv()
+        except EOFError:
+            break
+        if pdf_path is None:
+            break
+        started = time.perf_counter()
+        try:
+            bills = parser.parse_pdf(pdf_path)
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}", time.perf_counter() - started))
+        else:
+            conn.send(('ok', bills, time.perf_counter() - started))
+
+
+class _Worker:
+    """Процесс-исполнитель и его текущее задание"""
+
+    def __init__(self, context, corpus_path=None, positional=False, parser_class=EPDParser, templates=None):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_worker_loop,
+                                       args=(child, corpus_path, positional, parser_class, templates),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.task = None
+        self.started = None
+
+    def submit(self, index: int, pdf_path: str, waited: float):
+        self.conn.send(pdf_path)
+        self.task = (index, pdf_path, waited)
+        self.started = time.monotonic()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class SupervisedParser:
+    """Пул исполнителей с лимитами времени и памяти на документ и отчетом о карантине"""
+
+    def __init__(self, workers: Optional[int] = None, time_limit: Optional[float] = DEFAULT_TIME_LIMIT,
+                 memory_limit_mb: Optional[int] = None,
+                 corpus_path: Union[str, Path, None] = None, positional: bool = False,
+                 parser_class: type = EPDParser, templates: Optional[List] = None,
+                 start_method: Optional[str] = None):
+        if memory_limit_mb and not memory_limit_supported():
+            raise RuntimeError("лимит памяти нельзя соблюсти: память процессов не измеряется (установите psutil)")
+        self.workers = workers or os.cpu_count() or 1
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit_mb * 1024 * 1024 if memory_limit_mb else None
+        # Корпус извлеченного текста (epd_corpus), общий для всех исполнителей
+        self.corpus_path = corpus_path
+        # Позиционный разбор таблицы начислений (по координатам колонок)
+        self.positional = positional
+        # Парсер нераспознанных шаблонов и шаблоны вместо стандартных (см. BundleParser)
+        self.parser_class = parser_class
+        self.templates = templates
+        # (путь, причина, подробности) файлов, снятых с разбора
+        self.quarantine = []
+        # Способ запуска исполнителей (None - по умолчанию для ОС); интерфейс запускает их через spawn
+        self._context = multiprocessing.get_context(start_method)
+        self._workers = []
+
+    def _new_worker(self) -> _Worker:
+        return _Worker(self._context, self.corpus_path, self.positional, self.parser_class, self.templates)
+
+    def _check_limits(self, worker: _Worker, now: float) -> Optional[Tuple[str, str]]:
+        """Причина снятия задания, если исполнитель превысил лимит"""
+        elapsed = now - worker.started
+        if self.time_limit and elapsed > self.time_limit:
+            return 'превышено время', f"{elapsed:.1f} с при лимите {self.time_limit:g} с"
+        if self.memory_limit:
+            used = memory_usage(worker.process.pid)
+            if used is not None and used > self.memory_limit:
+                return 'превышена память', f"{used / 2 ** 20:.0f} МБ при лимите {self.memory_limit / 2 ** 20:.0f} МБ"
+        return None
+
+    def iter_parse(self, pdf_paths: Iterable[Union[str, Path]], ordered: bool = False,
+                   buffer_size: Optional[int] = None) -> Iterator[Tuple[str, Union[List[Dict], ParseError], Dict]]:
+        """
+        Разбирает файлы и выдает (путь, квитанции или ParseError, время) по мере готовности.
+        Время - {'wait': ожидание исполнителя, 'parse': разбор}, в секундах.
+        ordered - выдавать в исходном порядке: разобранные раньше очереди ждут в буфере,
+        а исполнители не уходят дальше buffer_size файлов от первого невыданного
+        """
+        pending = deque(enumerate(str(path) for path in pdf_paths))
+        total = len(pending)
+        window = buffer_size or self.workers * ORDER_BUFFER_PER_WORKER
+        results = {}
+        next_index = 0
+        began = time.monotonic()
+        workers = self._workers = [self._new_worker() for _ in range(min(self.workers, total))]
+
+        try:
+            while next_index < total:
+                for worker in workers:
+                    if worker.task is None and pending and (not ordered or pending[0][0] < next_index + window):
+                        index, pdf_path = pending.popleft()
+                        worker.submit(index, pdf_path, time.monotonic() - began)
+
+                busy = [worker for worker in workers if worker.task is not None]
+                ready = wait([worker.conn for worker in busy], timeout=POLL_INTERVAL)
+                now = time.monotonic()
+                finished = []
+
+                for position, worker in enumerate(workers):
+                    if worker.task is None:
+                        continue
+                    index, pdf_path, waited = worker.task
+
+                    if worker.conn in ready:
+                        try:
+                            status, payload, seconds = worker.conn.recv()
+                        except (EOFError, OSError):
+                            status, payload, seconds = 'crash', f"код завершения {worker.process.exitcode}", now - worker.started
+                        if status != 'crash':
+                            if status == 'ok' and payload:
+                                result = payload
+                            else:
+                                result = ParseError('ошибка разбора', payload if status == 'error' else 'квитанции не найдены')
+                                print(f"✗ Ошибка при обработке {Path(pdf_path).name}: {result.details}\n")
+                            finished.append((index, (pdf_path, result, {'wait': waited, 'parse': seconds})))
+                            worker.task = None
+                            continue
+                        reason = ('сбой процесса', payload)
+                    else:
+                        reason = self._check_limits(worker, now)
+                        if reason is None:
+                            continue
+                        seconds = now - worker.started
+
+                    # Исполнитель завис, превысил память или упал - заменяем его новым
+                    worker.kill()
+                    workers[position] = self._new_worker()
+                    self.quarantine.append((pdf_path,) + reason)
+                    print(f"⚠ В карантин: {Path(pdf_path).name} ({reason[0]}: {reason[1]})\n")
+                    finished.append((index, (pdf_path, ParseError(*reason, quarantined=True),
+                                            {'wait': waited, 'parse': seconds})))
+
+                if ordered:
+                    results.update(finished)
+                    while next_index in results:
+                        yield results.pop(next_index)
+                        next_index += 1
+                else:
+                    for _, item in finished:
+                        next_index += 1
+                        yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """Останавливает исполнителей: свободные завершаются сами, занятые убиваются"""
+        for worker in self._workers:
+            if worker.task is None and worker.process.is_alive():
+                worker.conn.send(None)
+                worker.process.join(timeout=1)
+            if worker.process.is_alive():
+                worker.kill()
+        self._workers = []
+
+    def write_quarantine_report(self, report_path: Union[str, Path]) -> int:
+        """Отчет о карантине в CSV (;); возвращает число файлов в нем"""
+        with open(report_path, 'w', newline='', encoding='utf-8-sig') as file:
+            writer = csv.writer(file, delimiter=';')
+            writer.writerow(['Файл', 'Причина', 'Подробности'])
+            writer.writerows(self.quarantine)
+        return len(self.quarantine)
+
+
+def iter_parse(pdf_paths: Iterable[Union[str, Path]], ordered: bool = False, buffer_size: Optional[int] = None,
+               workers: Optional[int] = None, time_limit: Optional[float] = DEFAULT_TIME_LIMIT,
+               memory_limit_mb: Optional[int] = None, parser_class: type = EPDParser,
+               templates: Optional[List] = None) -> Iterator[Tuple[str, Union[List[Dict], ParseError], Dict]]:
+    """(путь, квитанции или ParseError, время) по мере разбора - см. SupervisedParser.iter_parse"""
+    parser = SupervisedParser(workers=workers, time_limit=time_limit, memory_limit_mb=memory_limit_mb,
+                              parser_class=parser_class, templates=templates)
+    yield from parser.iter_parse(pdf_paths, ordered=ordered, buffer_size=buffer_size)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Снимок рабочего пространства GUI - разобранные квитанции и выбор услуг
+
+Снимок - компактный двоичный файл: сигнатура, версия и сжатый zlib JSON со
+списком файлов (путь, хеш, размер, время изменения), результатами разбора и
+состоянием галочек. Открытие снимка не читает PDF: файлы сверяются только по
+размеру и времени изменения, а изменившиеся перепроверяются по хешу позже,
+по одному, уже после показа данных.
+"""
+
+import json
+import os
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+
+SNAPSHOT_MAGIC = b'EPDW'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = '.epdw'
+
+_HEADER = struct.Struct('>4sH')
+
+
+def file_signature(file_path: Union[str, Path]) -> Optional[Tuple[int, int]]:
+    """Размер и время изменения файла (None, если файла нет) - дешевая проверка без чтения"""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def save_snapshot(snapshot_path: Union[str, Path], files: List[Dict], parsed_data: List[Dict],
+                  unchecked: List[Tuple[str, str, str]], include_insurance: bool):
+    """
+    Сохраняет снимок. files - [{'path', 'hash'}], unchecked - снятые галочки
+    как (файл, категория, название услуги): выбраны обычно почти все услуги
+    """
+    records = []
+    for entry in files:
+        signature = file_signature(entry['path'])
+        records.append({
+            'path': entry['path'],
+            'hash': entry.get('hash'),
+            'size': signature[0] if signature else None,
+            'mtime': signature[1] if signature else None,
+        })
+
+    payload = {
+        'files': records,
+        'parsed_data': parsed_data,
+        'unchecked': [list(key) for key in unchecked],
+        'include_insurance': include_insurance,
+    }
+    data = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    with open(snapshot_path, 'wb') as file:
+        file.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION))
+        file.write(data)
+
+
+def load_snapshot(snapshot_path: Union[str, Path]) -> Dict:
+    """Читает снимок; ValueError, если файл не является снимком этой версии"""
+    with open(snapshot_path, 'rb') as file:
+        magic, version = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("Файл не является снимком рабочего пространства ЕПД")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия снимка: {version}")
+        return json.loads(zlib.decompress(file.read()).decode('utf-8'))
+
+
+def stale_files(files: List[Dict]) -> List[str]:
+    """Файлы снимка, у которых изменились размер или время изменения (кандидаты на перепроверку)"""
+    stale = []
+    for entry in files:
+        signature = file_signature(entry['path'])
+        if signature is None or signature != (entry['size'], entry['mtime']):
+            stale.append(entry['path'])
+    return stale
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Общие настройки тестов: модули приложения лежат плоско в desktop/, фабрика квитанций"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def make_bill():
+    """Фабрика результата разбора одного ЕПД в формате EPDParser"""
+    def make(account='5000000001', period='Январь 2024', housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 100.0),),
+             utility=(('ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ', 50.0),), due=None, source=None):
+        def services(items):
+            return [{'название': name, 'объем': 1.0, 'ед_изм': 'кв.м.', 'тариф': total, 'итого': total}
+                    for name, total in items]
+
+        housing_total = sum(total for _, total in housing)
+        utility_total = sum(total for _, total in utility)
+        bill = {
+            'период': period,
+            'лицевой_счет': account,
+            'адрес': 'г. Москва, ул. Ленина, д. 1',
+            'фио': 'ИВАНОВ ИВАН',
+            'итого_к_оплате': due,
+            'итого_к_оплате_без_страхования': housing_total + utility_total,
+            'жилищные_услуги': services(housing),
+            'коммунальные_услуги': services(utility),
+            'страхование': None,
+            'суммы_по_категориям': {'Жилищные услуги': housing_total, 'Коммунальные услуги': utility_total,
+                                    'ИТОГО': housing_total + utility_total},
+        }
+        if source:
+            bill['file_path'] = source
+        return bill
+    return make
+
+
+# Шрифты с кириллицей для синтетических PDF (Linux, Windows, macOS)
+FONT_PATHS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+    '/Library/Fonts/Arial.ttf',
+    '/System/Library/Fonts/Supplemental/Arial.ttf',
+)
+
+# Строки таблицы начислений синтетической квитанции: название, объем, ед.изм, тариф
+PDF_HOUSING = (('СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ', 54.3, 'кв.м.', 32.15), ('ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ', 54.3, 'кв.м.', 15.5))
+PDF_UTILITY = (('ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ', 5.0, 'куб.м.', 45.2), ('ЭЛЕКТРОЭНЕРГИЯ', 150.0, 'кВтч', 6.17))
+PDF_INSURANCE = 81.45
+# Колонки таблицы (x, пункты): название, объем, ед.изм, тариф, начислено, итого
+PDF_COLUMNS = (40, 250, 310, 360, 420, 480)
+
+
+def _amount(value: float) -> str:
+    return f"{value:.2f}".replace('.', ',')
+
+
+def _rubles(value: float) -> str:
+    rubles = f"{int(value):,}".replace(',', ' ')
+    return f"{rubles} руб. {round(value * 100) % 100:02d} коп."
+
+
+@pytest.fixture(scope='session')
+def pdf_font():
+    """Имя зарегистрированного в reportlab шрифта с кириллицей (без reportlab или шрифта тест пропускается)"""
+    pytest.importorskip('reportlab')
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    font_path = next((path for path in FONT_PATHS if Path(path).exists()), None)
+    if font_path is None:
+        pytest.skip("нет шрифта с кириллицей для синтетических PDF")
+    pdfmetrics.registerFont(TTFont('EPDTest', font_path))
+    return 'EPDTest'
+
+
+@pytest.fixture
+def make_pdf(pdf_font, tmp_path):
+    """
+    Фабрика синтетических ЕПД: make_pdf(имя, (счет, период), ...) -> путь PDF со страницей
+    на каждую квитанцию. cells=True - каждая ячейка таблицы отдельным фрагментом текста
+    (для позиционного разбора), tariff_step - прибавка к тарифам в каждой следующей квитанции
+    """
+    from reportlab.pdfgen import canvas
+
+    def make(name, *bills, cells=False, tariff_step=0.0, folder=None):
+        path = Path(folder or tmp_path) / name
+        pdf = canvas.Canvas(str(path))
+        for number, (account, period) in enumerate(bills):
+            step = tariff_step * number
+            housing = [(title, volume, unit, tariff + step) for title, volume, unit, tariff in PDF_HOUSING]
+            utility = [(title, volume, unit, tariff + step) for title, volume, unit, tariff in PDF_UTILITY]
+            charges = sum(round(volume * tariff, 2) for _, volume, _, tariff in housing + utility)
+            y = 800
+
+            def line(*texts):
+                nonlocal y
+                if cells:
+                    for x, text in zip(PDF_COLUMNS, texts):
+                        pdf.drawString(x, y, text)
+                else:
+                    pdf.drawString(PDF_COLUMNS[0], y, ' '.join(texts))
+                y -= 14
+
+            pdf.setFont(pdf_font, 8)
+            line(f'ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА {period}')
+            line(f'Лицевой счет: {account}')
+            line('ФИО: ИВАНОВ ИВАН ИВАНОВИЧ')
+            line('Адрес: г. Москва, ул. Ленина, д. 1, кв. 5')
+            line(f'{_rubles(charges)} ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ СЧЕТА БЕЗ УЧЕТА СТРАХОВАНИЯ')
+            line(f'{_rubles(charges + PDF_INSURANCE)} ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ СЧЕТА С УЧЕТОМ СТРАХОВАНИЯ')
+            line('Виды услуг', 'Объем услуг', 'Ед.изм.', 'Тариф', 'Начислено по тарифу', 'Итого')
+            line('Начисления за жилищные услуги')
+            for title, volume, unit, tariff in housing:
+                total = _amount(volume * tariff)
+                line(title, _amount(volume), unit, _amount(tariff), total, total)
+            line('Начисления за коммунальные услуги')
+            for title, volume, unit, tariff in utility:
+                total = _amount(volume * tariff)
+                line(title, _amount(volume), unit, _amount(tariff), total, total)
+            line(f'Всего за {period.lower()}: {_amount(charges)}')
+            line('ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ', _amount(54.3), 'кв.м.', _amount(1.5),
+                 _amount(PDF_INSURANCE), _amount(PDF_INSURANCE))
+            pdf.showPage()
+        pdf.save()
+        return path
+    return make
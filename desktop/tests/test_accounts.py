@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Итоги по счетам и домам, замена повторных квитанций (epd_accounts, EPDAnalyzer)"""
+
+import pytest
+
+pytest.importorskip('pandas')
+
+from epd_accounts import AccountRollups, building_of
+from epd_parser import EPDAnalyzer
+
+
+def test_building_drops_apartment_number():
+    assert building_of('г. Москва, ул. Ленина, д. 1, кв. 5') == 'г. Москва, ул. Ленина, д. 1'
+    assert building_of('г. Москва, ул. Ленина, д. 1, пом. 12А') == 'г. Москва, ул. Ленина, д. 1'
+    assert building_of(None) == 'Н/Д'
+
+
+def test_repeated_bill_replaces_previous_in_totals(make_bill):
+    rollups = AccountRollups()
+    first = make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 100.0),))
+    assert rollups.add(first) is None
+    rollups.add(make_bill(account='5000000002'))
+    second = make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 120.0),))
+    assert rollups.add(second) is first
+
+    assert rollups.get('5000000001', 'Январь 2024') is second
+    assert rollups.account_totals('5000000001') == {'housing': 120.0, 'utility': 50.0, 'insurance': 0.0,
+                                                    'total': 170.0, 'bills': 1}
+    assert rollups.overall['bills'] == 2
+    assert rollups.building_totals('г. Москва, ул. Ленина, д. 1')['total'] == 320.0
+
+
+def test_bills_without_key_are_all_counted(make_bill):
+    rollups = AccountRollups()
+    assert rollups.add(make_bill(account=None)) is None
+    assert rollups.add(make_bill(account=None)) is None
+    assert rollups.add(make_bill(period=None)) is None
+    assert rollups.account_totals('Н/Д')['bills'] == 2
+    assert rollups.overall['bills'] == 3
+    assert rollups.index == {}
+
+
+def test_analyzer_keeps_one_bill_per_account_and_period(make_bill):
+    analyzer = EPDAnalyzer()
+    first = make_bill()
+    other = make_bill(account='5000000002')
+    second = make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 120.0),))
+    for bill in (first, other, second, make_bill(account=None), make_bill(account=None)):
+        analyzer.add_epd(bill)
+
+    # Сводная таблица и итоги по счетам считают одни и те же квитанции
+    assert analyzer.monthly_data[:2] == [other, second]
+    assert len(analyzer.monthly_data) == 4
+    summary = analyzer.create_summary_dataframe()
+    assert summary['ИТОГО'].sum() == analyzer.rollups.overall['total'] == 170.0 + 150.0 + 150.0 * 2
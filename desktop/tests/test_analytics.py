@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Динамика тарифов и объемов, листы Excel сверх лимита строк (epd_analytics)"""
+
+import math
+
+import pytest
+
+pytest.importorskip('pandas')
+
+import pandas as pd
+
+from epd_analytics import consumption_trends, service_trends, services_frame, sheet_parts, trends_sheet
+
+MONTHS = ('Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+          'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь')
+
+
+def water_bill(make_bill, year, month, tariff, volume, account='5000000001'):
+    bill = make_bill(account=account, period=f'{MONTHS[month - 1]} {year}', housing=(),
+                     utility=(('ХВС', round(tariff * volume, 2)),))
+    bill['коммунальные_услуги'][0].update({'тариф': tariff, 'объем': volume})
+    return bill
+
+
+def test_services_frame_maps_synonyms_to_one_service(make_bill):
+    bills = [make_bill(utility=(('ХВС', 50.0),)), make_bill(period='Февраль 2024', utility=(('Холодная вода', 60.0),))]
+    frame = services_frame(bills)
+    assert list(frame['service'].astype(str)) == ['СОДЕРЖАНИЕ ЖИЛЬЯ', 'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ'] * 2
+    assert frame['service_id'].dtype == 'int32'
+    assert list(frame['period_key']) == [202401, 202401, 202402, 202402]
+
+
+def test_tariff_changes_are_matched_by_calendar_month(make_bill):
+    # Март 2023 пропущен: в апреле сравнение м/м не с февралем, а пустое
+    bills = [water_bill(make_bill, 2023, 1, 40.0, 5.0), water_bill(make_bill, 2023, 2, 42.0, 5.0),
+             water_bill(make_bill, 2023, 4, 44.0, 6.0), water_bill(make_bill, 2024, 1, 50.0, 5.0)]
+    trends = service_trends(services_frame(bills))
+
+    assert list(trends['period']) == ['Январь 2023', 'Февраль 2023', 'Апрель 2023', 'Январь 2024']
+    assert trends['tariff_mom'].iloc[1] == pytest.approx(0.05)
+    assert math.isnan(trends['tariff_mom'].iloc[2])
+    assert trends['tariff_yoy'].iloc[3] == pytest.approx(0.25)
+    assert math.isnan(trends['tariff_yoy'].iloc[2])
+
+
+def test_outlier_month_is_flagged_per_account(make_bill):
+    bills = [water_bill(make_bill, 2024, month, 40.0, 5.0) for month in range(1, 12)]
+    bills.append(water_bill(make_bill, 2024, 12, 40.0, 50.0))
+    # Другой счет с постоянными суммами не получает выбросов
+    bills += [water_bill(make_bill, 2024, month, 40.0, 5.0, account='5000000002') for month in range(1, 13)]
+    trends = service_trends(services_frame(bills), z_threshold=3.0)
+
+    flagged = trends[trends['outlier']]
+    assert list(zip(flagged['account'], flagged['period'])) == [('5000000001', 'Декабрь 2024')]
+    assert (trends.loc[trends['account'] == '5000000002', 'z_score'] == 0).all()
+
+
+def test_consumption_trend_slope(make_bill):
+    bills = [water_bill(make_bill, 2024, month, 40.0, 4.0 + month) for month in range(1, 7)]
+    trends = consumption_trends(services_frame(bills))
+    assert len(trends) == 1
+    assert trends['slope'].iloc[0] == pytest.approx(1.0)
+    assert trends['n'].iloc[0] == 6
+
+
+def test_empty_frame_gives_empty_sheets():
+    frame = services_frame([])
+    assert service_trends(frame).empty
+    assert trends_sheet(frame).empty
+    assert consumption_trends(frame).empty
+
+
+def test_trends_sheet_headers(make_bill):
+    sheet = trends_sheet(services_frame([water_bill(make_bill, 2024, 1, 40.0, 5.0)]))
+    assert list(sheet.columns) == ['Лицевой счет', 'Услуга', 'Период', 'Тариф', 'Тариф м/м, %', 'Тариф г/г, %',
+                                   'Объем', 'Объем м/м, %', 'Сумма', 'Z-оценка суммы', 'Выброс']
+    assert sheet['Услуга'].iloc[0] == 'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ'
+
+
+def test_sheet_parts_continue_past_row_limit():
+    frame = pd.DataFrame({'value': range(10)})
+    parts = sheet_parts(frame, 'Аналитика', max_rows=4)
+    # Лист вмещает заголовок и 3 строки
+    assert [name for name, _ in parts] == ['Аналитика', 'Аналитика 2', 'Аналитика 3', 'Аналитика 4']
+    assert pd.concat(part for _, part in parts).equals(frame)
+    assert [(name, len(part)) for name, part in sheet_parts(frame.iloc[:0], 'Аналитика')] == [('Аналитика', 0)]
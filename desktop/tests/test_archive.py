@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Чтение ЕПД прямо из ZIP-архивов без распаковки на диск (epd_archive)"""
+
+import zipfile
+
+import pytest
+
+from epd_archive import find_pdf_files, open_source
+from epd_bundle import BundleParser
+from epd_dedup import content_hash, file_hash
+
+
+class _LegacyZipInfo(zipfile.ZipInfo):
+    """Запись с именем в кодировке DOS без флага UTF-8 - как у архиваторов Windows"""
+
+    def _encodeFilenameFlags(self):
+        return self.filename.encode('cp437'), self.flag_bits
+
+
+def _legacy_name(name: str) -> str:
+    return name.encode('cp866').decode('cp437')
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / 'квитанции.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('ЕПД_utf8.pdf', b'%PDF utf8')
+        archive.writestr(_LegacyZipInfo(_legacy_name('ЕПД_cp866.pdf')), b'%PDF cp866')
+        archive.writestr(_LegacyZipInfo(_legacy_name('2024/Январь/ЕПД_вложенный.pdf')), b'%PDF nested')
+        archive.writestr('Счет.pdf', b'%PDF other')
+        archive.writestr('ЕПД_папка.pdf/', b'')
+    (tmp_path / 'ЕПД_диск.pdf').write_bytes(b'%PDF disk')
+    return path
+
+
+def test_find_pdf_files_in_archive(archive, tmp_path):
+    assert find_pdf_files(tmp_path) == sorted([
+        tmp_path / 'ЕПД_диск.pdf',
+        archive / 'ЕПД_utf8.pdf',
+        archive / 'ЕПД_cp866.pdf',
+        archive / '2024' / 'Январь' / 'ЕПД_вложенный.pdf',
+    ])
+
+
+def test_open_source(archive, tmp_path):
+    with open_source(tmp_path / 'ЕПД_диск.pdf') as file:
+        assert file.read() == b'%PDF disk'
+    with open_source(archive / 'ЕПД_utf8.pdf') as file:
+        assert file.read() == b'%PDF utf8'
+    with open_source(archive / 'ЕПД_cp866.pdf') as file:
+        assert file.read() == b'%PDF cp866'
+    with open_source(archive / '2024' / 'Январь' / 'ЕПД_вложенный.pdf') as file:
+        assert file.read() == b'%PDF nested'
+    assert file_hash(archive / 'ЕПД_cp866.pdf') == content_hash(b'%PDF cp866')
+
+
+def test_open_source_missing_member(archive):
+    with pytest.raises(FileNotFoundError):
+        open_source(archive / 'ЕПД_нет.pdf')
+
+
+def test_bundles_from_archive_in_worker_processes(make_pdf, tmp_path):
+    sources = tmp_path / 'исходные'
+    sources.mkdir()
+    path = tmp_path / 'пачки.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        for number in range(2):
+            accounts = [(f'5{number}{account:08d}', 'Январь 2024') for account in range(60)]
+            bundle = make_pdf(f'ЕПД_пачка_{number}.pdf', *accounts, folder=sources)
+            archive.write(bundle, bundle.name)
+
+    pdf_files = find_pdf_files(tmp_path)
+    # Как в main: хеши считаются до разбора, и архив уже открыт в этом процессе
+    for pdf_file in pdf_files:
+        file_hash(pdf_file)
+
+    with BundleParser(workers=4, min_parallel_pages=2) as parser:
+        for number, pdf_file in enumerate(pdf_files):
+            bills = parser.parse_pdf(str(pdf_file))
+            assert [bill['лицевой_счет'] for bill in bills] == [f'5{number}{account:08d}' for account in range(60)]
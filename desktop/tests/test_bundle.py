@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Разбор пачек: деление на квитанции и параллельный разбор (epd_bundle)"""
+
+import pytest
+
+from epd_bundle import BundleParser, ParseError, bill_ranges
+
+
+def header(account, period='Январь 2024'):
+    return f'ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА {period}\nЛицевой счет: {account}\n'
+
+
+def test_bill_ranges_split_by_account_and_period():
+    pages = [
+        'Реестр квитанций',                          # титульный лист - к первой квитанции
+        header('5000000001'),
+        'продолжение таблицы',                       # страница без шапки - к текущей
+        header('5000000001', 'Февраль 2024'),        # тот же счет, другой период
+        header('5000000002', 'Февраль 2024'),
+        header('5000000002', 'Февраль 2024'),        # повтор шапки на второй странице
+    ]
+    assert bill_ranges(pages) == [(0, 3), (3, 4), (4, 6)]
+
+
+def test_bill_ranges_without_headers():
+    assert bill_ranges(['страница 1', 'страница 2']) == [(0, 2)]
+    assert bill_ranges([]) == [(0, 0)]
+
+
+@pytest.fixture
+def bundle(make_pdf):
+    bills = [(f'50000000{number:02d}', 'Январь 2024') for number in range(1, 11)]
+    return str(make_pdf('ЕПД_пачка.pdf', *bills, tariff_step=0.5))
+
+
+def test_parallel_bundle_matches_sequential(bundle):
+    with BundleParser(workers=1) as parser:
+        sequential = parser.parse_pdf(bundle)
+    with BundleParser(workers=2, min_parallel_pages=2) as parser:
+        parallel = parser.parse_pdf(bundle)
+        assert parser._executor is not None
+
+    assert [data['лицевой_счет'] for data in sequential] == [f'50000000{number:02d}' for number in range(1, 11)]
+    # Тарифы каждой квитанции свои - квитанции не перепутаны местами
+    assert [data['жилищные_услуги'][0]['тариф'] for data in sequential] == [32.15 + 0.5 * n for n in range(10)]
+    assert parallel == sequential
+
+
+def test_small_bundle_is_parsed_in_this_process(make_pdf):
+    path = make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024'))
+    with BundleParser(workers=4) as parser:
+        assert len(parser.parse_pdf(str(path))) == 2
+        assert parser._executor is None
+
+
+def test_iter_parse_reports_unreadable_file(make_pdf, tmp_path):
+    broken = tmp_path / 'ЕПД_битый.pdf'
+    broken.write_bytes(b'not a pdf')
+    paths = [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024')), broken]
+    with BundleParser(workers=1) as parser:
+        results = list(parser.iter_parse(paths))
+
+    assert [path for path, _, _ in results] == [str(path) for path in paths]
+    assert len(results[0][1]) == 1
+    assert isinstance(results[1][1], ParseError) and not results[1][1].quarantined
+    assert set(results[0][2]) == {'wait', 'parse'}
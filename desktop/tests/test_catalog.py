@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Быстрый каталог по шапкам квитанций (--headers-only)"""
+
+import pytest
+
+from epd_parser import HEADER_FIELDS, EPDParser, build_catalog
+
+HEADER = ('ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА Январь 2024\nЛицевой счет: 5000000001\n'
+          'ФИО: ИВАНОВ ИВАН\nАдрес: г. Москва, ул. Ленина, д. 1\nИТОГО К ОПЛАТЕ: 150 руб. 00 коп.\n')
+
+
+def test_header_pages_stop_once_all_fields_found():
+    def pages():
+        yield 'ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА Январь 2024\n'
+        yield HEADER[HEADER.index('Лицевой'):]
+        raise AssertionError("страница после шапки не должна декодироваться")
+
+    header = EPDParser().parse_header_pages(pages())
+    assert {field: header[field] for field in HEADER_FIELDS} == {
+        'период': 'Январь 2024', 'лицевой_счет': '5000000001', 'адрес': 'г. Москва, ул. Ленина, д. 1',
+        'итого_к_оплате': '150 руб. 00 коп.'}
+
+
+def test_header_pdf_reads_only_first_pages(make_pdf):
+    path = str(make_pdf('ЕПД_пачка.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Февраль 2024')))
+    header = EPDParser().parse_header_pdf(path)
+    assert (header['лицевой_счет'], header['период']) == ('5000000001', 'Январь 2024')
+    assert EPDParser().parse_header_pdf(str(path) + '.нет') is None
+
+
+def test_catalog_lists_header_of_each_file(make_pdf, tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('openpyxl')
+
+    broken = tmp_path / 'ЕПД_битый.pdf'
+    broken.write_bytes(b'not a pdf')
+    files = [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024')), broken,
+             make_pdf('ЕПД_2.pdf', ('5000000002', 'Февраль 2024'))]
+    output = tmp_path / 'каталог.xlsx'
+    assert build_catalog(files, str(output)) == 2
+
+    catalog = pd.read_excel(output, sheet_name='Каталог', dtype={'Лицевой счет': str})
+    assert list(catalog.columns) == ['Файл', 'Период', 'Лицевой счет', 'Адрес', 'Итого к оплате']
+    assert list(zip(catalog['Файл'], catalog['Период'], catalog['Лицевой счет'])) == [
+        ('ЕПД_1.pdf', 'Январь 2024', '5000000001'), ('ЕПД_2.pdf', 'Февраль 2024', '5000000002')]
+    # Шапку разбирает парсер шаблона: итог к оплате с учетом страхования
+    assert list(catalog['Итого к оплате']) == [3820.34, 3820.34]
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Корпус извлеченного текста и повторный разбор без чтения PDF (epd_corpus)"""
+
+import pytest
+
+import epd_bundle
+from epd_bundle import BundleParser
+from epd_corpus import CORPUS_NAME, TextCorpus, reparse
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    return tmp_path / CORPUS_NAME
+
+
+def test_pages_round_trip_per_extractor(corpus_path):
+    with TextCorpus(corpus_path) as corpus:
+        corpus.put('h1', ['страница 1', 'Лицевой счет: 5000000001'], 'ЕПД_1.pdf')
+        assert corpus.get('h1') == ['страница 1', 'Лицевой счет: 5000000001']
+        assert corpus.get('h2') is None
+        assert len(corpus) == 1
+
+    # Текст другой версии извлечения хранится отдельно и не выдается
+    with TextCorpus(corpus_path, extractor='другой/1') as corpus:
+        assert corpus.get('h1') is None
+        assert len(corpus) == 0
+
+
+def test_file_in_corpus_is_not_decoded_again(make_pdf, corpus_path, monkeypatch):
+    path = str(make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024')))
+    with BundleParser(workers=1, corpus_path=corpus_path) as parser:
+        first = parser.parse_pdf(path)
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("PDF из корпуса декодируется заново")
+
+    monkeypatch.setattr(epd_bundle.PyPDF2, 'PdfReader', no_decoding)
+    with BundleParser(workers=1, corpus_path=corpus_path) as parser:
+        assert parser.parse_pdf(path) == first
+    assert len(first) == 2
+
+
+def test_reparse_without_pdf_files(make_pdf, corpus_path):
+    paths = [make_pdf('ЕПД_2.pdf', ('5000000002', 'Февраль 2024')),
+             make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), ('5000000003', 'Январь 2024'))]
+    expected = {}
+    with BundleParser(workers=1, corpus_path=corpus_path) as parser:
+        for path in paths:
+            expected[str(path)] = parser.parse_pdf(str(path))
+    for path in paths:
+        path.unlink()
+
+    with TextCorpus(corpus_path) as corpus:
+        reparsed = list(reparse(corpus))
+    # Файлы по имени, квитанции те же, что при разборе PDF
+    assert [source for source, _ in reparsed] == sorted(expected)
+    assert dict(reparsed) == expected
+
+
+def test_reparse_corpus_drops_duplicates(make_pdf, corpus_path):
+    pytest.importorskip('pandas')
+    from epd_parser import reparse_corpus
+
+    paths = [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024')),
+             make_pdf('ЕПД_1_копия.pdf', ('5000000001', 'Январь 2024'))]
+    with BundleParser(workers=1, corpus_path=corpus_path) as parser:
+        for path in paths:
+            parser.parse_pdf(str(path))
+    with TextCorpus(corpus_path) as corpus:
+        assert len(corpus) == 2
+
+    analyzer = reparse_corpus(corpus_path)
+    assert [data['лицевой_счет'] for data in analyzer.monthly_data] == ['5000000001']
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Поиск дубликатов квитанций (epd_dedup)"""
+
+from epd_dedup import DuplicateDetector, bill_key, content_hash, file_hash
+
+
+def test_file_hash_of_copies(tmp_path):
+    data = b'%PDF-1.4 ' + bytes(range(256)) * 10000
+    original = tmp_path / 'ЕПД_1.pdf'
+    copy = tmp_path / 'ЕПД_копия.pdf'
+    other = tmp_path / 'ЕПД_2.pdf'
+    original.write_bytes(data)
+    copy.write_bytes(data)
+    other.write_bytes(data + b'\n')
+
+    assert file_hash(original) == file_hash(copy) == content_hash(data)
+    assert file_hash(other) != file_hash(original)
+
+
+def test_bill_key_normalization(make_bill):
+    key = bill_key(make_bill(account='50-000 00001', period='  Январь   2024 '))
+    assert key == ('5000000001', 'январь 2024', 150.0)
+    assert bill_key(make_bill(period='ЯНВАРЬ 2024')) == key
+
+
+def test_bill_key_without_totals(make_bill):
+    bill = make_bill()
+    del bill['суммы_по_категориям']
+    bill['итого_к_оплате_без_страхования'] = 123.456
+    assert bill_key(bill) == ('5000000001', 'январь 2024', 123.46)
+
+
+def test_bill_key_incomplete(make_bill):
+    assert bill_key(make_bill(account=None)) is None
+    assert bill_key(make_bill(period=None)) is None
+
+
+def test_check_hash():
+    detector = DuplicateDetector()
+    assert detector.check_hash('h1', 'a.pdf') is None
+    assert detector.check_hash('h2', 'b.pdf') is None
+    assert detector.check_hash('h1', 'c.pdf') == 'a.pdf'
+    # Оригиналом остается первый источник
+    assert detector.check_hash('h1', 'd.pdf') == 'a.pdf'
+
+    detector.clear()
+    assert detector.check_hash('h1', 'c.pdf') is None
+
+
+def test_check_bill(make_bill):
+    detector = DuplicateDetector()
+    assert detector.check_bill(make_bill(), 'a.pdf') is None
+    assert detector.check_bill(make_bill(period='Февраль 2024'), 'b.pdf') is None
+    assert detector.check_bill(make_bill(account='50000-00001'), 'c.pdf') == 'a.pdf'
+    # Тот же счет и период, но другой итог - не дубликат
+    assert detector.check_bill(make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 1.0),)), 'd.pdf') is None
+
+
+def test_check_bill_without_key(make_bill):
+    detector = DuplicateDetector()
+    assert detector.check_bill(make_bill(account=None), 'a.pdf') is None
+    assert detector.check_bill(make_bill(account=None), 'b.pdf') is None
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""Интерфейс без окна: разбор файлов, таблица услуг и перепроверка сеанса (epd_gui)"""
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+pytest.importorskip('tkinter')
+
+import epd_gui
+
+
+class FakeVar:
+    """Переменная Tk без окна"""
+
+    def __init__(self, value=''):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+    def trace_add(self, mode, callback):
+        pass
+
+
+class FakeRoot:
+    """Окно без Tk: отложенные вызовы after копятся и выполняются в run_until"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def title(self, text):
+        pass
+
+    def geometry(self, size):
+        pass
+
+    def after(self, ms, callback=None, *args):
+        self.jobs.append((callback, args))
+        return len(self.jobs)
+
+    def after_idle(self, callback, *args):
+        return self.after(0, callback, *args)
+
+    def after_cancel(self, job):
+        pass
+
+    def run_until(self, done, timeout=30.0):
+        """Выполняет отложенные вызовы, пока done() не станет истинным"""
+        deadline = time.monotonic() + timeout
+        while not done():
+            assert self.jobs, "нет отложенных вызовов, а условие не выполнено"
+            assert time.monotonic() < deadline, "интерфейс не закончил работу вовремя"
+            callback, args = self.jobs.pop(0)
+            callback(*args)
+            time.sleep(0.01)
+
+
+class FakeTree:
+    """Таблица услуг: видимые строки в порядке показа"""
+
+    def __init__(self):
+        self.rows = {}
+        self.attached = []
+
+    def insert(self, parent, index, values):
+        item_id = f'I{len(self.rows) + 1}'
+        self.rows[item_id] = values
+        self.attached.append(item_id)
+        return item_id
+
+    def get_children(self):
+        return tuple(self.attached)
+
+    def detach(self, *items):
+        self.attached = [item for item in self.attached if item not in items]
+
+    def move(self, item, parent, index):
+        self.attached.append(item)
+
+    def delete(self, *items):
+        self.detach(*items)
+        for item in items:
+            self.rows.pop(item, None)
+
+    def item(self, item_id, option=None, values=None):
+        if values is not None:
+            self.rows[item_id] = values
+        return self.rows[item_id]
+
+
+def fake_setup_ui(app):
+    """Виджеты, которые использует логика приложения, без Tk"""
+    app.action_buttons = [mock.Mock() for _ in range(6)]
+    app.status_label = mock.Mock()
+    app.files_listbox = mock.Mock()
+    app.info_text = mock.Mock()
+    app.summary_text = mock.Mock()
+    app.period_from_box = mock.Mock()
+    app.period_to_box = mock.Mock()
+    app.services_tree = FakeTree()
+    app.services_checkboxes = {}
+    app.service_index = epd_gui.ServiceIndex()
+    for name in ('filter_name', 'filter_period_from', 'filter_period_to', 'filter_amount_min', 'filter_amount_max'):
+        setattr(app, name, FakeVar())
+    app.filter_category = FakeVar('Все')
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(epd_gui.tk, 'BooleanVar', FakeVar)
+    monkeypatch.setattr(epd_gui.tk, 'StringVar', FakeVar)
+    monkeypatch.setattr(epd_gui.EPDGuiApp, 'setup_ui', fake_setup_ui)
+    for name in ('showinfo', 'showwarning', 'showerror'):
+        monkeypatch.setattr(epd_gui.messagebox, name, mock.Mock())
+    app = epd_gui.EPDGuiApp(FakeRoot())
+    yield app
+    app.parser.close()
+
+
+def process(app, paths):
+    app.loaded_files = [str(path) for path in paths]
+    app.process_files()
+    app.root.run_until(lambda: app.parse_results is None)
+
+
+def test_gui_documents_are_parsed_by_the_gui_parser(app, make_pdf):
+    paths = [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024')),
+             make_pdf('ЕПД_2.pdf', ('5000000001', 'Февраль 2024'))]
+    process(app, paths)
+
+    # Результат тот же, что у парсера интерфейса, а не у парсера шаблона консольной версии
+    expected = []
+    for path in paths:
+        data = epd_gui.EPDParser().parse_pdf(str(path))
+        data['file_path'] = str(path)
+        expected.append(data)
+    assert app.parsed_data == expected
+    assert app.parse_counts == {'success': 2, 'error': 0, 'duplicate': 0, 'quarantine': 0}
+
+
+def test_files_are_parsed_in_a_worker_thread(app, make_pdf, tmp_path):
+    paths = [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024')),
+             tmp_path / 'ЕПД_битый.pdf',
+             make_pdf('ЕПД_3.pdf', ('5000000001', 'Февраль 2024'))]
+    paths[1].write_bytes(b'not a pdf')
+
+    app.loaded_files = [str(path) for path in paths]
+    app.process_files()
+    # Пока поток разбирает файлы, кнопки, меняющие данные, отключены
+    for button in app.action_buttons:
+        button.state.assert_called_with(['disabled'])
+
+    app.root.run_until(lambda: app.parse_results is None)
+    for button in app.action_buttons:
+        button.state.assert_called_with(['!disabled'])
+    # Квитанции пачки и следующих файлов - в порядке файлов; битый файл - ошибка, а не остановка
+    assert [(data['лицевой_счет'], data['период']) for data in app.parsed_data] == [
+        ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024'), ('5000000001', 'Февраль 2024')]
+    assert app.parse_counts == {'success': 3, 'error': 1, 'duplicate': 0, 'quarantine': 0}
+    assert len(app.services_tree.get_children()) == len(app.service_index) == 12
+    # По умолчанию разбор в этом процессе: процессы-исполнители не создаются
+    assert app.parser._executor is None
+
+
+def test_filter_applies_to_rows_added_during_parsing(app, make_pdf):
+    app.filter_name.set('вод')
+    process(app, [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024'))])
+
+    shown = [app.services_tree.item(item)[3] for item in app.services_tree.get_children()]
+    assert shown == ['ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ', 'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ']
+
+
+def test_time_limit_is_opt_in(app, make_pdf, monkeypatch):
+    supervisor = mock.Mock(side_effect=AssertionError("надзор без запроса пользователя"))
+    monkeypatch.setattr(epd_gui, 'SupervisedParser', supervisor)
+    process(app, [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'))])
+    assert len(app.parsed_data) == 1
+    supervisor.assert_not_called()
+
+
+def test_time_limit_must_be_positive(app, make_pdf):
+    app.use_time_limit.set(True)
+    app.time_limit.set('ноль')
+    app.loaded_files = [str(make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024')))]
+    app.process_files()
+    epd_gui.messagebox.showwarning.assert_called_once()
+    assert app.parse_results is None
+
+
+def test_supervised_parsing_with_time_limit(app, make_pdf):
+    app.use_time_limit.set(True)
+    app.time_limit.set('60')
+    paths = [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024')),
+             make_pdf('ЕПД_2.pdf', ('5000000001', 'Февраль 2024'))]
+    process(app, paths)
+
+    # Исполнители (spawn) разбирают тем же парсером интерфейса, что и разбор в этом процессе
+    expected = []
+    for path in paths:
+        for data in app.parser.parse_pdf(str(path)):
+            data['file_path'] = str(path)
+            expected.append(data)
+    assert app.parsed_data == expected
+    assert app.parse_counts == {'success': 3, 'error': 0, 'duplicate': 0, 'quarantine': 0}
+
+
+def test_file_over_time_limit_is_quarantined(app, make_pdf, monkeypatch):
+    app.use_time_limit.set(True)
+    app.time_limit.set('0,5')
+    parsed_files = iter([('ЕПД_1.pdf', epd_gui.ParseError('превышено время', '0.6 с', quarantined=True), {})])
+    monkeypatch.setattr(epd_gui, 'SupervisedParser',
+                        mock.Mock(return_value=mock.Mock(iter_parse=mock.Mock(return_value=parsed_files))))
+    process(app, [make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'))])
+
+    epd_gui.SupervisedParser.assert_called_once_with(time_limit=0.5, parser_class=epd_gui.EPDParser,
+                                                     templates=epd_gui.GUI_TEMPLATES, start_method='spawn')
+    assert app.parse_counts['quarantine'] == 1
+    assert 'снято по лимиту времени' in app.status_label.config.call_args.kwargs['text']
+
+
+def test_workspace_is_revalidated_in_a_worker_thread(app, make_pdf, tmp_path, monkeypatch):
+    changed = make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'))
+    missing = make_pdf('ЕПД_2.pdf', ('5000000002', 'Январь 2024'))
+    process(app, [changed, missing])
+    snapshot = tmp_path / f'сеанс{epd_gui.SNAPSHOT_EXTENSION}'
+    monkeypatch.setattr(epd_gui.filedialog, 'asksaveasfilename', mock.Mock(return_value=str(snapshot)))
+    app.save_workspace()
+
+    # После сохранения первый файл заменен другой квитанцией, второй удален
+    make_pdf('ЕПД_1.pdf', ('5000000001', 'Февраль 2024'), ('5000000003', 'Февраль 2024'))
+    missing.unlink()
+    threads = []
+    parse_pdf = app.parser.parse_pdf
+    monkeypatch.setattr(app.parser, 'parse_pdf',
+                        lambda path: threads.append(threading.current_thread()) or parse_pdf(path))
+    monkeypatch.setattr(epd_gui.filedialog, 'askopenfilename', mock.Mock(return_value=str(snapshot)))
+    app.open_workspace()
+    for button in app.action_buttons:
+        button.state.assert_called_with(['disabled'])
+
+    app.root.run_until(lambda: app.parse_results is None)
+    for button in app.action_buttons:
+        button.state.assert_called_with(['!disabled'])
+    assert threads and threading.main_thread() not in threads
+    # Изменившийся файл разобран заново, данные удаленного файла остались из снимка
+    assert sorted((data['лицевой_счет'], data['период']) for data in app.parsed_data) == [
+        ('5000000001', 'Февраль 2024'), ('5000000002', 'Январь 2024'), ('5000000003', 'Февраль 2024')]
+    assert app.file_hashes[str(changed)] == epd_gui.file_hash(str(changed))
+    assert len(app.services_tree.get_children()) == 12
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""Журнал пакетной обработки и продолжение прерванного запуска (epd_journal)"""
+
+import json
+
+import pytest
+
+from epd_journal import JOURNAL_NAME, JOURNAL_VERSION, BatchJournal
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return tmp_path / JOURNAL_NAME
+
+
+def test_resume_completed(journal_path, make_bill):
+    journal = BatchJournal(journal_path)
+    started = journal.started
+    journal.record('ЕПД_1.pdf', 'h1', 'ok', [make_bill()])
+    journal.record('ЕПД_2.pdf', 'h2', 'error')
+    journal.close()
+
+    resumed = BatchJournal(journal_path, resume=True)
+    try:
+        # Время начала пакета общее для запуска и продолжения
+        assert resumed.started == started
+        entry = resumed.completed('ЕПД_1.pdf', 'h1')
+        assert entry['status'] == 'ok'
+        assert resumed.result(entry) == [make_bill()]
+        # Файл с ошибкой разбирается заново
+        assert resumed.completed('ЕПД_2.pdf', 'h2') is None
+        # Файл изменился после записи - обрабатывается заново
+        assert resumed.completed('ЕПД_1.pdf', 'другой') is None
+        assert resumed.completed('ЕПД_3.pdf', 'h3') is None
+    finally:
+        resumed.close()
+
+
+def test_failed_files_are_retried_on_resume(journal_path, make_bill):
+    journal = BatchJournal(journal_path)
+    journal.record('ЕПД_1.pdf', 'h1', 'quarantine')
+    journal.record('ЕПД_2.pdf', 'h2', 'duplicate')
+    journal.close()
+
+    resumed = BatchJournal(journal_path, resume=True)
+    assert resumed.completed('ЕПД_1.pdf', 'h1') is None
+    assert resumed.completed('ЕПД_2.pdf', 'h2')['status'] == 'duplicate'
+    resumed.record('ЕПД_1.pdf', 'h1', 'ok', [make_bill()])
+    resumed.close()
+
+    # Последняя запись о файле заменяет запись о сбое
+    again = BatchJournal(journal_path, resume=True)
+    try:
+        assert again.result(again.completed('ЕПД_1.pdf', 'h1')) == [make_bill()]
+    finally:
+        again.close()
+
+
+def test_record_after_resume(journal_path, make_bill):
+    journal = BatchJournal(journal_path)
+    journal.record('ЕПД_1.pdf', 'h1', 'ok', [make_bill()])
+    journal.close()
+
+    resumed = BatchJournal(journal_path, resume=True)
+    resumed.record('ЕПД_2.pdf', 'h2', 'ok', [make_bill(period='Февраль 2024')])
+    resumed.close()
+
+    again = BatchJournal(journal_path, resume=True)
+    try:
+        assert again.result(again.completed('ЕПД_1.pdf', 'h1'))[0]['период'] == 'Январь 2024'
+        assert again.result(again.completed('ЕПД_2.pdf', 'h2'))[0]['период'] == 'Февраль 2024'
+    finally:
+        again.close()
+
+
+def test_truncated_last_line(journal_path, make_bill):
+    journal = BatchJournal(journal_path)
+    journal.record('ЕПД_1.pdf', 'h1', 'ok', [make_bill()])
+    journal.close()
+    # Сбой во время записи: строка о втором файле оборвана
+    with open(journal_path, 'ab') as file:
+        file.write('{"path": "ЕПД_2.pdf", "hash": "h2", "sta'.encode('utf-8'))
+
+    resumed = BatchJournal(journal_path, resume=True)
+    try:
+        assert resumed.completed('ЕПД_1.pdf', 'h1') is not None
+        assert resumed.completed('ЕПД_2.pdf', 'h2') is None
+        resumed.record('ЕПД_2.pdf', 'h2', 'ok', [])
+    finally:
+        resumed.close()
+
+    lines = journal_path.read_bytes().splitlines()
+    assert json.loads(lines[-1])['path'] == 'ЕПД_2.pdf'
+
+    again = BatchJournal(journal_path, resume=True)
+    try:
+        assert again.result(again.completed('ЕПД_2.pdf', 'h2')) == []
+    finally:
+        again.close()
+
+
+def test_other_version_starts_fresh(journal_path):
+    with open(journal_path, 'w', encoding='utf-8') as file:
+        file.write(json.dumps({'journal': JOURNAL_VERSION - 1, 'started': '20200101_000000'}) + '\n')
+        file.write(json.dumps({'path': 'ЕПД_1.pdf', 'hash': 'h1', 'status': 'ok', 'result': []}) + '\n')
+
+    journal = BatchJournal(journal_path, resume=True)
+    try:
+        assert journal.started != '20200101_000000'
+        assert journal.completed('ЕПД_1.pdf', 'h1') is None
+    finally:
+        journal.close()
+    assert len(journal_path.read_bytes().splitlines()) == 1
+
+
+def test_without_resume_starts_fresh(journal_path):
+    journal = BatchJournal(journal_path)
+    journal.record('ЕПД_1.pdf', 'h1', 'ok', [])
+    journal.close()
+
+    fresh = BatchJournal(journal_path)
+    try:
+        assert fresh.completed('ЕПД_1.pdf', 'h1') is None
+    finally:
+        fresh.close()
+    assert len(journal_path.read_bytes().splitlines()) == 1
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Лексер таблицы начислений дает тот же результат, что и прежний разбор регулярными выражениями"""
+
+import pytest
+
+from epd_lexer import SECTIONS, _regex_parse_service_lines, parse_service_lines, tokenize
+
+# Текст ЕПД в том виде, в каком его извлекает PyPDF2
+BILL_TEXT = '\n'.join([
+    'ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА Январь 2024',
+    'Лицевой счет: 5000000001',
+    'Виды услуг Объем услуг Ед.изм. Тариф Начислено по тарифу Итого',
+    'Начисления за жилищные услуги',
+    'СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ 54,30 кв.м. 32,15 1 745,75 1 745,75',
+    'ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ 54,30 кв.м. 15,50 841,65 841,65',
+    'Начисления за коммунальные услуги',
+    'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ 5,00 куб.м. 45,20 226,00 226,00',
+    'ГОРЯЧЕЕ ВОДОСНАБЖЕНИЕ 3,20 куб. м. 210,15 672,48 672,48',
+    'ЭЛЕКТРОЭНЕРГИЯ 150,00 кВтч 6,17 925,50 925,50',
+    'ОТОПЛЕНИЕ (ОДН) 1,5 Гкал 2 107,35 3 161,03',
+    'Всего за январь 2024: 4411,38',
+    'ДОБРОВОЛЬНОЕ СТРАХОВАНИЕ 54,30 кв.м. 1,50 81,45 81,45',
+    '5 446 руб. 38 коп. ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ СЧЕТА БЕЗ УЧЕТА СТРАХОВАНИЯ',
+])
+
+
+@pytest.mark.parametrize('text', [
+    BILL_TEXT,
+    # «Итого к оплате» прежний разбор не считал концом раздела
+    'Начисления за коммунальные услуги\n'
+    'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ 5,00 куб.м. 45,20 226,00\n'
+    'Итого к оплате 500,00\n'
+    'ГОРЯЧЕЕ ВОДОСНАБЖЕНИЕ 3,00 куб.м. 10,00 30,00',
+    # Заголовки таблицы заглавными буквами пропускаются
+    'Начисления за жилищные услуги\nВИДЫ УСЛУГ 1,00 2,00 3,00\nОБЪЕМ УСЛУГ 12,00\n'
+    'СОДЕРЖАНИЕ 54,30 кв.м. 32,15 1 745,75',
+    # Разделы и «Всего за» - с учетом регистра
+    'НАЧИСЛЕНИЯ ЗА ЖИЛИЩНЫЕ УСЛУГИ\nСОДЕРЖАНИЕ 54,30 кв.м. 32,15 1 745,75',
+    'Начисления за коммунальные услуги\nотопление 1,5 Гкал 2000,00 3000,00\n'
+    'всего за январь 1,00\nвода 1,00 куб.м. 2,00 2,00',
+    # Заглавная буква только в единице измерения
+    'Начисления за коммунальные услуги\nэлектроэнергия 150,00 кВтч 6,17 925,50',
+    'Начисления за жилищные услуги\nРЕМОНТ 0,00 0,00\nУБОРКА 12,00',
+])
+def test_lexer_matches_regex_parser(text):
+    assert parse_service_lines(text) == _regex_parse_service_lines(text)
+
+
+def test_bill_text_services():
+    services, insurance = parse_service_lines(BILL_TEXT)
+    assert [service['название'] for service in services['жилищные_услуги']] == [
+        'СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ', 'ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ']
+    assert [service['ед_изм'] for service in services['коммунальные_услуги']] == [
+        'куб.м.', 'куб. м.', 'кВтч', 'Гкал']
+    assert services['коммунальные_услуги'][0]['итого'] == 226.0
+    assert insurance == 81.45
+
+
+def test_word_stops_before_unit():
+    tokens = tokenize('ПЛОЩАДЬ кв.м. 12,00')
+    assert [(kind, text) for kind, text, _ in tokens] == [
+        ('word', 'ПЛОЩАДЬ'), ('unit', 'кв.м.'), ('amount', '12,00')]
+
+    services, _ = parse_service_lines('Начисления за жилищные услуги\nПЛОЩАДЬ кв.м. 12,00 3,00 36,00')
+    assert services['жилищные_услуги'][0]['ед_изм'] == 'кв.м.'
+
+
+def test_section_keywords_case():
+    assert SECTIONS.classify('Виды услуг | Объем услуг') == 'заголовок'
+    assert SECTIONS.classify('НАЧИСЛЕНО ПО ТАРИФУ') == 'заголовок'
+    assert SECTIONS.classify('Итого к оплате') is None
+    assert SECTIONS.classify('НАЧИСЛЕНИЯ ЗА ЖИЛИЩНЫЕ УСЛУГИ') is None
+    assert SECTIONS.classify('Начисления за жилищные услуги Виды услуг') == 'жилищные_услуги'
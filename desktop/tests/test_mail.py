@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""PDF-вложения писем как источник ЕПД: mbox и папка с .eml (epd_mail)"""
+
+from email.message import EmailMessage
+
+import pytest
+
+import epd_dedup
+from epd_archive import open_source
+from epd_dedup import content_hash, file_hash, remember_hash
+from epd_mail import find_mail_attachments, iter_mbox, read_attachment
+
+
+@pytest.fixture(autouse=True)
+def known_hashes(monkeypatch):
+    # Хеши вложений, запомненные одним тестом, не должны подменять чтение в другом
+    monkeypatch.setattr(epd_dedup, '_known_hashes', {})
+
+
+def _message(*attachments, body='Квитанции за месяц'):
+    message = EmailMessage()
+    message['From'] = 'uk@example.com'
+    message['Subject'] = 'ЕПД'
+    message.set_content(body)
+    for name, data in attachments:
+        message.add_attachment(data, maintype='application', subtype='pdf', filename=name)
+    return message.as_bytes()
+
+
+def _mbox(path, *messages):
+    with open(path, 'wb') as file:
+        for message in messages:
+            file.write(b'From uk@example.com Mon Jan  1 00:00:00 2024\n')
+            file.write(message.replace(b'\nFrom ', b'\n>From '))
+            file.write(b'\n\n')
+    return path
+
+
+def test_mbox_attachments(tmp_path):
+    mbox = _mbox(tmp_path / 'inbox.mbox',
+                 _message(('ЕПД_1.pdf', b'%PDF one'), ('ЕПД_2.pdf', b'%PDF two')),
+                 _message(('ЕПД_1_повтор.pdf', b'%PDF one')),
+                 _message(('ЕПД_3.pdf', b'%PDF three')))
+
+    attachments = find_mail_attachments(mbox)
+    # Повторное вложение из второго письма отброшено
+    assert [path.name for path in attachments] == ['ЕПД_1.pdf', 'ЕПД_2.pdf', 'ЕПД_3.pdf']
+    contents = []
+    for path in attachments:
+        with open_source(path) as file:
+            contents.append(file.read())
+    assert contents == [b'%PDF one', b'%PDF two', b'%PDF three']
+
+    # Хеш, запомненный при просмотре ящика, совпадает с хешем содержимого
+    for path, data in zip(attachments, contents):
+        assert file_hash(path) == content_hash(data)
+    assert epd_dedup._known_hashes == {}
+    assert file_hash(attachments[2]) == content_hash(b'%PDF three')
+
+
+def test_eml_folder(tmp_path):
+    folder = tmp_path / 'письма'
+    (folder / 'январь').mkdir(parents=True)
+    (folder / 'a.eml').write_bytes(_message(('ЕПД_1.pdf', b'%PDF one')))
+    (folder / 'январь' / 'b.eml').write_bytes(_message(('ЕПД_2.pdf', b'%PDF two'), ('ЕПД_1.pdf', b'%PDF one')))
+    (folder / 'c.eml').write_bytes(_message())
+
+    attachments = find_mail_attachments(folder)
+    assert [path.name for path in attachments] == ['ЕПД_1.pdf', 'ЕПД_2.pdf']
+    assert attachments[1].parent.parent == folder / 'январь' / 'b.eml'
+    container = folder / 'январь' / 'b.eml'
+    assert read_attachment(container, attachments[1].relative_to(container).as_posix()) == b'%PDF two'
+
+
+def test_missing_attachment(tmp_path):
+    eml = tmp_path / 'a.eml'
+    eml.write_bytes(_message(('ЕПД_1.pdf', b'%PDF one')))
+    with pytest.raises(FileNotFoundError):
+        read_attachment(eml, '0/ЕПД_1.pdf')
+
+
+def test_escaped_from_lines(tmp_path):
+    mbox = tmp_path / 'inbox.mbox'
+    mbox.write_bytes(
+        b'From uk@example.com Mon Jan  1 00:00:00 2024\n'
+        b'Subject: 1\n\n'
+        b'>From the office\n'
+        b'>>From quoted\n'
+        b'\n'
+        b'From uk@example.com Mon Jan  1 00:00:00 2024\n'
+        b'Subject: 2\n\nbody\n'
+    )
+    messages = [message for _, message in iter_mbox(mbox)]
+    assert len(messages) == 2
+    assert messages[0] == b'Subject: 1\n\nFrom the office\n>From quoted\n\n'
+
+
+def test_remember_hash_skips_reading(tmp_path):
+    # Вложения нет в ящике: хеш берется из запомненного при чтении ящика
+    mbox = _mbox(tmp_path / 'inbox.mbox', _message())
+    path = mbox / '0' / '1' / 'ЕПД.pdf'
+    remember_hash(path, 'abc')
+    assert file_hash(str(path)) == 'abc'
+    # Хеш используется один раз - дальше вложение читается
+    with pytest.raises(FileNotFoundError):
+        file_hash(path)
+
+
+def test_remembered_hash_of_rewritten_mailbox(tmp_path):
+    mbox = _mbox(tmp_path / 'inbox.mbox', _message(('ЕПД_1.pdf', b'%PDF old')))
+    [path] = find_mail_attachments(mbox)
+
+    # Ящик перезаписан до разбора: по тому же пути теперь другое вложение
+    _mbox(mbox, _message(('ЕПД_1.pdf', b'%PDF new version')))
+    assert file_hash(path) == content_hash(b'%PDF new version')
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Разбор ЕПД консольным парсером: источники в памяти, позиционный разбор, общий парсер потоков (epd_parser)"""
+
+import io
+
+import pytest
+
+from epd_parser import EPDParser
+
+
+class OneWayStream(io.RawIOBase):
+    """Поток без перемотки - как тело письма или сокет"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def readinto(self, target):
+        return self._data.readinto(target)
+
+
+@pytest.fixture
+def pdf_data(make_pdf):
+    path = make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'))
+    return str(path), path.read_bytes()
+
+
+@pytest.mark.parametrize('wrap', [bytes, bytearray, memoryview])
+def test_parse_bytes_matches_parse_pdf(pdf_data, wrap):
+    path, data = pdf_data
+    expected = EPDParser().parse_pdf(path)
+    assert expected['лицевой_счет'] == '5000000001'
+    assert expected['суммы_по_категориям']['Жилищные услуги'] == pytest.approx(2587.39)
+    assert EPDParser().parse_bytes(wrap(data)) == expected
+
+
+def test_parse_stream_reads_non_seekable_stream(pdf_data):
+    path, data = pdf_data
+    stream = OneWayStream(data)
+    assert not stream.seekable()
+    assert EPDParser().parse_stream(stream) == EPDParser().parse_pdf(path)
+
+
+def test_parse_bytes_leaves_buffer_unchanged(pdf_data):
+    _, data = pdf_data
+    buffer = bytearray(data)
+    EPDParser().parse_bytes(memoryview(buffer))
+    assert buffer == data
+
+
+def services(data):
+    return [(item['название'], item['объем'], item['ед_изм'], item['тариф'], item['итого'])
+            for category in ('жилищные_услуги', 'коммунальные_услуги') for item in data[category]]
+
+
+def test_positional_parsing_reads_columns_by_coordinates(make_pdf):
+    path = str(make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), cells=True))
+    data = EPDParser(positional=True).parse_pdf(path)
+    assert services(data) == [
+        ('СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ', 54.3, 'кв.м.', 32.15, 1745.74),
+        ('ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ', 54.3, 'кв.м.', 15.5, 841.65),
+        ('ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ', 5.0, 'куб.м.', 45.2, 226.0),
+        ('ЭЛЕКТРОЭНЕРГИЯ', 150.0, 'кВтч', 6.17, 925.5),
+    ]
+    assert data['страхование'] == pytest.approx(81.45)
+    # В тексте ячейки идут отдельными строками - построчный шаблон не находит ни одной услуги
+    assert services(EPDParser().parse_pdf(path)) == []
+
+
+def test_layout_is_reused_for_bill_without_header_row(make_pdf):
+    parser = EPDParser(positional=True)
+    with open(make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), cells=True), 'rb') as file:
+        text, fragments, size = parser.extract_fragments_from_stream(file)
+    layouts = {}
+    first = parser.parse_text(text, fragments, size, layouts)
+    assert list(layouts) == [size]
+
+    # Продолжение таблицы без строки заголовков разбирается по раскладке, выученной раньше
+    headless = [fragment for fragment in fragments if fragment[3] not in ('Тариф', 'Итого')]
+    assert services(parser.parse_text(text, headless, size, layouts)) == services(first)
+    # Без кэша раскладку выучить не из чего
+    assert services(parser.parse_text(text, headless, size)) == []
+
+
+def test_bundle_parser_in_positional_mode(make_pdf):
+    from epd_bundle import BundleParser
+
+    path = make_pdf('ЕПД_пачка.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024'), cells=True)
+    with BundleParser(workers=1, positional=True, templates=[]) as parser:
+        bills = parser.parse_pdf(str(path))
+    assert [data['лицевой_счет'] for data in bills] == ['5000000001', '5000000002']
+    assert all(len(services(data)) == 4 for data in bills)
+
+
+@pytest.mark.parametrize('positional', [False, True])
+def test_one_parser_shared_across_threads(make_pdf, positional):
+    from concurrent.futures import ThreadPoolExecutor
+
+    paths = [str(make_pdf(f'ЕПД_{number}.pdf', (f'50000000{number:02d}', 'Январь 2024'), cells=positional))
+             for number in range(1, 9)]
+    expected = [EPDParser(positional=positional).parse_pdf(path) for path in paths]
+
+    parser = EPDParser(positional=positional)
+    settings = dict(vars(parser))
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(parser.parse_pdf, paths * 4))
+    assert results == expected * 4
+    # Разбор ничего не запоминает в парсере, каждый результат - новый словарь
+    assert vars(parser) == settings
+    assert len({id(data) for data in results}) == len(results)
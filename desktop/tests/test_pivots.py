@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Лист «Статистика» и сводные таблицы период × услуга и счет × период (epd_analytics)"""
+
+import pytest
+
+pytest.importorskip('pandas')
+
+import pandas as pd
+
+from epd_analytics import account_pivot, service_pivot, services_frame, statistics_frame
+from epd_parser import EPDAnalyzer
+
+
+@pytest.fixture
+def bills(make_bill):
+    return [
+        make_bill(period='Февраль 2024', housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 110.0),), utility=(('ХВС', 60.0),)),
+        make_bill(period='Январь 2024'),
+        make_bill(account='5000000002', period='Январь 2024', utility=(('Холодная вода', 40.0), ('ГВС', 90.0))),
+    ]
+
+
+def test_statistics_frame_matches_column_by_column(bills):
+    analyzer = EPDAnalyzer()
+    for bill in bills:
+        analyzer.add_epd(bill)
+    summary = analyzer.create_summary_dataframe()
+    stats = statistics_frame(summary).set_index('Категория')
+
+    for column in ('Жилищные услуги', 'Коммунальные услуги', 'ИТОГО'):
+        assert tuple(stats.loc[column]) == pytest.approx(
+            (summary[column].sum(), summary[column].mean(), summary[column].min(), summary[column].max()))
+    assert statistics_frame(pd.DataFrame({'Период': ['Январь 2024']})).empty
+
+
+def test_service_pivot_orders_periods_by_calendar(bills):
+    frame = services_frame(bills)
+    totals = service_pivot(frame, 'total')
+    assert list(totals['Период']) == ['Январь 2024', 'Февраль 2024']
+    # Синонимы сведены в одну колонку
+    assert totals.loc[0, 'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ'] == 90.0
+    assert list(totals['Итого']) == [380.0, 170.0]
+
+    volumes = service_pivot(frame, 'volume')
+    assert 'Итого' not in volumes.columns
+    assert volumes.loc[0, 'ГОРЯЧЕЕ ВОДОСНАБЖЕНИЕ'] == 1.0
+    assert service_pivot(services_frame([])).empty
+
+
+def test_account_pivot(bills):
+    analyzer = EPDAnalyzer()
+    for bill in bills:
+        analyzer.add_epd(bill)
+    pivot = account_pivot(analyzer.create_summary_dataframe())
+    assert list(pivot.columns) == ['Лицевой счет', 'Январь 2024', 'Февраль 2024', 'Всего']
+    pivot = pivot.set_index('Лицевой счет')
+    assert pivot.loc['5000000001'].tolist() == [150.0, 170.0, 320.0]
+    # Квитанции за период нет - пустая ячейка, а не ноль
+    assert pd.isna(pivot.loc['5000000002', 'Февраль 2024'])
+    assert pivot.loc['5000000002', 'Всего'] == 230.0
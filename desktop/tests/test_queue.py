@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Очередь распределенной обработки: аренда, истечение аренды и повторы (epd_queue)"""
+
+import pytest
+
+from epd_queue import JobQueue
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    paths = []
+    for number in (1, 2):
+        path = tmp_path / f'ЕПД_{number}.pdf'
+        path.write_bytes(b'%PDF-1.4 ' + bytes([number]) * 100)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def queue(tmp_path, pdfs):
+    with JobQueue(tmp_path / 'queue.db') as queue:
+        queue.add(pdfs)
+        yield queue
+
+
+def test_add_skips_known_and_copies(queue, pdfs, tmp_path):
+    copy = tmp_path / 'ЕПД_копия.pdf'
+    copy.write_bytes(pdfs[0].read_bytes())
+    assert queue.add(pdfs + [copy]) == 0
+    assert queue.counts() == {'pending': 2}
+
+
+def test_lease_and_complete(queue, pdfs, make_bill):
+    first = queue.lease('w1')
+    second = queue.lease('w2')
+    assert {first, second} == {str(path.resolve()) for path in pdfs}
+    assert queue.lease('w3') is None
+
+    assert queue.renew(first, 'w1')
+    assert queue.complete(first, 'w1', [make_bill()])
+    # Чужую аренду не завершить
+    assert not queue.complete(second, 'w1', [])
+    assert queue.counts() == {'done': 1, 'leased': 1}
+    assert list(queue.results()) == [(first, [make_bill()])]
+
+
+def test_expired_lease_is_reissued(queue, make_bill):
+    path = queue.lease('w1', lease_seconds=-1)
+    # Аренда первого исполнителя истекла - файл достается другому раньше свободных
+    assert queue.lease('w2') == path
+
+    assert not queue.renew(path, 'w1')
+    assert not queue.complete(path, 'w1', [make_bill()])
+    assert queue.complete(path, 'w2', [])
+    assert dict(queue.results())[path] == []
+
+
+def test_fail_retries_then_marks_failed(tmp_path, pdfs):
+    with JobQueue(tmp_path / 'queue.db', max_attempts=2) as queue:
+        queue.add(pdfs[:1])
+
+        path = queue.lease('w1')
+        queue.fail(path, 'w1', 'ошибка 1')
+        assert queue.counts() == {'pending': 1}
+
+        assert queue.lease('w1') == path
+        queue.fail(path, 'w1', 'ошибка 2')
+        assert queue.counts() == {'failed': 1}
+        assert queue.failures() == [(path, 2, 'ошибка 2')]
+        assert queue.lease('w1') is None
+
+
+def test_lease_expired_on_last_attempt(tmp_path, pdfs):
+    with JobQueue(tmp_path / 'queue.db', max_attempts=1) as queue:
+        queue.add(pdfs[:1])
+
+        path = queue.lease('w1', lease_seconds=-1)
+        # Исполнитель пропал на последней попытке - файл не выдается снова
+        assert queue.lease('w2') is None
+        assert queue.failures() == [(path, 1, 'истекла аренда')]
+
+
+def test_workers_in_separate_processes_share_one_queue(make_pdf, tmp_path):
+    import multiprocessing
+    import sqlite3
+
+    from epd_queue import merge, run_worker
+
+    accounts = [f'50000000{number:02d}' for number in range(1, 9)]
+    db_path = tmp_path / 'queue.db'
+    with JobQueue(db_path) as queue:
+        assert queue.add(make_pdf(f'ЕПД_{account}.pdf', (account, 'Январь 2024')) for account in accounts) == 8
+
+    # Исполнители - отдельные процессы со своими соединениями, как на разных машинах
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        done = pool.starmap(run_worker, [(str(db_path), f'w{number}') for number in range(3)])
+    assert sum(done) == 8
+
+    with JobQueue(db_path) as queue:
+        assert queue.counts() == {'done': 8}
+    # Каждый файл выдан в аренду ровно один раз
+    connection = sqlite3.connect(db_path)
+    try:
+        assert connection.execute('SELECT DISTINCT attempts FROM jobs').fetchall() == [(1,)]
+    finally:
+        connection.close()
+
+    analyzer = merge(db_path)
+    assert sorted(data['лицевой_счет'] for data in analyzer.monthly_data) == accounts
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Сверка сумм к оплате с банковскими выписками (epd_reconcile)"""
+
+import pytest
+
+from epd_reconcile import (STATUS_NO_BILL, STATUS_NO_KEY, STATUS_OVERPAID, STATUS_PAID, STATUS_PARTIAL,
+                           STATUS_UNPAID, load_statement, load_statements, reconcile_bills)
+
+
+OWN_ACCOUNT = '40702810000000000001'
+
+CSV_STATEMENT = '''Дата;Сумма;Назначение платежа;Счет получателя
+10.02.2024;1 500,00;Оплата ЖКУ л/с 5000000001 за январь 2024;40702810000000000001
+11.02.2024;200,50;Оплата по лицевому счету № 5000-000002 период 01.2024;40702810000000000001
+12.02.2024;-300,00;Комиссия банка;40702810000000000001
+13.02.2024;700,00;Оплата ЖКУ л/с 5000000003 за январь 2024;40702810000000000999
+'''
+
+ONE_C_STATEMENT = '''1CClientBankExchange
+ВерсияФормата=1.03
+РасчСчет=40702810000000000001
+СекцияДокумент=Платежное поручение
+Сумма=1500.00
+ПолучательСчет=40702810000000000001
+НазначениеПлатежа=Оплата ЖКУ лс 5000000001 Февраль 2024
+КонецДокумента
+СекцияДокумент=Платежное поручение
+Сумма=9000.00
+ПолучательСчет=40702810000000000777
+НазначениеПлатежа=Оплата поставщику по договору
+КонецДокумента
+КонецФайла
+'''
+
+
+def _write(path, text, encoding='utf-8'):
+    path.write_bytes(text.encode(encoding))
+    return path
+
+
+def test_csv_incoming_payments(tmp_path):
+    payments = load_statement(_write(tmp_path / 'выписка.csv', CSV_STATEMENT))
+    # Списание отброшено
+    assert list(payments['amount']) == [1500.0, 200.5, 700.0]
+    assert list(payments['account']) == ['5000000001', '5000000002', '5000000003']
+    assert list(payments['period_key']) == [202401, 202401, 202401]
+    assert set(payments['source']) == {'выписка.csv'}
+
+
+def test_csv_recipient_filter(tmp_path):
+    payments = load_statement(_write(tmp_path / 'выписка.csv', CSV_STATEMENT), OWN_ACCOUNT)
+    assert list(payments['account']) == ['5000000001', '5000000002']
+
+
+def test_csv_explicit_columns(tmp_path):
+    statement = 'Сумма,Назначение,Лицевой счет,Период\n100,Оплата,50-000-00001,март 2024\n'
+    payments = load_statement(_write(tmp_path / 'выписка.csv', statement))
+    assert list(payments['account']) == ['5000000001']
+    assert list(payments['period_key']) == [202403]
+
+
+def test_1c_incoming_only(tmp_path):
+    payments = load_statement(_write(tmp_path / 'kl_to_1c.txt', ONE_C_STATEMENT, 'cp1251'))
+    # Платеж с нашего счета поставщику - не поступление
+    assert list(payments['amount']) == [1500.0]
+    assert list(payments['account']) == ['5000000001']
+    assert list(payments['period_key']) == [202402]
+
+
+def test_1c_without_own_account(tmp_path):
+    statement = ONE_C_STATEMENT.replace('РасчСчет=40702810000000000001\n', '')
+    path = _write(tmp_path / 'kl_to_1c.txt', statement, 'cp1251')
+    with pytest.raises(ValueError):
+        load_statement(path)
+    # Свой счет можно указать явно
+    assert len(load_statement(path, OWN_ACCOUNT)) == 1
+
+
+def test_reconcile_statuses(tmp_path, make_bill):
+    statement = '''Сумма;Назначение платежа
+150,00;л/с 5000000001 за январь 2024
+100,00;л/с 5000000002 за январь 2024
+500,00;л/с 5000000003 за январь 2024
+80,00;л/с 5000000005 за январь 2024
+60,00;Оплата ЖКУ без реквизитов
+'''
+    payments = load_statements([_write(tmp_path / 'выписка.csv', statement)])
+    bills = [
+        make_bill(account='5000000001'),
+        make_bill(account='5000000002', due='150 руб. 00 коп.'),
+        make_bill(account='5000000003'),
+        make_bill(account='5000000004'),
+        make_bill(account=None),
+    ]
+
+    report = reconcile_bills(bills, payments)
+    statuses = dict(zip(report['Лицевой счет'], report['Статус']))
+    assert statuses['5000000001'] == STATUS_PAID
+    assert statuses['5000000002'] == STATUS_PARTIAL
+    assert statuses['5000000003'] == STATUS_OVERPAID
+    assert statuses['5000000004'] == STATUS_UNPAID
+    assert statuses['5000000005'] == STATUS_NO_BILL
+    # Квитанция без счета и платеж без реквизитов - в конце листа, без сопоставления
+    assert list(report['Статус'].iloc[-2:]) == [STATUS_NO_KEY, STATUS_NO_KEY]
+    assert list(report['Оплачено'].iloc[-2:]) == [0.0, 60.0]
+
+    partial = report[report['Лицевой счет'] == '5000000002'].iloc[0]
+    assert partial['К оплате'] == 150.0
+    assert partial['Разница'] == -50.0
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Индексы фильтра таблицы услуг GUI (epd_search)"""
+
+import pytest
+
+from epd_parser import period_key
+from epd_search import ServiceIndex, name_tokens
+
+ROWS = [
+    ('СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ', 'Январь 2024', 'Жилищные', 1745.74),
+    ('ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ', 'Январь 2024', 'Коммунальные', 226.0),
+    ('ГОРЯЧЕЕ ВОДОСНАБЖЕНИЕ', 'Февраль 2024', 'Коммунальные', 1250.5),
+    ('ВОДООТВЕДЕНИЕ', 'Март 2024', 'Коммунальные', 310.0),
+    ('ВЗНОС НА КАПИТАЛЬНЫЙ РЕМОНТ', 'Март 2024', 'Жилищные', 841.65),
+    ('Электроэнергия день', None, 'Коммунальные', None),
+]
+
+
+@pytest.fixture
+def index():
+    index = ServiceIndex()
+    for number, (name, period, category, amount) in enumerate(ROWS):
+        index.add(f'I{number}', name, period, category, amount)
+    return index
+
+
+def brute_force(name='', period_from=None, period_to=None, categories=None, amount_min=None, amount_max=None):
+    """Тот же фильтр перебором всех строк"""
+    result = []
+    for number, (row_name, period, category, amount) in enumerate(ROWS):
+        words = name_tokens(row_name)
+        if not all(any(fragment in word for word in words) for fragment in name_tokens(name)):
+            continue
+        key = period_key(period)
+        if (period_from or period_to) and (key is None or not (period_key(period_from) or 0) <= key
+                                           <= (period_key(period_to) or 999999)):
+            continue
+        if categories is not None and category not in categories:
+            continue
+        if (amount_min is not None or amount_max is not None) and (
+                amount is None or not (amount_min or 0) <= amount <= (amount_max if amount_max is not None
+                                                                      else float('inf'))):
+            continue
+        result.append(f'I{number}')
+    return result
+
+
+@pytest.mark.parametrize('query', [
+    {},
+    {'name': 'вод'},
+    {'name': 'ВОДО снаб'},
+    {'name': 'вод', 'categories': ['Коммунальные'], 'amount_max': 1000},
+    {'period_from': 'Февраль 2024'},
+    {'period_from': 'Январь 2024', 'period_to': 'Февраль 2024', 'amount_min': 500},
+    {'categories': []},
+    {'name': 'электро'},
+    {'name': 'нет такой услуги'},
+])
+def test_search_matches_brute_force(index, query):
+    assert index.search(**query) == brute_force(**query)
+
+
+def test_removed_rows_are_not_found(index):
+    index.remove('I1')
+    index.remove('неизвестная')
+    assert len(index) == len(ROWS) - 1
+    assert index.search(name='холодное') == []
+    assert 'I1' not in index.search()
+
+
+def test_new_words_after_search(index):
+    assert index.search(name='домофон') == []
+    index.add('I6', 'ДОМОФОН', 'Апрель 2024', 'Жилищные', 50.0)
+    # Кэш подстрок запроса сбрасывается, когда в словаре появляется новое слово
+    assert index.search(name='домофон') == ['I6']
+    assert index.search(period_from='Апрель 2024') == ['I6']
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Справочник услуг: синонимы, id и статистика кэша (epd_services)"""
+
+import json
+import sys
+
+import pytest
+
+from epd_services import ServiceDictionary, normalize_name
+
+
+def test_normalize_name():
+    assert normalize_name('  Холодное  водоснабжение, ') == 'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ'
+    assert normalize_name('Вывоз ТКО (твёрдые)') == 'ВЫВОЗ ТКО ТВЕРДЫЕ'
+    assert normalize_name('Э/Э') == 'Э/Э'
+
+
+def test_synonyms_share_one_id():
+    services = ServiceDictionary()
+    water = services.service_id('ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ')
+    assert services.service_id('хвс') == services.service_id('Хол. водоснабжение') == water
+    assert services.canonical_name('Холодная вода') == 'ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ'
+
+
+def test_unknown_service_gets_next_id():
+    services = ServiceDictionary()
+    known = len(services.names)
+    assert services.service_id('Домофон') == known
+    assert services.service_id('ДОМОФОН') == known
+    assert services.names[known] == 'ДОМОФОН'
+
+
+def test_custom_synonyms_from_json(tmp_path):
+    path = tmp_path / 'синонимы.json'
+    path.write_text(json.dumps({'ДОМОФОН': ['ЗПУ', 'ЗАПИРАЮЩЕЕ УСТРОЙСТВО']}, ensure_ascii=False), encoding='utf-8')
+    services = ServiceDictionary.from_json(path)
+    assert services.names == ['ДОМОФОН']
+    assert services.service_id('зпу') == 0
+    assert services.service_id('ХВС') == 1
+
+
+def test_stats_count_cache_hits():
+    services = ServiceDictionary()
+    for name in ('ХВС', 'ХВС', 'ГВС', 'ХВС'):
+        services.service_id(name)
+    stats = services.stats()
+    assert (stats['lookups'], stats['raw_names'], stats['services']) == (4, 2, 2)
+    assert stats['hit_rate'] == 0.5
+    assert 'попаданий в кэш 50.0%' in services.report()
+
+
+def test_report_is_not_printed_for_update(make_pdf, tmp_path, monkeypatch, capsys):
+    pytest.importorskip('openpyxl')
+    import epd_parser
+
+    folder = tmp_path / 'ЕПД'
+    folder.mkdir()
+    make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), folder=folder)
+    monkeypatch.setattr(sys, 'argv', ['epd_parser.py', str(folder), '--workers', '1'])
+    epd_parser.main()
+    assert 'Справочник услуг: 4 вариантов названий' in capsys.readouterr().out
+
+    # Дополнение книги не строит листы аналитики - справочник пуст, строка с нулями не печатается
+    workbook = next(folder.glob('EPD_Анализ_*.xlsx'))
+    make_pdf('ЕПД_2.pdf', ('5000000001', 'Февраль 2024'), folder=folder)
+    monkeypatch.setattr(sys, 'argv', ['epd_parser.py', str(folder), '--workers', '1', '--update', str(workbook)])
+    epd_parser.main()
+    output = capsys.readouterr().out
+    assert 'добавлено квитанций: 1' in output
+    assert 'Справочник услуг' not in output
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""История квитанций в SQLite (epd_store) и отчет по ней (EPDAnalyzer.from_store)"""
+
+import pytest
+
+from epd_parser import EPDAnalyzer
+from epd_store import EPDStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    with EPDStore(tmp_path / 'history.db') as store:
+        yield store
+
+
+def test_add_and_summary(store, make_bill):
+    saved = store.add_bills([
+        make_bill(period='Февраль 2024'),
+        make_bill(period='Январь 2024'),
+        make_bill(account='5000000002'),
+    ])
+    assert saved == 3
+
+    summary = store.summary_dataframe()
+    # Порядок - по периоду, затем по счету
+    assert list(summary['Период']) == ['Январь 2024', 'Январь 2024', 'Февраль 2024']
+    assert list(summary['Лицевой счет']) == ['5000000001', '5000000002', '5000000001']
+    assert list(summary['ИТОГО']) == [150.0, 150.0, 150.0]
+    # Страхования нет ни в одной квитанции - колонка не выводится
+    assert 'Добровольное страхование' not in summary
+
+
+def test_same_account_and_period_is_replaced(store, make_bill):
+    store.add_bills([make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 100.0),))])
+    store.add_bills([make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 300.0),))])
+
+    summary = store.summary_dataframe()
+    assert len(summary) == 1
+    assert summary['ИТОГО'].iloc[0] == 350.0
+    # Строки услуг замененной квитанции удалены вместе с ней
+    assert len(store.services_frame()) == 2
+
+
+def test_bills_without_key_are_kept(store, make_bill):
+    saved = store.add_bills([make_bill(account=None), make_bill(account=None)])
+    assert saved == 2
+    assert len(store.summary_dataframe()) == 2
+
+
+def test_filters(store, make_bill):
+    store.add_bills([
+        make_bill(period='Декабрь 2023'),
+        make_bill(period='Январь 2024'),
+        make_bill(period='Февраль 2024'),
+        make_bill(account='5000000002', period='Январь 2024'),
+    ])
+
+    assert len(store.summary_dataframe(account='5000000001')) == 3
+    assert list(store.summary_dataframe(period_from=202401, period_to=202401)['Лицевой счет']) == [
+        '5000000001', '5000000002']
+    housing, utility = store.detailed_dataframes(period_from=202402)
+    assert list(housing['Услуга']) == ['СОДЕРЖАНИЕ ЖИЛЬЯ']
+    assert list(utility['Сумма']) == [50.0]
+
+
+def test_services_frame(store, make_bill):
+    store.add_bills([make_bill(utility=(('ХОЛОДНОЕ ВОДОСНАБЖЕНИЕ', 50.0), ('ЭЛЕКТРОЭНЕРГИЯ', 70.0)))])
+
+    frame = store.services_frame()
+    assert list(frame['category']) == ['Жилищные', 'Коммунальные', 'Коммунальные']
+    assert list(frame['total']) == [100.0, 50.0, 70.0]
+    assert list(frame['period_key']) == [202401] * 3
+
+
+def test_analyzer_from_store(store, make_bill, tmp_path):
+    store.add_bills([make_bill(period='Январь 2024'), make_bill(period='Февраль 2024')])
+
+    analyzer = EPDAnalyzer.from_store(store, period_from=202402)
+    summary = analyzer.create_summary_dataframe()
+    assert list(summary['Период']) == ['Февраль 2024']
+
+    output = tmp_path / 'report.xlsx'
+    analyzer.save_to_excel(str(output))
+    assert output.exists()
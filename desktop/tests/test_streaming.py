@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Потоковая агрегация с ограниченной памятью: приемники Excel и CSV, накопители (epd_streaming)"""
+
+import pytest
+
+pytest.importorskip('openpyxl')
+
+from epd_streaming import StreamingAnalyzer
+
+
+class ListSink:
+    """Приемник строк в память: лист -> [строки]"""
+
+    def __init__(self):
+        self.sheets = {}
+        self.closed = False
+
+    def write(self, sheet_name, columns, row):
+        self.sheets.setdefault(sheet_name, []).append({column: row.get(column) for column in columns})
+
+    def close(self):
+        self.closed = True
+
+
+def test_repeated_bill_keeps_the_first(make_bill):
+    sink = ListSink()
+    analyzer = StreamingAnalyzer(sink)
+    for bill in (make_bill(), make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 120.0),)),
+                 make_bill(account=None), make_bill(account=None)):
+        analyzer.add_epd(bill)
+    analyzer.close()
+
+    # Строки первой квитанции уже записаны - повторная пропускается, а не заменяет
+    assert analyzer.skipped == 1
+    assert analyzer.bills_count == 3
+    assert [row['ИТОГО'] for row in sink.sheets['Сводная таблица']] == [150.0, 150.0, 150.0]
+    assert sink.sheets['По периодам'] == [{'Период': 'Январь 2024', 'Квитанций': 3, 'Жилищные услуги': 300.0,
+                                          'Коммунальные услуги': 150.0, 'Страхование': 0.0, 'Итого': 450.0}]
+
+
+def test_statistics_match_in_memory_analyzer(make_bill):
+    pd = pytest.importorskip('pandas')
+    from epd_analytics import statistics_frame
+    from epd_parser import EPDAnalyzer
+
+    bills = [make_bill(period='Январь 2024', housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 100.0),)),
+             make_bill(period='Февраль 2024', housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 130.0),)),
+             make_bill(account='5000000002', period='Январь 2024', utility=(('ХВС', 70.0),))]
+    sink = ListSink()
+    streaming = StreamingAnalyzer(sink)
+    analyzer = EPDAnalyzer()
+    for bill in bills:
+        streaming.add_epd(bill)
+        analyzer.add_epd(bill)
+    streaming.add_epd(None)
+    streaming.close()
+
+    assert sink.closed
+    expected = statistics_frame(analyzer.create_summary_dataframe())
+    assert pd.DataFrame(sink.sheets['Статистика']).equals(expected)
+    # Периоды по календарю, а не по алфавиту
+    assert [(row['Период'], row['Квитанций'], row['Итого']) for row in sink.sheets['По периодам']] == [
+        ('Январь 2024', 2, 320.0), ('Февраль 2024', 1, 180.0)]
+    assert len(sink.sheets['Жилищные услуги']) == len(sink.sheets['Коммунальные услуги']) == 3
+
+
+def test_csv_sink_writes_file_per_sheet(make_bill, tmp_path):
+    from epd_streaming import CsvStreamSink
+
+    analyzer = StreamingAnalyzer(CsvStreamSink(tmp_path / 'выгрузка'))
+    analyzer.add_epd(make_bill())
+    analyzer.close()
+
+    names = sorted(path.name for path in (tmp_path / 'выгрузка').iterdir())
+    assert names == ['Жилищные услуги.csv', 'Коммунальные услуги.csv', 'По периодам.csv',
+                     'Сводная таблица.csv', 'Статистика.csv']
+    lines = (tmp_path / 'выгрузка' / 'Сводная таблица.csv').read_text(encoding='utf-8-sig').splitlines()
+    assert lines == ['Период;Лицевой счет;ФИО;Жилищные услуги;Коммунальные услуги;Добровольное страхование;ИТОГО',
+                     'Январь 2024;5000000001;ИВАНОВ ИВАН;100.0;50.0;;150.0']
+
+
+def test_excel_sink_writes_sheets_in_order(make_bill, tmp_path):
+    from openpyxl import load_workbook
+    from epd_streaming import ExcelStreamSink
+
+    output = tmp_path / 'анализ.xlsx'
+    analyzer = StreamingAnalyzer(ExcelStreamSink(output))
+    analyzer.add_epd(make_bill())
+    analyzer.close()
+
+    workbook = load_workbook(output, read_only=True)
+    assert workbook.sheetnames == ['Сводная таблица', 'Жилищные услуги', 'Коммунальные услуги',
+                                   'Статистика', 'По периодам']
+    rows = list(workbook['Сводная таблица'].iter_rows(values_only=True))
+    assert rows[1] == ('Январь 2024', '5000000001', 'ИВАНОВ ИВАН', 100, 50, None, 150)
+    workbook.close()
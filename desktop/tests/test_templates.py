@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Распознавание шаблона ЕПД и разбор парсером шаблона (epd_templates)"""
+
+import pytest
+
+from epd_parser import EPDParser
+from epd_templates import LayoutTemplate, MosOblEPDParser, TemplateDispatcher, text_fingerprint
+
+TOTAL_NO_INSURANCE_LINE = '3 789 руб. 00 коп. ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ СЧЕТА БЕЗ УЧЕТА СТРАХОВАНИЯ'
+TOTAL_LINE = '3 870 руб. 45 коп. ИТОГО К ОПЛАТЕ ЗА ВСЕ УСЛУГИ СЧЕТА С УЧЕТОМ СТРАХОВАНИЯ'
+
+
+def bill_text(*total_lines):
+    return '\n'.join([
+        'ЕДИНЫЙ ПЛАТЕЖНЫЙ ДОКУМЕНТ ЗА Январь 2024',
+        'Лицевой счет: 5000000001',
+        'ФИО: ИВАНОВ ИВАН ИВАНОВИЧ',
+        'Адрес: г. Москва, ул. Ленина, д. 1, кв. 5',
+        *total_lines,
+        'Виды услуг Объем услуг Ед.изм. Тариф Начислено по тарифу Итого',
+        'Начисления за жилищные услуги',
+        'СОДЕРЖАНИЕ ЖИЛОГО ПОМЕЩЕНИЯ 54,30 кв.м. 32,15 1745,74 1745,74',
+        'Начисления за коммунальные услуги',
+        'ЭЛЕКТРОЭНЕРГИЯ 150,00 кВтч 6,17 925,50 925,50',
+        'Всего за январь 2024: 2671,24',
+    ])
+
+
+@pytest.mark.parametrize('total_lines', [
+    (TOTAL_NO_INSURANCE_LINE, TOTAL_LINE),
+    (TOTAL_LINE, TOTAL_NO_INSURANCE_LINE),
+])
+def test_mosobl_totals_do_not_depend_on_line_order(total_lines):
+    data = MosOblEPDParser().parse_text(bill_text(*total_lines))
+    assert data['итого_к_оплате'] == 3870.45
+    assert data['итого_к_оплате_без_страхования'] == 3789.0
+
+
+def test_mosobl_without_total_with_insurance():
+    data = MosOblEPDParser().parse_text(bill_text(TOTAL_NO_INSURANCE_LINE))
+    assert data['итого_к_оплате'] is None
+    assert data['итого_к_оплате_без_страхования'] == 3789.0
+
+
+def test_mosobl_services():
+    data = MosOblEPDParser().parse_text(bill_text(TOTAL_LINE))
+    assert data['лицевой_счет'] == '5000000001'
+    assert data['фио'] == 'ИВАНОВ ИВАН ИВАНОВИЧ'
+    # Единица измерения с заглавной буквой - общий парсер эту строку не находит
+    assert [service['ед_изм'] for service in data['коммунальные_услуги']] == ['кВтч']
+
+
+def test_classify():
+    dispatcher = TemplateDispatcher()
+    template = dispatcher.classify(text_fingerprint(bill_text(TOTAL_LINE)))
+    assert template.name == 'Московская область'
+    assert isinstance(dispatcher.parser_for(template), MosOblEPDParser)
+
+    unknown = dispatcher.classify(text_fingerprint('Квитанция за январь'))
+    assert unknown is None
+    assert type(dispatcher.parser_for(unknown)) is EPDParser
+
+
+def test_fallback_class_and_registration():
+    class OtherParser(EPDParser):
+        pass
+
+    dispatcher = TemplateDispatcher(templates=[], fallback_class=OtherParser)
+    assert type(dispatcher.parser_for(dispatcher.classify(text_fingerprint(bill_text())))) is OtherParser
+
+    dispatcher.register(LayoutTemplate('Другой', EPDParser, markers=('Квитанция',)))
+    assert dispatcher.classify(text_fingerprint('Квитанция за январь')).name == 'Другой'
+    # Размер страницы и шрифты проверяются, только если заданы в шаблоне
+    dispatcher.register(LayoutTemplate('A4', EPDParser, markers=('Квитанция',), page_size=(595, 842)))
+    assert dispatcher.classify(text_fingerprint('Квитанция за январь')).name == 'Другой'
+
+
+def test_parse_pdf_with_template(make_pdf):
+    path = make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'))
+    data = TemplateDispatcher().parse_pdf(str(path))
+    assert data['итого_к_оплате'] == 3820.34
+    assert data['итого_к_оплате_без_страхования'] == 3738.89
+    assert data['суммы_по_категориям']['ИТОГО'] == pytest.approx(3820.34)
+
+    header = TemplateDispatcher().parse_header_pdf(str(path))
+    assert header['итого_к_оплате'] == 3820.34
+    assert header['лицевой_счет'] == '5000000001'
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Дополнение готового файла анализа новыми квитанциями (epd_update, --update)"""
+
+import sys
+
+import pytest
+
+pytest.importorskip('pandas')
+pytest.importorskip('openpyxl')
+
+from openpyxl import load_workbook
+
+import epd_parser
+from epd_parser import EPDAnalyzer
+from epd_update import bill_key, existing_keys, update_workbook
+
+
+@pytest.fixture
+def workbook(make_bill, tmp_path):
+    analyzer = EPDAnalyzer()
+    analyzer.add_epd(make_bill())
+    analyzer.add_epd(make_bill(account='5000000002'))
+    path = tmp_path / 'EPD_Анализ.xlsx'
+    analyzer.save_to_excel(str(path))
+    return path
+
+
+def sheet_rows(path, sheet_name):
+    book = load_workbook(path, read_only=True)
+    try:
+        return list(book[sheet_name].iter_rows(values_only=True))
+    finally:
+        book.close()
+
+
+def test_existing_keys(workbook, tmp_path):
+    assert existing_keys(workbook) == {('Январь 2024', '5000000001'), ('Январь 2024', '5000000002')}
+    assert bill_key(None, 5000000001) == ('Н/Д', '5000000001')
+
+
+def test_update_appends_only_new_bills(workbook, make_bill):
+    analyzer = EPDAnalyzer()
+    analyzer.add_epd(make_bill(housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 999.0),)))
+    analyzer.add_epd(make_bill(period='Февраль 2024', housing=(('СОДЕРЖАНИЕ ЖИЛЬЯ', 120.0),)))
+    assert update_workbook(workbook, analyzer) == 1
+    assert update_workbook(workbook, analyzer) == 0
+
+    summary = sheet_rows(workbook, 'Сводная таблица')
+    assert [row[:2] for row in summary[1:]] == [
+        ('Январь 2024', '5000000001'), ('Январь 2024', '5000000002'), ('Февраль 2024', '5000000001')]
+    # Статистика пересчитана с новой строкой, на тех же местах
+    stats = {row[0]: row[1:] for row in sheet_rows(workbook, 'Статистика')[1:]}
+    assert stats['Жилищные услуги'] == pytest.approx((320.0, 320.0 / 3, 100.0, 120.0))
+    assert len(sheet_rows(workbook, 'Жилищные услуги')) == 4
+
+
+def test_update_filters_each_bill_of_a_bundle(make_pdf, tmp_path, monkeypatch, capsys):
+    folder = tmp_path / 'ЕПД'
+    folder.mkdir()
+    make_pdf('ЕПД_1.pdf', ('5000000001', 'Январь 2024'), folder=folder)
+    monkeypatch.setattr(sys, 'argv', ['epd_parser.py', str(folder), '--workers', '1'])
+    epd_parser.main()
+    workbook = next(folder.glob('EPD_Анализ_*.xlsx'))
+
+    # Первая квитанция пачки уже в книге, вторая - новая: пачка не пропускается по первой шапке
+    make_pdf('ЕПД_2.pdf', ('5000000001', 'Январь 2024'), ('5000000002', 'Январь 2024'), folder=folder)
+    monkeypatch.setattr(sys, 'argv', ['epd_parser.py', str(folder), '--workers', '1', '--update', str(workbook)])
+    capsys.readouterr()
+    epd_parser.main()
+    output = capsys.readouterr().out
+    assert 'добавлено квитанций: 1' in output
+    assert 'Уже есть в книге: ЕПД_2.pdf, счет 5000000001' in output
+
+    assert [row[:2] for row in sheet_rows(workbook, 'Сводная таблица')[1:]] == [
+        ('Январь 2024', '5000000001'), ('Январь 2024', '5000000002')]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""Разбор под надзором: лимит времени, сбой исполнителя, порядок результатов (epd_watchdog)"""
+
+import csv
+import os
+import time
+
+import pytest
+
+from epd_bundle import ParseError
+from epd_parser import EPDParser
+from epd_watchdog import SupervisedParser
+
+SLOW_ACCOUNT = '5000000009'
+CRASH_ACCOUNT = '5000000008'
+
+
+class TroubleParser(EPDParser):
+    """Зависает на одном лицевом счете и роняет процесс на другом"""
+
+    def parse_text(self, text, *args, **kwargs):
+        if SLOW_ACCOUNT in text:
+            time.sleep(60)
+        if CRASH_ACCOUNT in text:
+            os._exit(3)
+        return super().parse_text(text, *args, **kwargs)
+
+
+@pytest.fixture
+def files(make_pdf):
+    return [str(make_pdf('ЕПД_1.pdf', (SLOW_ACCOUNT, 'Январь 2024'))),
+            str(make_pdf('ЕПД_2.pdf', ('5000000001', 'Январь 2024'))),
+            str(make_pdf('ЕПД_3.pdf', (CRASH_ACCOUNT, 'Январь 2024'))),
+            str(make_pdf('ЕПД_4.pdf', ('5000000002', 'Январь 2024')))]
+
+
+def test_hung_and_crashed_files_are_quarantined_in_order(files, tmp_path):
+    parser = SupervisedParser(workers=2, time_limit=1.0, parser_class=TroubleParser, templates=[])
+    results = list(parser.iter_parse(files, ordered=True))
+
+    assert [path for path, _, _ in results] == files
+    hung, crashed = results[0][1], results[2][1]
+    assert isinstance(hung, ParseError) and hung.quarantined and hung.reason == 'превышено время'
+    assert isinstance(crashed, ParseError) and crashed.quarantined and crashed.reason == 'сбой процесса'
+    assert [bills[0]['лицевой_счет'] for _, bills, _ in (results[1], results[3])] == ['5000000001', '5000000002']
+
+    report = tmp_path / 'карантин.csv'
+    assert parser.write_quarantine_report(report) == 2
+    with open(report, encoding='utf-8-sig', newline='') as file:
+        rows = list(csv.reader(file, delimiter=';'))
+    assert [row[:2] for row in rows[1:]] == [[files[2], 'сбой процесса'], [files[0], 'превышено время']]
+
+
+def test_results_in_completion_order(files):
+    parser = SupervisedParser(workers=2, time_limit=1.0, parser_class=TroubleParser, templates=[])
+    paths = [path for path, _, _ in parser.iter_parse(files[:2] + files[3:], ordered=False)]
+    # Зависший первый файл не задерживает выдачу остальных
+    assert paths == [files[1], files[3], files[0]]
+
+
+def test_worker_parses_like_this_process(files):
+    from epd_bundle import BundleParser
+
+    parser = SupervisedParser(workers=1, time_limit=30.0)
+    [(path, bills, timings)] = parser.iter_parse(files[1:2])
+    with BundleParser(workers=1) as local:
+        assert bills == local.parse_pdf(files[1])
+    assert set(timings) == {'wait', 'parse'}